@@ -16,7 +16,7 @@ from inspect import cleandoc
 from pathlib import Path
 from typing import Annotated, Literal, TypeAlias, Union  # noqa
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 try:
     from enum import StrEnum
@@ -70,6 +70,72 @@ class CondaInitialization(StrEnum):
     CONDABIN = "condabin"
 
 
+class PayloadCodecs(StrEnum):
+    NONE = "none"
+    BZ2 = "bz2"
+    GZIP = "gzip"
+    XZ = "xz"
+    ZSTD = "zstd"
+
+
+#: Compression levels accepted by each codec, as (min, max)
+PAYLOAD_CODEC_LEVELS = {
+    PayloadCodecs.BZ2: (1, 9),
+    PayloadCodecs.GZIP: (0, 9),
+    PayloadCodecs.XZ: (0, 9),
+    PayloadCodecs.ZSTD: (1, 22),
+}
+
+
+def _payload_level_schema(schema: dict) -> None:
+    "Check `level` against the range of the selected codec in the JSON schema too."
+    conditions = []
+    for codec in PayloadCodecs:
+        # bz2 is the default codec, so it also applies when `codec` is not set
+        condition = {"properties": {"codec": {"const": codec.value}}}
+        if codec != PayloadCodecs.BZ2:
+            condition["required"] = ["codec"]
+        if codec in PAYLOAD_CODEC_LEVELS:
+            low, high = PAYLOAD_CODEC_LEVELS[codec]
+            level = {"anyOf": [{"minimum": low, "maximum": high}, {"type": "null"}]}
+        else:
+            level = {"type": "null"}
+        conditions.append({"if": condition, "then": {"properties": {"level": level}}})
+    schema["allOf"] = conditions
+
+
+class PayloadCompression(BaseModel):
+    model_config: ConfigDict = ConfigDict(
+        **_base_config_dict, json_schema_extra=_payload_level_schema
+    )
+
+    codec: PayloadCodecs = PayloadCodecs.BZ2
+    "Compression codec."
+    level: int | None = None
+    """
+    Compression level. If not set, the default level of the codec is used. `bz2`
+    accepts 1 to 9, `gzip` and `xz` 0 to 9, and `zstd` 1 to 22. `none` takes no level.
+    """
+    threads: Annotated[int, Field(ge=0)] | None = None
+    """
+    Number of threads used to compress, only for `xz` and `zstd`. `0` uses all the
+    CPU cores. If not set, a single thread is used.
+    """
+
+    @model_validator(mode="after")
+    def _check_level(self):
+        if self.level is None:
+            return self
+        if self.codec not in PAYLOAD_CODEC_LEVELS:
+            raise ValueError(f"payload codec '{self.codec}' does not take a level")
+        low, high = PAYLOAD_CODEC_LEVELS[self.codec]
+        if not low <= self.level <= high:
+            raise ValueError(
+                f"level for payload codec '{self.codec}' must be between {low} and {high}"
+            )
+        return self
+
+
 class ChannelRemap(BaseModel):
     model_config: ConfigDict = _base_config_dict
 
@@ -115,6 +181,11 @@ class ExtraEnv(BaseModel):
     """
     freeze_env: dict[Literal["conda"], dict] | None = None
     "Same as `freeze_base`, but for this conda environment."
+    solver: NonEmptyStr | None = None
+    """
+    Same as the global option, but for this env; if not provided, the global
+    value is used.
+    """
 
 
 class BuildOutputs(StrEnum):
@@ -268,10 +339,15 @@ class ConstructorConfiguration(BaseModel):
     """
     A mapping of channels to their mirror URLs. Each channel maps to a list of
     mirror URLs that will be used as fallbacks. The mirrored channels will be
-    included in the `.condarc` file of the installer.
+    included in the `.condarc` file of the installer, which requires `mamba` to be
+    listed in the `base` environment, and `write_condarc` to be `True`.
 
-    Requires `mamba` to be listed in the `base` environment, and `write_condarc`
-    to be `True`.
+    The mirrors are also used at build time for the channels listed in `channels`
+    (or in the `channels` of `extra_envs`): the channel and its mirrors are raced
+    against each other, the fastest one is used to solve and download, and the others
+    are tried in turn if a metadata or package download fails. The mirror that served
+    each package is reported in the build log, and the installer refers to the
+    original channel URLs regardless.
 
     Example use:
 
@@ -340,6 +416,19 @@ class ConstructorConfiguration(BaseModel):
     Note: This option is not fully implemented when `micromamba` is used as
     the `--conda-exe` binary. The only accepted value is an empty list (`[]`).
     """
+    solver: NonEmptyStr | None = None
+    """
+    The conda solver backend used to solve the `specs`, e.g. `classic` or
+    `libmamba`. Any solver plugin installed alongside `constructor` can be used.
+    If not provided, the solver configured in `conda` (e.g. via `CONDA_SOLVER`)
+    is used. Can be overridden with the `--solver` command line option. The time
+    spent by each solve is reported in the build log.
+    """
+    solver_fallback: NonEmptyStr | None = None
+    """
+    A solver backend to retry with if the solve with `solver` fails for any
+    environment. If not provided, solver errors are not retried.
+    """
     ignore_duplicate_files: bool = True
     """
     By default, constructor will warn you when adding packages with duplicate
@@ -376,6 +465,47 @@ class ConstructorConfiguration(BaseModel):
     File type extension for the files to be transmuted into.
     If left empty, no transmuting is done.
     """
+    compact_metadata: bool = False
+    """
+    Write the repodata cache and the `repodata_record.json` files shipped in the
+    installer as compact JSON (no indentation or extra whitespace). This makes the
+    installer payload smaller and faster to parse at install time, which is noticeable
+    with thousands of packages. If `orjson` is installed, it is used to serialize them.
+    """
+    payload_compression: PayloadCodecs | PayloadCompression = PayloadCodecs.BZ2
+    """
+    Compression of the archives that carry the installer metadata and the
+    `extra_files` in SH installers. Use one of `none`, `bz2`, `gzip`, `xz` or `zstd`,
+    or a mapping with the keys `codec`, `level` and `threads`. `level` ranges from 1 to 9
+    for `bz2`, 0 to 9 for `gzip` and `xz`, and 1 to 22 for `zstd`. The installer reads
+    `bz2`, `gzip` and `xz` archives with its conda executable; `zstd` archives need
+    micromamba or the `zstd` tool on the target system. Multi-threaded `xz` and `zstd`
+    compression requires the `xz` and `zstd` tools (or the `zstandard` Python package)
+    at build time.
+    """
+    payload_segments: Annotated[int, Field(ge=1)] = 1
+    """
+    Number of tarballs the packages are split into in SH installers, balanced by size.
+    The installer extracts them in parallel, as many at a time as there are CPUs
+    (or as set with its `-j` option).
+    """
+    bootstrapper_compression: Literal["gzip", "xz"] | None = None
+    """
+    Compress the conda executable shipped in SH installers (and the files next to it,
+    for onedir builds of conda-standalone). The installer decompresses them with the
+    `gzip` or `xz` tool of the target system. If compression does not make them
+    smaller, they are stored uncompressed.
+    """
+    payload_layout: Literal["seekable", "streaming"] = "seekable"
+    """
+    How the payloads of SH installers are laid out. With `seekable`, the installer reads
+    each payload at its offset in the file. With `streaming`, all of them are stored in a
+    single uncompressed tarball, in the order they are extracted, so that the installer
+    can also be run from standard input while it is downloaded, in batch mode and with
+    `bash`: `curl -fsSL https://example.com/installer.sh | bash -s -- -b -p ~/app`.
+    The tarball is extracted with the `tar` tool of the target system, and
+    `payload_segments` does not apply.
+    """
     conda_default_channels: list[NonEmptyStr] = []
     """
     If this value is provided as well as `write_condarc`, then the channels
@@ -3,6 +3,7 @@ Logic to build installers using Briefcase.
 """
 
 import functools
+import gzip
 import logging
 import re
 import shutil
@@ -25,15 +26,18 @@ else:
 
 from . import preconda
 from ._schema import InstallerTypes
+from .context import BuildContext
 from .jinja import render_template
 from .signing import create_windows_signing_tool
 from .utils import (
     DEFAULT_REVERSE_DOMAIN_ID,
+    atomic_output,
     bat_echo_esc,
     bat_env_var_esc,
     copy_conda_exe,
     filename_dist,
     get_final_channels,
+    reproducible_tar_filter,
     shortcuts_flags,
 )
 
@@ -207,6 +211,7 @@ def _setup_envs_commands(info: dict) -> list[dict]:
     Returns a list of dicts, each containing the data needed to install
     one environment. Used by the run_installation.bat template.
     """
+    context = BuildContext.from_info(info)
     environments = []
 
     # Base environment
@@ -215,8 +220,8 @@ def _setup_envs_commands(info: dict) -> list[dict]:
             "name": "base",
             "prefix": "%BASE_PATH%",
             "lockfile": r"%BASE_PATH%\conda-meta\initial-state.explicit.txt",
-            "channels": ",".join(get_final_channels(info)),
-            "shortcuts": shortcuts_flags(info),
+            "channels": ",".join(context.final_channels),
+            "shortcuts": context.shortcuts_flags,
         }
     )
 
@@ -482,8 +487,18 @@ class Payload:
         archive_path = dst / self.archive_name
 
         archive_type = archive_path.suffix[1:]  # since suffix starts with '.'
-        with tarfile.open(archive_path, mode=f"w:{archive_type}", compresslevel=1) as tar:
-            tar.add(src, arcname=src.name)
+        epoch = self.info.get("_source_date_epoch")
+        tar_filter = reproducible_tar_filter(epoch)
+        if epoch is not None and archive_type == "gz":
+            # The gzip header stores a timestamp too
+            with (
+                gzip.GzipFile(archive_path, mode="wb", compresslevel=1, mtime=epoch) as gz,
+                tarfile.open(fileobj=gz, mode="w") as tar,
+            ):
+                tar.add(src, arcname=src.name, filter=tar_filter)
+        else:
+            with tarfile.open(archive_path, mode=f"w:{archive_type}", compresslevel=1) as tar:
+                tar.add(src, arcname=src.name, filter=tar_filter)
 
         shutil.rmtree(src)
         return archive_path
@@ -516,7 +531,7 @@ class Payload:
             # an empty string (all shortcuts), or --no-shortcuts (none).
             # In the .bat template this is used in the "shortcuts enabled" branch,
             # so passing an empty string here is correct when all shortcuts are wanted.
-            "shortcuts": shortcuts_flags(self.info),
+            "shortcuts": BuildContext.from_info(self.info).shortcuts_flags,
             # --- setup_envs ---
             "setup_envs": _setup_envs_commands(self.info),
             # --- virtual_specs ---
@@ -601,11 +616,7 @@ class Payload:
 
     def _stage_dists(self, pkgs_dir: Path) -> None:
         download_dir = Path(self.info["_download_dir"])
-        # Collect dists from base and extra_envs, de-duplicated
-        dists = set(self.info["_dists"])
-        for env_info in self.info.get("_extra_envs_info", {}).values():
-            dists.update(env_info.get("_dists", []))
-        for dist in sorted(dists):
+        for dist in sorted(BuildContext.from_info(self.info).all_dists):
             shutil.copy(download_dir / filename_dist(dist), pkgs_dir)
 
     def _stage_user_scripts(self, pkgs_dir: Path) -> None:
@@ -669,9 +680,8 @@ def create(info, verbose=False):
             signing_tool.sign(msi_paths[0])
             signing_tool.verify_signature(msi_paths[0])
 
-        outpath = Path(info["_outpath"])
-        outpath.unlink(missing_ok=True)
-        shutil.move(msi_paths[0], outpath)
+        with atomic_output(info["_outpath"]) as outpath:
+            shutil.move(msi_paths[0], outpath)
     finally:
         if not info.get("_debug"):
             payload.remove()
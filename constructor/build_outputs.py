@@ -9,14 +9,17 @@ import json
 import logging
 import os
 from collections import defaultdict
+from contextlib import nullcontext
 from pathlib import Path
 
 from conda.base.constants import UNKNOWN_CHANNEL
 from conda.common.url import remove_auth, split_anaconda_token
-from conda.core.prefix_data import PrefixGraph
 
 from . import __version__
 from .conda_interface import VersionOrder
+from .mirrors import canonical_url
+from .package_index import PackageIndex, package_license_files
+from .toposort import toposort_records
 
 logger = logging.getLogger(__name__)
 
@@ -123,11 +126,13 @@ def dump_lockfile(info, env="base"):
         f"# created-by: constructor {__version__}",
         "@EXPLICIT",
     ]
-    for record in PrefixGraph(records).graph:
+    for record in toposort_records(records):
         url = record.get("url")
         if not url or url.startswith(UNKNOWN_CHANNEL):
             print("# no URL for: {}".format(record["fn"]))
             continue
+        # Whichever mirror served the package, record the channel it stands in for
+        url = canonical_url(url, info.get("_mirrors"))
         url = remove_auth(split_anaconda_token(url)[0])
         hash_value = record.get("md5")
         lines.append(url + (f"#{hash_value}" if hash_value else ""))
@@ -166,17 +171,20 @@ def dump_licenses(info, include_text=False, text_errors=None):
             valid. See https://docs.python.org/3/library/functions.html#open.
     """
     licenses = defaultdict(dict)
-    for pkg_record in info["_all_pkg_records"]:
-        extracted_package_dir = pkg_record.extracted_package_dir
-        licenses_dir = os.path.join(extracted_package_dir, "info", "licenses")
-        licenses[pkg_record.dist_str()]["type"] = pkg_record.license
-        licenses[pkg_record.dist_str()]["files"] = license_files = []
-        if not os.path.isdir(licenses_dir):
-            continue
-
-        for directory, _, files in os.walk(licenses_dir):
-            for filepath in files:
-                license_path = os.path.join(directory, filepath)
+    index_path = info.get("_package_index_path")
+    with PackageIndex(index_path) if index_path else nullcontext() as index:
+        for pkg_record in info["_all_pkg_records"]:
+            extracted_package_dir = pkg_record.extracted_package_dir
+            licenses[pkg_record.dist_str()]["type"] = pkg_record.license
+            licenses[pkg_record.dist_str()]["files"] = license_files = []
+            if index is not None:
+                license_paths = index.license_files(extracted_package_dir, pkg_record.fn)
+            else:
+                license_paths = [
+                    os.path.join(extracted_package_dir, path)
+                    for path in package_license_files(extracted_package_dir)
+                ]
+            for license_path in license_paths:
                 license_file = {"path": license_path, "text": None}
                 if include_text:
                     license_file["text"] = Path(license_path).read_text(errors=text_errors)
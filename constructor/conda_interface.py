@@ -8,13 +8,14 @@ import datetime
 import json
 import os
 import sys
+import threading
 from copy import deepcopy
 from itertools import chain
 from os.path import join
 
 from conda.gateways.disk import mkdir_p_sudo_safe
 
-from constructor.utils import hash_files
+from constructor.utils import artifact_digests, dumps_json
 
 NAV_APPS = [
     "glueviz",
@@ -58,16 +59,20 @@ if conda_interface_type == "conda":
     from conda.base.context import locate_prefix_by_name as _locate_prefix_by_name
     from conda.base.context import replace_context_default as _conda_replace_context_default
     from conda.common.io import env_vars as _env_vars
+    from conda.exceptions import CyclicalDependencyError as _CyclicalDependencyError
     from conda.core.package_cache_data import PackageCacheData as _PackageCacheData
     from conda.core.package_cache_data import ProgressiveFetchExtract as _ProgressiveFetchExtract
     from conda.core.prefix_data import PrefixData as _PrefixData
     from conda.exports import MatchSpec as _MatchSpec
     from conda.exports import default_prefix as _default_prefix
     from conda.exports import download as _download
+    from conda.gateways.connection.session import CondaSession as _CondaSession
     from conda.gateways.disk.read import read_paths_json as _read_paths_json
+    from conda.models.channel import Channel as _Channel
     from conda.models.channel import all_channel_urls as _all_channel_urls
     from conda.models.dist import Dist as _Dist
-    from conda.models.prefix_graph import PrefixGraph as _PrefixGraph
+    from conda.models.enums import NoarchType as _NoarchType
+    from conda.models.records import PackageRecord as _PackageRecord
     from conda.models.version import VersionOrder
 
     try:
@@ -83,7 +88,6 @@ if conda_interface_type == "conda":
 
     # used by fcp.py
     PackageCacheData = _PackageCacheData
-    PrefixGraph = _PrefixGraph
     ProgressiveFetchExtract = _ProgressiveFetchExtract
     Solver, read_paths_json = _Solver, _read_paths_json
     all_channel_urls = _all_channel_urls
@@ -92,6 +96,27 @@ if conda_interface_type == "conda":
     download, PackageCacheRecord = _download, _PackageCacheRecord
     locate_prefix_by_name = _locate_prefix_by_name
 
+    def get_solver_backend(name=None):
+        """Return the solver class registered as ``name``, or the configured default."""
+        if name is None:
+            return Solver
+        try:
+            get_backend = conda_context.plugin_manager.get_solver_backend
+        except AttributeError:
+            # conda without solver plugins only ships the classic solver
+            if name == "classic":
+                from conda.core.solve import Solver as _ClassicSolver
+
+                return _ClassicSolver
+            raise ValueError(f"Solver backend '{name}' requires a newer conda")
+        return get_backend(name)
+
+    # used by toposort.py
+    CyclicalDependencyError, NoarchType = _CyclicalDependencyError, _NoarchType
+
+    # used by mirrors.py
+    Channel, CondaSession, PackageRecord = _Channel, _CondaSession, _PackageRecord
+
     # used by preconda.py
     Dist, MatchSpec, PrefixData, default_prefix = _Dist, _MatchSpec, _PrefixData, _default_prefix
 
@@ -106,12 +131,107 @@ if conda_interface_type == "conda":
         except ImportError:
             pass
 
-    def get_repodata(url):
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    def _pkg_name(fn):
+        return fn.rsplit("-", 2)[0]
+
+    def repodata_keep_filenames(filenames):
+        """
+        Return the set of filenames worth keeping from a repodata index: ``filenames``
+        and their counterparts in the other package format (needed to fix up the
+        metadata of transmuted packages).
+        """
+        keep = set()
+        for fn in filenames:
+            keep.add(fn)
+            if fn.endswith(".conda"):
+                keep.add(fn[: -len(".conda")] + ".tar.bz2")
+            elif fn.endswith(".tar.bz2"):
+                keep.add(fn[: -len(".tar.bz2")] + ".conda")
+        return keep
+
+    def _keep_package(key, fn, keep):
+        return fn in keep or (key == "packages" and _pkg_name(fn) in NAV_APPS)
+
+    def trim_repodata(full_repodata, keep):
+        """Drop all the package entries that `write_repodata` would not use."""
+        trimmed = {
+            k: v
+            for k, v in full_repodata.items()
+            if k not in ("packages", "packages.conda", "removed")
+        }
+        for key in ("packages", "packages.conda"):
+            trimmed[key] = {
+                fn: record
+                for fn, record in full_repodata.get(key, {}).items()
+                if _keep_package(key, fn, keep)
+            }
+        trimmed["removed"] = []
+        return trimmed
+
+    def _read_json_value(events, event, value, build=True):
+        """Consume the events of one JSON value from an ``ijson.parse`` stream."""
+        builder = ijson.ObjectBuilder() if build else None
+        depth = 0
+        while True:
+            if builder is not None:
+                builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            if depth == 0:
+                return builder.value if builder is not None else None
+            _, event, value = next(events)
+
+    def _stream_trimmed_repodata(path, keep):
+        """
+        Parse the repodata at ``path`` incrementally, only materializing the entries
+        in ``keep``, so memory is bounded by the trimmed output, not the full index.
+        """
+        repodata = {"packages": {}, "packages.conda": {}, "removed": []}
+        with open(path, "rb") as f:
+            events = ijson.parse(f, use_float=True)
+            next(events)  # start_map
+            for _, event, key in events:
+                if event == "end_map":
+                    break
+                _, event, value = next(events)
+                if key in ("packages", "packages.conda") and event == "start_map":
+                    for _, event, fn in events:
+                        if event == "end_map":
+                            break
+                        _, event, value = next(events)
+                        wanted = _keep_package(key, fn, keep)
+                        record = _read_json_value(events, event, value, build=wanted)
+                        if wanted:
+                            repodata[key][fn] = record
+                else:
+                    wanted = key != "removed"
+                    value = _read_json_value(events, event, value, build=wanted)
+                    if wanted:
+                        repodata[key] = value
+        return repodata
+
+    def get_repodata(url, keep=None):
+        """
+        Fetch the repodata index at ``url``. If ``keep`` (see `repodata_keep_filenames`)
+        is given, only the package entries `write_repodata` needs are returned.
+        """
         if CONDA_MAJOR_MINOR >= (23, 5):
             from conda.core.subdir_data import SubdirData as _SubdirData
             from conda.models.channel import Channel
 
             subdir_data = _SubdirData(Channel(url))
+            fetch_latest_path = getattr(subdir_data.repo_fetch, "fetch_latest_path", None)
+            if keep is not None and ijson is not None and fetch_latest_path is not None:
+                path, _ = fetch_latest_path()
+                if path.exists() and path.stat().st_size > 2:
+                    return _stream_trimmed_repodata(path, keep)
             raw_repodata_str, _ = subdir_data.repo_fetch.fetch_latest()
         else:
             # Backwards compatibility: for conda 4.6+
@@ -119,6 +239,9 @@ if conda_interface_type == "conda":
 
             raw_repodata_str = fetch_repodata_remote_request(url, None, None)
 
+        return _parse_repodata(url, raw_repodata_str, keep)
+
+    def _parse_repodata(url, raw_repodata_str, keep=None):
         # noarch-only repos are valid. if the native subdir is not present,
         # we might get an empty repodata back. In that case, we need to add the minimal
         # info to make it valid for the rest of constructor.
@@ -136,8 +259,104 @@ if conda_interface_type == "conda":
         else:
             full_repodata = json.loads(raw_repodata_str)
 
+        if keep is not None:
+            full_repodata = trim_repodata(full_repodata, keep)
         return full_repodata
 
+    def _repodata_cache_path(url):
+        "Path of conda's on-disk cache for the repodata at ``url``, if known."
+        if CONDA_MAJOR_MINOR < (23, 5):
+            return None
+        from conda.core.subdir_data import SubdirData as _SubdirData
+
+        return _SubdirData(_Channel(url)).repo_fetch.cache_path_json
+
+    def _repodata_cache_stamp(url):
+        """
+        Modification time and size of conda's on-disk cache for the repodata at ``url``
+        and of its state file, which records the etag and when it was last revalidated.
+        """
+        if CONDA_MAJOR_MINOR < (23, 5):
+            return None
+        from conda.core.subdir_data import SubdirData as _SubdirData
+
+        repo_fetch = _SubdirData(_Channel(url)).repo_fetch
+        stamp = []
+        for path in (repo_fetch.cache_path_json, repo_fetch.cache_path_state):
+            try:
+                st = path.stat()
+            except OSError:
+                stamp.append(None)
+            else:
+                stamp.append((st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    class RepodataSession:
+        """
+        Repodata shared by all the consumers of a single build.
+
+        The solver fetches (and revalidates, if needed) the indexes it uses through
+        conda's cache; those URLs whose cache was written during the solve are recorded
+        with `mark_fresh`, so later readers load the cached copy without revalidating it
+        again. Solvers that do not go through conda's cache (e.g. libmamba) leave it as
+        it was, and those indexes are fetched as usual. The trimmed indexes returned by
+        `get_repodata` are memoized, so they are computed once for all installer types.
+        """
+
+        def __init__(self):
+            self._fresh = {}
+            self._repodatas = {}
+            self._lock = threading.Lock()
+
+        def dump(self):
+            "URLs of the indexes read from conda's cache without revalidation, for ``info.json``."
+            return sorted(self._fresh)
+
+        def cache_stamps(self, urls):
+            "Return the state of conda's cache for ``urls``, to be passed to `mark_fresh`."
+            return {url.rstrip("/"): _repodata_cache_stamp(url) for url in urls}
+
+        def mark_fresh(self, urls, since=None):
+            """
+            Record that the repodata at ``urls`` was fetched during this build. With
+            ``since`` (see `cache_stamps`), only the URLs whose cache changed since then
+            are recorded.
+            """
+            for url in urls:
+                url = url.rstrip("/")
+                if url in self._fresh:
+                    continue
+                if since is not None:
+                    before = since.get(url)
+                    if before is None or before == _repodata_cache_stamp(url):
+                        continue
+                path = _repodata_cache_path(url)
+                if path is not None:
+                    with self._lock:
+                        self._fresh[url] = path
+
+        def _read_fresh(self, url, keep):
+            path = self._fresh.get(url.rstrip("/"))
+            if path is None or not path.exists():
+                return None
+            if keep is not None and ijson is not None and path.stat().st_size > 2:
+                return _stream_trimmed_repodata(path, keep)
+            return _parse_repodata(url, path.read_text(), keep)
+
+        def get_repodata(self, url, keep=None):
+            """Same as the module-level `get_repodata`, at most once per build and URL."""
+            key = (url.rstrip("/"), None if keep is None else frozenset(keep))
+            with self._lock:
+                if key in self._repodatas:
+                    return self._repodatas[key]
+            repodata = self._read_fresh(url, keep)
+            if repodata is None:
+                repodata = get_repodata(url, keep=keep)
+                self.mark_fresh([url])
+            with self._lock:
+                self._repodatas[key] = repodata
+            return repodata
+
     def write_repodata(cache_dir, url, full_repodata, used_packages, info):
         used_repodata = {
             k: full_repodata[k]
@@ -167,9 +386,8 @@ if conda_interface_type == "conda":
             if original_package in full_repodata.get(original_key, {}):
                 data = deepcopy(full_repodata[original_key][original_package])
                 pkg_fn = join(info["_download_dir"], package)
-                data["size"] = os.stat(pkg_fn).st_size
-                data["sha256"] = hash_files([pkg_fn], algorithm="sha256")
-                data["md5"] = hash_files([pkg_fn])
+                # recorded when the package was transmuted
+                data.update(artifact_digests(pkg_fn))
                 used_repodata[key][package] = data
 
         # In conda <23.1, the first line of the JSON should contain cache metadata
@@ -177,7 +395,7 @@ if conda_interface_type == "conda":
         # immediately update it when not being run in offline mode
         repodata_url = used_repodata.pop("_url", url).rstrip("/")
         used_repodata.pop("_mod", None)
-        repodata = json.dumps(used_repodata, indent=2)
+        repodata = dumps_json(used_repodata, compact=info.get("compact_metadata", False))
         mod_time = "Mon, 07 Jan 2019 15:22:15 GMT"
         repodata_header = json.dumps(
             {
@@ -187,7 +405,7 @@ if conda_interface_type == "conda":
         )
         repodata = repodata_header[:-1] + "," + repodata[1:]
         repodata_filepath = join(cache_dir, _cache_fn_url(repodata_url))
-        with open(repodata_filepath, "w") as fh:
+        with open(repodata_filepath, "w", encoding="utf-8") as fh:
             fh.write(repodata)
 
         # set the modification time to mod_time. needed for mamba
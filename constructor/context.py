@@ -0,0 +1,91 @@
+# (c) 2016 Anaconda, Inc. / https://anaconda.com
+# All Rights Reserved
+#
+# constructor is distributed under the terms of the BSD 3-clause license.
+# Consult LICENSE.txt or http://opensource.org/licenses/BSD-3-Clause.
+"""
+Views derived from a solved build, shared by the installer creators.
+
+`fcp.main` attaches a `BuildContext` to `info` once the environments are solved. Each
+view is computed the first time it is needed and then reused by every installer type.
+"""
+
+from __future__ import annotations
+
+from .utils import get_final_channels, parse_virtual_specs, shortcuts_flags
+
+
+class BuildContext:
+    __slots__ = (
+        "info",
+        "_all_dists",
+        "_all_urls",
+        "_final_channels",
+        "_virtual_specs",
+        "_shortcuts_flags",
+    )
+
+    def __init__(self, info: dict):
+        self.info = info
+        self._all_dists: tuple[str, ...] | None = None
+        self._all_urls: tuple[tuple[str, str], ...] | None = None
+        self._final_channels: tuple[str, ...] | None = None
+        self._virtual_specs: dict | None = None
+        self._shortcuts_flags: str | None = None
+
+    @classmethod
+    def from_info(cls, info: dict) -> BuildContext:
+        """
+        Return the context attached to ``info``. A new one is attached if there is none
+        yet, or if ``info`` is a copy of the dictionary the existing one was made for.
+        """
+        context = info.get("_context")
+        if context is None or context.info is not info:
+            context = info["_context"] = cls(info)
+        return context
+
+    def dump(self) -> dict:
+        "The views computed so far, for ``info.json``; ``info`` itself is left out."
+        views = {name[1:]: getattr(self, name) for name in self.__slots__ if name != "info"}
+        return {name: value for name, value in views.items() if value is not None}
+
+    @property
+    def all_dists(self) -> tuple[str, ...]:
+        "Package filenames of the base and extra environments, de-duplicated."
+        if self._all_dists is None:
+            dists = list(self.info["_dists"])
+            for env_info in self.info.get("_extra_envs_info", {}).values():
+                dists += env_info["_dists"]
+            self._all_dists = tuple(dict.fromkeys(dists))
+        return self._all_dists
+
+    @property
+    def all_urls(self) -> tuple[tuple[str, str], ...]:
+        "``(url, md5)`` pairs of the base environment followed by the extra environments."
+        if self._all_urls is None:
+            urls = list(self.info["_urls"])
+            for env_info in self.info.get("_extra_envs_info", {}).values():
+                urls += env_info["_urls"]
+            self._all_urls = tuple(urls)
+        return self._all_urls
+
+    @property
+    def final_channels(self) -> tuple[str, ...]:
+        "Channels of the base environment as shipped in the installer."
+        if self._final_channels is None:
+            self._final_channels = tuple(get_final_channels(self.info))
+        return self._final_channels
+
+    @property
+    def virtual_specs(self) -> dict:
+        "Parsed ``__osx`` and ``__glibc`` constraints; see `utils.parse_virtual_specs`."
+        if self._virtual_specs is None:
+            self._virtual_specs = parse_virtual_specs(self.info)
+        return self._virtual_specs
+
+    @property
+    def shortcuts_flags(self) -> str:
+        "Shortcut flags for the base environment; see `utils.shortcuts_flags`."
+        if self._shortcuts_flags is None:
+            self._shortcuts_flags = shortcuts_flags(self.info)
+        return self._shortcuts_flags
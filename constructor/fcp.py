@@ -9,35 +9,54 @@ fcp (fetch conda packages) module
 
 from __future__ import annotations
 
+import hashlib
 import logging
 import os
 import shutil
 import sys
 import tempfile
+import time
 from collections import defaultdict
+from contextlib import contextmanager, nullcontext
 from itertools import groupby
 from os.path import abspath, basename, expanduser, isdir, join
 from subprocess import check_call
 from typing import TYPE_CHECKING
 
-from constructor.utils import filename_dist
+from constructor.utils import (
+    file_lock,
+    filename_dist,
+    hardlink_or_copy,
+    record_artifact_digests,
+)
 
 from .conda_interface import (
+    Channel,
     PackageCacheData,
+    PackageRecord,
     PrefixData,
-    PrefixGraph,
     ProgressiveFetchExtract,
-    Solver,
-    SubdirData,
+    RepodataSession,
     VersionOrder,
     all_channel_urls,
     cc_platform,
     conda_context,
     conda_replace_context_default,
     env_vars,
+    get_repodata,
+    get_solver_backend,
     locate_prefix_by_name,
-    read_paths_json,
 )
+from .context import BuildContext
+from .mirrors import (
+    apply_mirrors,
+    mirror_of,
+    next_mirror_urls,
+    resolve_mirrors,
+    switch_mirror,
+)
+from .package_index import PackageIndex, package_files
+from .toposort import toposort_records
 
 if TYPE_CHECKING:
     from collections.abc import Iterable
@@ -48,20 +67,6 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-def getsize(filename):
-    """Return the size of a file, reported by os.lstat as opposed to os.stat."""
-    # Symlinks might be reported as "not found" if they are provided by a
-    # package's dependencies
-    # We use lstat to obtain the size of the symlink, as opposed to the
-    # size of the file it points to
-    # From the docstring of the os.lstat function
-    #    > On platforms that do not support symbolic links, this is an
-    #    > alias for stat().
-    # https://github.com/conda/constructor/issues/311
-    # https://docs.python.org/3/library/os.html
-    return os.lstat(filename).st_size
-
-
 def warn_menu_packages_missing(precs, menu_packages):
     if not menu_packages:
         return
@@ -94,24 +99,32 @@ def exclude_packages(precs, exclude=(), error_on_absence=True):
     return [prec for prec in precs if prec.name not in exclude]
 
 
-def _find_out_of_date_precs(precs, channel_urls, platform):
+def _find_out_of_date_precs(precs, channel_urls, repodata_session=None):
+    """
+    Find the most recent version of each of ``precs`` in ``channel_urls`` (with their
+    subdirs), reading the indexes through ``repodata_session`` if given.
+    """
+    fetch_repodata = get_repodata
+    if repodata_session is not None:
+        fetch_repodata = repodata_session.get_repodata
+    names = {prec.name for prec in precs}
+    most_recent = {}
+    for url in channel_urls:
+        repodata = fetch_repodata(url)
+        for key in ("packages", "packages.conda"):
+            for fn, entry in repodata.get(key, {}).items():
+                if entry.get("name") not in names:
+                    continue
+                order = (VersionOrder(entry["version"]), entry.get("build_number", 0))
+                if entry["name"] not in most_recent or order > most_recent[entry["name"]][0]:
+                    most_recent[entry["name"]] = order, f"{url.rstrip('/')}/{fn}"
+
     out_of_date_package_records = {}
     for prec in precs:
-        all_versions = SubdirData.query_all(prec.name, channels=channel_urls, subdirs=[platform])
-        if all_versions:
-            most_recent = max(
-                all_versions,
-                key=lambda package_version: (
-                    VersionOrder(package_version.version),
-                    package_version.build_number,
-                ),
-            )
-            prec_version = VersionOrder(prec.version)
-            latest_version = VersionOrder(most_recent.version)
-            if prec_version < latest_version or (
-                prec_version == latest_version and prec.build_number < most_recent.build_number
-            ):
-                out_of_date_package_records[prec.name] = most_recent
+        if prec.name in most_recent:
+            order, url = most_recent[prec.name]
+            if (VersionOrder(prec.version), prec.build_number) < order:
+                out_of_date_package_records[prec.name] = url
     return out_of_date_package_records
 
 
@@ -138,15 +151,184 @@ platform: %(platform)s""",
             logger.debug("    %s", prec.fn)
 
 
-def _fetch(download_dir, precs):
+def _strip_pkg_ext(fn):
+    for ext in (".conda", ".tar.bz2"):
+        if fn.endswith(ext):
+            return fn[: -len(ext)]
+    return fn
+
+
+def _noarch_store_entry(store_dir, prec):
+    """
+    Return the directory of the shared noarch store holding the artifacts for ``prec``,
+    or None if the record cannot be stored there. Entries are keyed by content hash and
+    channel, so that the same package is shared between platforms. Packages from other
+    channels get their own entry: the extracted directory holds `repodata_record.json`,
+    with the URL and channel of the record it was extracted for.
+    """
+    if not store_dir or prec.get("subdir") != "noarch":
+        return None
+    key = prec.get("sha256") or prec.get("md5")
+    if not key:
+        return None
+    channel = (prec.get("url") or "").rsplit("/", 2)[0] or str(prec.channel)
+    return join(store_dir, key, hashlib.sha256(channel.encode()).hexdigest()[:16])
+
+
+def _link_into(src, dst, is_dir=False):
+    """
+    Hardlink a file or a whole directory tree from ``src`` to ``dst``.
+
+    The destination is populated in a temporary location first and then renamed into
+    place, so partially linked entries are never visible to other readers.
+    """
+    tmp = f"{dst}.tmp-{os.getpid()}"
+    try:
+        if is_dir:
+            shutil.copytree(src, tmp, symlinks=True, copy_function=hardlink_or_copy)
+        else:
+            hardlink_or_copy(src, tmp)
+        os.rename(tmp, dst)
+    except OSError:
+        # Somebody else got there first, or the filesystem refused; either way the
+        # regular (non-shared) code path still works.
+        if isdir(tmp):
+            shutil.rmtree(tmp, ignore_errors=True)
+        elif os.path.lexists(tmp):
+            os.unlink(tmp)
+        return False
+    return True
+
+
+def _link_from_noarch_store(download_dir, precs, store_dir):
+    """
+    Populate ``download_dir`` with the noarch tarballs and extracted directories
+    already available in the shared store. Returns the number of linked entries.
+    """
+    linked = 0
+    for prec in precs:
+        entry = _noarch_store_entry(store_dir, prec)
+        if entry is None or not isdir(entry):
+            continue
+        extracted = _strip_pkg_ext(prec.fn)
+        for name, is_dir in ((prec.fn, False), (extracted, True)):
+            src = join(entry, name)
+            dst = join(download_dir, name)
+            if os.path.lexists(src) and not os.path.lexists(dst):
+                linked += _link_into(src, dst, is_dir=is_dir)
+    if linked:
+        logger.debug("Linked %d entries from the shared noarch store %s", linked, store_dir)
+    return linked
+
+
+def _add_to_noarch_store(download_dir, pc_recs, store_dir):
+    """
+    Share the noarch tarballs and extracted directories of ``pc_recs`` with other
+    platforms by hardlinking them into the store.
+    """
+    for pc_rec in pc_recs:
+        entry = _noarch_store_entry(store_dir, pc_rec)
+        if entry is None:
+            continue
+        os.makedirs(entry, exist_ok=True)
+        extracted = _strip_pkg_ext(pc_rec.fn)
+        for name, is_dir in ((pc_rec.fn, False), (extracted, True)):
+            src = join(download_dir, name)
+            dst = join(entry, name)
+            if os.path.lexists(src) and not os.path.lexists(dst):
+                _link_into(src, dst, is_dir=is_dir)
+
+
+def _execute_with_failover(pc, precs, mirrors=None):
+    """
+    Download and extract ``precs``. When packages come from mirrored channels, the ones
+    still missing after a failure are retried from the next mirror in line.
+    """
+    while True:
+        try:
+            ProgressiveFetchExtract(precs).execute()
+            return
+        except Exception:
+            if not mirrors:
+                raise
+            pc.reload()
+            cached = {pc_rec.fn for pc_rec in pc.iter_records()}
+            switched = []
+            for prec in precs:
+                if prec.fn not in cached:
+                    prec = switch_mirror(prec, mirrors)
+                    if prec is None:
+                        raise
+                switched.append(prec)
+            precs = switched
+
+
+def _fetch(download_dir, precs, noarch_store_dir=None, mirrors=None):
     assert conda_context.pkgs_dirs[0] == download_dir
     pc = PackageCacheData.first_writable()
     assert pc.pkgs_dir == download_dir
     assert pc.is_writable, f"{download_dir} does not exist or is not writable"
 
-    ProgressiveFetchExtract(precs).execute()
+    # Other builds may share this cache; they fetch and extract packages one at a time
+    with file_lock(_lock_path(download_dir)):
+        if noarch_store_dir:
+            _link_from_noarch_store(download_dir, precs, noarch_store_dir)
+        # The cache might have been scanned before we got the locks; make sure conda
+        # sees what the shared store or concurrent builds added in the meantime
+        pc.reload()
+
+        _execute_with_failover(pc, precs, mirrors)
+
+        # The cache can hold packages from other builds; only sort the ones we need
+        precs_fns = {prec.fn for prec in precs}
+        pc_recs = toposort_records(x for x in pc.iter_records() if x.fn in precs_fns)
+        if mirrors:
+            for pc_rec in pc_recs:
+                canonical, mirror = mirror_of(pc_rec.url or "", mirrors)
+                if mirror is not None:
+                    logger.info("%s served by %s (for %s)", pc_rec.fn, mirror, canonical)
+        if noarch_store_dir:
+            _add_to_noarch_store(download_dir, pc_recs, noarch_store_dir)
+    return pc_recs
 
-    return list(dict.fromkeys(PrefixGraph(pc.iter_records()).graph))
+
+def _lock_path(download_dir):
+    return join(download_dir, ".constructor.lock")
+
+
+def _transmute(download_dir, dist, new_dist, transmute_file_type, store_entry=None):
+    """
+    Transmute ``dist`` into ``new_dist`` inside ``download_dir``, unless it is already
+    there. The result is written to a private directory and renamed into place while
+    holding the cache lock, so concurrent builds never see partial artifacts.
+    """
+    import conda_package_handling.api
+
+    new_file_name = join(download_dir, new_dist)
+    with file_lock(_lock_path(download_dir)):
+        # noarch artifacts are transmuted once and shared across platforms
+        if store_entry is not None and not os.path.exists(new_file_name):
+            stored = join(store_entry, new_dist)
+            if os.path.exists(stored):
+                _link_into(stored, new_file_name)
+        if os.path.exists(new_file_name):
+            return
+        logger.info("transmuting %s", dist)
+        out_folder = tempfile.mkdtemp(prefix=".transmute-", dir=download_dir)
+        try:
+            conda_package_handling.api.transmute(
+                os.path.join(download_dir, dist),
+                transmute_file_type,
+                out_folder=out_folder,
+            )
+            os.replace(join(out_folder, new_dist), new_file_name)
+        finally:
+            shutil.rmtree(out_folder, ignore_errors=True)
+        # Hash it now, while it is likely still in the page cache; preconda reuses these
+        record_artifact_digests(new_file_name)
+        if store_entry is not None:
+            os.makedirs(store_entry, exist_ok=True)
+            _link_into(new_file_name, join(store_entry, new_dist))
 
 
 def check_duplicates_files(
@@ -154,6 +336,7 @@ def check_duplicates_files(
     platform: str,
     duplicate_files: Literal["error", "warn", "skip"] = "error",
     env_prefixes: dict[PackageCacheRecord, str] | None = None,
+    package_index: PackageIndex | None = None,
 ) -> tuple[int, int, int]:
     """
     Check for duplicate files across packages and compute size/path metrics.
@@ -172,6 +355,8 @@ def check_duplicates_files(
             "envs/<name>/" rather than the base install directory. Records not
             in this dict are assumed to be in the base environment (no prefix).
             A trailing separator is added automatically if missing.
+        package_index: Optional index to read the package contents from, instead of
+            parsing the `info/paths.json` file of each package.
 
     Returns:
         Tuple of (approx_tarball_size, approx_extracted_size, max_relative_path_length)
@@ -197,24 +382,32 @@ def check_duplicates_files(
 
         total_tarball_size += int(pc_rec.get("size", 0))
 
-        paths_data = read_paths_json(extracted_package_dir).paths
         env_prefix_len = len(env_prefixes.get(pc_rec, ""))
         # Before linking, conda extracts each package into the package cache at
         # $INSTDIR/pkgs/<name-version-build>/<short_path>. This intermediate path is
         # longer than the final linked path (env_prefix + short_path) and is what
         # actually overflows MAX_PATH, so it must drive the length check.
         pkgs_prefix_len = len("pkgs/") + len(basename(extracted_package_dir)) + len("/")
-        for path_data in paths_data:
-            short_path = path_data.path
+        if package_index is not None and duplicate_files == "skip":
+            # Only the totals are needed; the index stores them per package
+            size, path_length = package_index.summary(extracted_package_dir, fn)
+            if path_length:
+                max_relative_path_length = max(
+                    max_relative_path_length, max(env_prefix_len, pkgs_prefix_len) + path_length
+                )
+            total_extracted_pkgs_size += size
+            continue
+
+        if package_index is not None:
+            files = package_index.files(extracted_package_dir, fn)
+        else:
+            files = package_files(extracted_package_dir)
+        for short_path, size in files:
             max_relative_path_length = max(
                 max_relative_path_length,
                 env_prefix_len + len(short_path),
                 pkgs_prefix_len + len(short_path),
             )
-            try:
-                size = path_data.size_in_bytes or getsize(join(extracted_package_dir, short_path))
-            except AttributeError:
-                size = getsize(join(extracted_package_dir, short_path))
             total_extracted_pkgs_size += size
 
             map_members_scase[short_path].add(fn)
@@ -266,6 +459,58 @@ def _precs_from_environment(environment, input_dir):
     return list(pdata.iter_records_sorted())
 
 
+def _solve(name, channel_urls, platform, specs, solver=None, repodata_session=None, mirrors=None):
+    """
+    Solve ``specs`` with the ``solver`` backend (the configured one if None). If it fails,
+    the solve is retried with the mirrored channels served by their next mirrors.
+    """
+    while True:
+        try:
+            return _solve_once(name, channel_urls, platform, specs, solver, repodata_session)
+        except Exception as exc:
+            next_urls = next_mirror_urls(channel_urls, mirrors)
+            if next_urls is None:
+                raise
+            logger.warning("Solving %s failed (%s); retrying with the next mirrors", name, exc)
+            channel_urls = next_urls
+
+
+def _solve_once(name, channel_urls, platform, specs, solver=None, repodata_session=None):
+    """
+    Solve ``specs`` with the ``solver`` backend (the configured one if None),
+    logging how long it took and how many repodata records the backend loaded.
+    """
+    solver_name = solver or getattr(conda_context, "solver", None) or "classic"
+    solver_obj = get_solver_backend(solver)(
+        # The Solver class doesn't do well with `None` as a prefix right now
+        prefix="/constructor/no-environment",
+        channels=channel_urls,
+        subdirs=(platform, "noarch"),
+        specs_to_add=specs,
+    )
+    repodata_urls = all_channel_urls(channel_urls, subdirs=(platform, "noarch"))
+    if repodata_session is not None:
+        cache_stamps = repodata_session.cache_stamps(repodata_urls)
+    start = time.monotonic()
+    # the records are already returned in topological sort
+    precs = list(solver_obj.solve_final_state())
+    elapsed = time.monotonic() - start
+    # Only backends that build the index in Python (e.g. classic) expose it
+    index = getattr(solver_obj, "_index", None)
+    logger.info(
+        "Solved %s with the '%s' solver in %.2f s (%s repodata records loaded, %d selected)",
+        name,
+        solver_name,
+        elapsed,
+        len(index) if index else "unknown number of",
+        len(precs),
+    )
+    if repodata_session is not None:
+        # The indexes the solver just refreshed in conda's cache can be used as they are
+        repodata_session.mark_fresh(repodata_urls, since=cache_stamps)
+    return precs
+
+
 def _solve_precs(
     name,
     version,
@@ -283,6 +528,10 @@ def _solve_precs(
     extra_env=False,
     input_dir="",
     base_needs_python=True,
+    solver=None,
+    solver_fallback=None,
+    repodata_session=None,
+    mirrors=None,
 ):
     if not extra_env and base_needs_python:
         specs = (*specs, "python")
@@ -343,16 +592,44 @@ def _solve_precs(
     # obtain the package records
     if environment:
         precs = _precs_from_environment(environment, input_dir)
+    elif solver_fallback and solver_fallback != solver:
+        try:
+            precs = _solve(
+                name,
+                channel_urls,
+                platform,
+                specs,
+                solver=solver,
+                repodata_session=repodata_session,
+                mirrors=mirrors,
+            )
+        except Exception as exc:
+            logger.warning(
+                "Solving %s with the '%s' solver failed (%s); retrying with '%s'",
+                name,
+                solver or "default",
+                exc,
+                solver_fallback,
+            )
+            precs = _solve(
+                name,
+                channel_urls,
+                platform,
+                specs,
+                solver=solver_fallback,
+                repodata_session=repodata_session,
+                mirrors=mirrors,
+            )
     else:
-        solver = Solver(
-            # The Solver class doesn't do well with `None` as a prefix right now
-            prefix="/constructor/no-environment",
-            channels=channel_urls,
-            subdirs=(platform, "noarch"),
-            specs_to_add=specs,
+        precs = _solve(
+            name,
+            channel_urls,
+            platform,
+            specs,
+            solver=solver,
+            repodata_session=repodata_session,
+            mirrors=mirrors,
         )
-        # the records are already returned in topological sort
-        precs = list(solver.solve_final_state())
 
     python_prec = next((prec for prec in precs if prec.name == "python"), None)
     if python_prec:
@@ -369,7 +646,7 @@ def _solve_precs(
 
     precs = exclude_packages(precs, exclude, error_on_absence=not extra_env)
     if verbose:
-        more_recent_versions = _find_out_of_date_precs(precs, channel_urls, platform)
+        more_recent_versions = _find_out_of_date_precs(precs, channel_urls, repodata_session)
         _show(name, version, platform, download_dir, precs, more_recent_versions)
 
     if environment_file:
@@ -380,8 +657,8 @@ def _solve_precs(
     return precs
 
 
-def _fetch_precs(precs, download_dir, transmute_file_type=""):
-    pc_recs = _fetch(download_dir, precs)
+def _fetch_precs(precs, download_dir, transmute_file_type="", noarch_store_dir=None, mirrors=None):
+    pc_recs = _fetch(download_dir, precs, noarch_store_dir=noarch_store_dir, mirrors=mirrors)
     # Constructor cache directory can have multiple packages from different
     # installer creations. Filter out those which the solver picked.
     precs_fns = [x.fn for x in precs]
@@ -393,23 +670,19 @@ def _fetch_precs(precs, download_dir, transmute_file_type=""):
 
     if transmute_file_type != "":
         new_dists = []
-        import conda_package_handling.api
-
-        for dist in dists:
+        for prec, dist in zip(precs, dists):
             if dist.endswith(transmute_file_type):
                 new_dists.append(dist)
             elif dist.endswith(".tar.bz2"):
                 dist = filename_dist(dist)
-                new_file_name = "%s%s" % (dist[:-8], transmute_file_type)
-                new_dists.append(new_file_name)
-                new_file_name = join(download_dir, new_file_name)
-                if os.path.exists(new_file_name):
-                    continue
-                logger.info("transmuting %s", dist)
-                conda_package_handling.api.transmute(
-                    os.path.join(download_dir, dist),
+                new_dist = "%s%s" % (dist[:-8], transmute_file_type)
+                new_dists.append(new_dist)
+                _transmute(
+                    download_dir,
+                    dist,
+                    new_dist,
                     transmute_file_type,
-                    out_folder=download_dir,
+                    store_entry=_noarch_store_entry(noarch_store_dir, prec),
                 )
             else:
                 new_dists.append(dist)
@@ -439,6 +712,12 @@ def _main(
     check_path_spaces=True,
     input_dir="",
     base_needs_python=True,
+    noarch_store_dir=None,
+    mirrors=None,
+    solver=None,
+    solver_fallback=None,
+    repodata_session=None,
+    package_index_path=None,
 ):
     precs = _solve_precs(
         name,
@@ -456,6 +735,9 @@ def _main(
         conda_exe=conda_exe,
         input_dir=input_dir,
         base_needs_python=base_needs_python,
+        solver=solver,
+        solver_fallback=solver_fallback,
+        repodata_session=repodata_session,
     )
     extra_envs = extra_envs or {}
     conda_in_base: PackageCacheRecord = next((prec for prec in precs if prec.name == "conda"), None)
@@ -478,7 +760,9 @@ def _main(
             version,
             download_dir,
             platform,
-            channel_urls=env_config.get("channels", channel_urls),
+            channel_urls=apply_mirrors(env_config["channels"], mirrors)
+            if "channels" in env_config
+            else channel_urls,
             channels_remap=env_config.get("channels_remap", channels_remap),
             specs=env_config.get("specs", ()),
             exclude=env_config.get("exclude", exclude),
@@ -489,11 +773,18 @@ def _main(
             conda_exe=conda_exe,
             extra_env=True,
             input_dir=input_dir,
+            solver=env_config.get("solver", solver),
+            solver_fallback=solver_fallback,
+            repodata_session=repodata_session,
         )
     if dry_run:
         return None, None, None, None, None, None, None, None, None
     pc_recs, _urls, dists, has_conda = _fetch_precs(
-        precs, download_dir, transmute_file_type=transmute_file_type
+        precs,
+        download_dir,
+        transmute_file_type=transmute_file_type,
+        noarch_store_dir=noarch_store_dir,
+        mirrors=mirrors,
     )
     all_pc_recs = pc_recs.copy()
 
@@ -501,7 +792,11 @@ def _main(
     env_prefixes = {}  # Maps pc_rec -> "envs/<name>/" prefix for max path calculation
     for env_name, env_precs in extra_envs_precs.items():
         env_pc_recs, env_urls, env_dists, _ = _fetch_precs(
-            env_precs, download_dir, transmute_file_type=transmute_file_type
+            env_precs,
+            download_dir,
+            transmute_file_type=transmute_file_type,
+            noarch_store_dir=noarch_store_dir,
+            mirrors=mirrors,
         )
         extra_envs_data[env_name] = {"_urls": env_urls, "_dists": env_dists, "_records": env_precs}
         env_prefix = f"envs/{env_name}/"
@@ -521,9 +816,14 @@ def _main(
     # - When extra_envs exists, duplicate_files="skip" so only sizes and max path are computed
     # - When no extra_envs, all_pc_recs == pc_recs
     # - env_prefixes dict ensures max path accounts for "envs/<name>/" prefix in extra_envs
-    approx_tarballs_size, approx_pkgs_size, max_relative_path_length = check_duplicates_files(
-        all_pc_recs, platform, duplicate_files=duplicate_files, env_prefixes=env_prefixes
-    )
+    with PackageIndex(package_index_path) if package_index_path else nullcontext() as index:
+        approx_tarballs_size, approx_pkgs_size, max_relative_path_length = check_duplicates_files(
+            all_pc_recs,
+            platform,
+            duplicate_files=duplicate_files,
+            env_prefixes=env_prefixes,
+            package_index=index,
+        )
 
     return (
         all_pc_recs,
@@ -538,13 +838,78 @@ def _main(
     )
 
 
+@contextmanager
+def _package_cache_context(download_dir):
+    """Make ``download_dir`` the package cache conda downloads and extracts into."""
+    # We need to preserve the configuration for proxy servers and ssl, otherwise if constructor is
+    # running in a host that sits behind proxy (usually in a company / corporate environment) it
+    # will have this settings reset with the call to conda_replace_context_default
+    # We can pass ssl_verify via env var, but proxy_servers is a mapping so we need to do it by hand
+    # See: https://github.com/conda/constructor/issues/304
+    proxy_servers = conda_context.proxy_servers
+    _ssl_verify = conda_context.ssl_verify
+    with env_vars(
+        {
+            "CONDA_PKGS_DIRS": download_dir,
+            "CONDA_SSL_VERIFY": str(conda_context.ssl_verify),
+        },
+        conda_replace_context_default,
+    ):
+        # Restoring the state for "proxy_servers" to what it was before
+        conda_context.proxy_servers = proxy_servers
+        assert conda_context.ssl_verify == _ssl_verify
+        assert conda_context.pkgs_dirs and conda_context.pkgs_dirs[0] == download_dir
+        yield
+
+
+def _prec_from_url(url, hash_value=None):
+    channel_url, subdir, fn = url.rsplit("/", 2)
+    name, version, build = _strip_pkg_ext(fn).rsplit("-", 2)
+    hashes = {}
+    if hash_value:
+        hashes["md5" if len(hash_value) == 32 else "sha256"] = hash_value.split(":")[-1]
+    return PackageRecord(
+        name=name,
+        version=version,
+        build=build,
+        build_number=0,
+        channel=Channel(channel_url),
+        subdir=subdir,
+        fn=fn,
+        url=url,
+        **hashes,
+    )
+
+
+def fetch_explicit(urls, download_dir, transmute_file_type="", noarch_store_dir=None):
+    """
+    Download, verify and extract the packages of an explicit lockfile into ``download_dir``,
+    transmuting them if requested, without solving anything.
+
+    Args:
+        urls: ``(url, hash)`` pairs; the hash (md5 or ``sha256:...``) can be None.
+
+    Returns:
+        The filenames of the packages in the cache.
+    """
+    precs = [_prec_from_url(url, hash_value) for url, hash_value in urls]
+    with _package_cache_context(download_dir):
+        _, _, dists, _ = _fetch_precs(
+            precs,
+            download_dir,
+            transmute_file_type=transmute_file_type,
+            noarch_store_dir=noarch_store_dir,
+        )
+    return dists
+
+
 def main(info, verbose=True, dry_run=False, conda_exe="conda.exe"):
     name = info["name"]
     input_dir = info["_input_dir"]
     version = info["version"]
     download_dir = info["_download_dir"]
     platform = info["_platform"]
-    channel_urls = all_channel_urls(info.get("channels", ()), subdirs=[platform, "noarch"])
+    channels = info.get("channels", ())
     channels_remap = info.get("channels_remap", ())
     specs = info.get("specs", ())
     exclude = info.get("exclude", ())
@@ -556,28 +921,23 @@ def main(info, verbose=True, dry_run=False, conda_exe="conda.exe"):
     extra_envs = info.get("extra_envs", {})
     check_path_spaces = info.get("check_path_spaces", True)
     base_needs_python = info.get("_win_install_needs_python_exe", False)
+    noarch_store_dir = info.get("_noarch_store_dir")
 
-    if not channel_urls and not channels_remap and not (environment or environment_file):
+    if not channels and not channels_remap and not (environment or environment_file):
         sys.exit("Error: at least one entry in 'channels' or 'channels_remap' is required")
 
-    # We need to preserve the configuration for proxy servers and ssl, otherwise if constructor is
-    # running in a host that sits behind proxy (usually in a company / corporate environment) it
-    # will have this settings reset with the call to conda_replace_context_default
-    # We can pass ssl_verify via env var, but proxy_servers is a mapping so we need to do it by hand
-    # See: https://github.com/conda/constructor/issues/304
-    proxy_servers = conda_context.proxy_servers
-    _ssl_verify = conda_context.ssl_verify
-    with env_vars(
-        {
-            "CONDA_PKGS_DIRS": download_dir,
-            "CONDA_SSL_VERIFY": str(conda_context.ssl_verify),
-        },
-        conda_replace_context_default,
-    ):
-        # Restoring the state for "proxy_servers" to what it was before
-        conda_context.proxy_servers = proxy_servers
-        assert conda_context.ssl_verify == _ssl_verify
-        assert conda_context.pkgs_dirs and conda_context.pkgs_dirs[0] == download_dir
+    with _package_cache_context(download_dir):
+        # Mirrors are raced once per build; the ranking is reused by preconda
+        all_channels = list(channels)
+        for env_config in extra_envs.values():
+            all_channels += env_config.get("channels", ())
+        mirrors = resolve_mirrors(all_channels, info.get("mirrored_channels", {}))
+        info["_mirrors"] = mirrors
+        # Shared with preconda so that the indexes are not fetched and parsed again
+        repodata_session = info.setdefault("_repodata_session", RepodataSession())
+        channel_urls = all_channel_urls(
+            apply_mirrors(channels, mirrors), subdirs=[platform, "noarch"]
+        )
 
         (
             pkg_records,
@@ -610,6 +970,12 @@ def main(info, verbose=True, dry_run=False, conda_exe="conda.exe"):
             check_path_spaces,
             input_dir,
             base_needs_python,
+            noarch_store_dir,
+            mirrors,
+            info.get("solver"),
+            info.get("solver_fallback"),
+            repodata_session,
+            info.get("_package_index_path"),
         )
 
     info["_all_pkg_records"] = pkg_records  # full PackageRecord objects
@@ -622,3 +988,4 @@ def main(info, verbose=True, dry_run=False, conda_exe="conda.exe"):
     # contains {env_name: [_dists, _urls, _records]} for each extra environment
     info["_extra_envs_info"] = extra_envs_info
     info["_max_relative_path_length"] = max_relative_path_length
+    info["_context"] = BuildContext(info)
@@ -0,0 +1,214 @@
+# (c) 2016 Anaconda, Inc. / https://anaconda.com
+# All Rights Reserved
+#
+# constructor is distributed under the terms of the BSD 3-clause license.
+# Consult LICENSE.txt or http://opensource.org/licenses/BSD-3-Clause.
+"""
+`constructor-fetch`: populate the package cache without building installers.
+
+Targets are either directories with a `construct.yaml` file, which are solved and
+fetched exactly like a build would, or explicit lockfiles (such as the `lockfile`
+build output), whose packages are downloaded as listed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from os.path import abspath, expanduser, isdir, isfile, join
+from tempfile import TemporaryDirectory
+
+from .conda_interface import SUPPORTED_PLATFORMS, cc_platform
+
+logger = logging.getLogger(__name__)
+
+
+def read_explicit_lockfile(path: str) -> tuple[str | None, list[tuple[str, str | None]]]:
+    """
+    Return the platform declared in the ``# platform:`` header of an explicit lockfile
+    (None if missing), and its ``(url, hash)`` entries.
+    """
+    platform = None
+    urls = []
+    explicit = False
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                key, _, value = line[1:].partition(":")
+                if key.strip() == "platform":
+                    platform = value.strip()
+                continue
+            if line == "@EXPLICIT":
+                explicit = True
+                continue
+            if explicit:
+                url, _, hash_value = line.partition("#")
+                urls.append((url, hash_value or None))
+    if not explicit:
+        raise ValueError(
+            f"'{path}' is not an explicit lockfile (no @EXPLICIT line). "
+            "Note that 'pkg-list' outputs only name the packages; use 'lockfile' instead."
+        )
+    return platform, urls
+
+
+def _fetch_config(dir_path, platform, cache_dir, conda_exe, config_filename, verbose):
+    from .main import main_build
+
+    with TemporaryDirectory(prefix="constructor-fetch-") as output_dir:
+        main_build(
+            dir_path,
+            output_dir=output_dir,
+            platform=platform,
+            verbose=verbose,
+            cache_dir=cache_dir,
+            conda_exe=conda_exe,
+            config_filename=config_filename,
+            fetch_only=True,
+        )
+
+
+def _fetch_lockfile(path, platform, urls, cache_dir, transmute_file_type):
+    from .fcp import fetch_explicit
+
+    cache_dir = abspath(expanduser(cache_dir))
+    dists = fetch_explicit(
+        urls,
+        join(cache_dir, platform),
+        transmute_file_type=transmute_file_type,
+        noarch_store_dir=join(cache_dir, "noarch"),
+    )
+    logger.info("%d packages from %s (%s) are cached", len(dists), path, platform)
+
+
+def _run_task(task: tuple) -> str | None:
+    """Run a fetch task and return an error message if it failed."""
+    function, args = task
+    try:
+        function(*args)
+    except SystemExit as exc:
+        return str(exc)
+    except Exception as exc:
+        logger.debug("Fetch failed", exc_info=True)
+        return f"{type(exc).__name__}: {exc}"
+    return None
+
+
+def main(argv=None):
+    from .main import DEFAULT_CACHE_DIR, resolve_conda_exe
+
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser(
+        prog="constructor-fetch",
+        description="download, verify and extract into the cache the packages needed by each "
+        "<TARGET>, without building installers",
+    )
+    p.add_argument(
+        "--cache-dir",
+        action="store",
+        default=DEFAULT_CACHE_DIR,
+        help="cache directory to populate, may be changed by CONSTRUCTOR_CACHE, "
+        f"defaults to '{DEFAULT_CACHE_DIR}'",
+        metavar="PATH",
+    )
+    p.add_argument(
+        "--platform",
+        action="append",
+        dest="platforms",
+        help="platform to fetch construct.yaml targets for; can be repeated. "
+        f"Defaults to '{cc_platform}'. Options, e.g.: {SUPPORTED_PLATFORMS}. "
+        "Lockfiles use the platform in their header instead, if any.",
+        metavar="PLATFORM",
+    )
+    p.add_argument(
+        "--conda-exe",
+        help="path to conda executable (conda-standalone, micromamba)",
+        action="store",
+        metavar="CONDA_EXE",
+    )
+    p.add_argument(
+        "--config-filename",
+        help="name of the construct YAML file in each directory target",
+        action="store",
+        metavar="FILENAME",
+        default="construct.yaml",
+    )
+    p.add_argument(
+        "--transmute-file-type",
+        help="also transmute the packages of lockfile targets to this format "
+        "(construct.yaml targets use their own 'transmute_file_type')",
+        action="store",
+        choices=(".conda",),
+        default="",
+    )
+    p.add_argument(
+        "-j",
+        "--jobs",
+        help="number of targets to fetch in parallel, defaults to 1",
+        type=int,
+        default=1,
+    )
+    p.add_argument("-v", "--verbose", action="store_true")
+    p.add_argument(
+        "targets",
+        help="directory containing a construct.yaml file, or explicit lockfile",
+        nargs="+",
+        metavar="TARGET",
+    )
+    args = p.parse_args(argv)
+
+    if args.verbose:
+        logging.getLogger("constructor").setLevel(logging.DEBUG)
+    if args.jobs < 1:
+        p.error("--jobs must be at least 1")
+    platforms = args.platforms or [cc_platform]
+
+    tasks = []
+    for target in args.targets:
+        if isdir(target):
+            if not isfile(join(target, args.config_filename)):
+                p.error("no such file: %s" % join(target, args.config_filename))
+            for platform in platforms:
+                conda_exe = resolve_conda_exe(p, args.conda_exe, platform)
+                config_args = (
+                    target,
+                    platform,
+                    args.cache_dir,
+                    conda_exe,
+                    args.config_filename,
+                    args.verbose,
+                )
+                tasks.append((f"{target} ({platform})", (_fetch_config, config_args)))
+        elif isfile(target):
+            try:
+                platform, urls = read_explicit_lockfile(target)
+            except ValueError as exc:
+                p.error(str(exc))
+            platform = platform or platforms[0]
+            lockfile_args = (target, platform, urls, args.cache_dir, args.transmute_file_type)
+            tasks.append((f"{target} ({platform})", (_fetch_lockfile, lockfile_args)))
+        else:
+            p.error("no such file or directory: %s" % target)
+
+    jobs = min(args.jobs, len(tasks))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            errors = list(executor.map(_run_task, [task for _, task in tasks]))
+    else:
+        errors = [_run_task(task) for _, task in tasks]
+
+    failed = [(name, error) for (name, _), error in zip(tasks, errors) if error]
+    for name, error in failed:
+        logger.error("Could not fetch %s: %s", name, error)
+    if failed:
+        sys.exit(f"Error: {len(failed)} of {len(tasks)} targets could not be fetched.")
+    logger.info("Cache is ready: %s", abspath(expanduser(args.cache_dir)))
+
+
+if __name__ == "__main__":
+    main()
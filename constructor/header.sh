@@ -5,7 +5,13 @@
 # NAME:  {{ installer_name }}
 # VER:   {{ installer_version }}
 # PLAT:  {{ installer_platform }}
-# MD5:   {{ installer_md5 }}
+# PAYLOAD_INDEX: {{ index_offset }} {{ index_size }}
+{%- if streaming %}
+
+# The script is a single command, so that a shell reading it from standard input
+# (curl ... | bash -s) has read all of it before the payload that follows is read.
+{
+{%- endif %}
 
 set -eu
 
@@ -15,10 +21,29 @@ unset DYLD_LIBRARY_PATH DYLD_FALLBACK_LIBRARY_PATH DYLD_INSERT_LIBRARIES DYLD_FR
 unset LD_LIBRARY_PATH LD_PRELOAD LD_AUDIT
 {%- endif %}
 
+{%- if streaming %}
+if [ -f "$0" ] && echo "$0" | grep '\.sh$' > /dev/null; then
+    STREAM_STDIN=0
+elif [ -n "${BASH_VERSION:-}" ] && [ -f /dev/stdin ]; then
+    # bash reads a redirected file ahead and seeks back, which moves the offset the
+    # payload would be read from
+    printf 'Please run using "bash <installer>", or pipe it to "bash -s", but do not redirect it.\n' >&2
+    exit 1
+elif [ -n "${BASH_VERSION:-}" ] && [ ! -t 0 ]; then
+    # The installer is read from standard input, and so is its payload. Nothing else
+    # may read from it: the payload is read from file descriptor 3 instead.
+    STREAM_STDIN=1
+    exec 3<&0 < /dev/null
+else
+    printf 'Please run using "bash"/"dash"/"sh"/"zsh", or pipe it to "bash -s", but not "." or "source".\n' >&2
+    exit 1
+fi
+{%- else %}
 if ! echo "$0" | grep '\.sh$' > /dev/null; then
     printf 'Please run using "bash"/"dash"/"sh"/"zsh", but not "." or "source".\n' >&2
     exit 1
 fi
+{%- endif %}
 
 {%- if osx and min_osx_version %}
 if [ "$(uname)" = "Darwin" ]; then
@@ -71,6 +96,13 @@ if [ "$(uname)" = "Linux" ]; then
 fi
 {%- endif %}
 
+{%- if bootstrapper_codec %}
+if ! command -v {{ bootstrapper_codec }} >/dev/null 2>&1; then
+    printf "ERROR: '{{ bootstrapper_codec }}' is required to unpack this installer.\n" >&2
+    exit 1
+fi
+{%- endif %}
+
 # Export variables to make installer metadata available to pre/post install scripts
 # NOTE: If more vars are added, make sure to update the examples/scripts tests too
 
@@ -100,6 +132,8 @@ SKIP_SHORTCUTS=0
 {%- endif %}
 INIT_CONDA=0
 TEST=0
+STRICT=0
+JOBS=$(getconf _NPROCESSORS_ONLN 2>/dev/null || echo 1)
 REINSTALL=0
 USAGE="
 usage: $0 [options]
@@ -127,6 +161,8 @@ Installs ${INSTALLER_NAME} ${INSTALLER_VER}
 -m           disable the creation of menu items / shortcuts
 {%- endif %}
 -u           update an existing installation
+-V           abort the installation if the payload does not match its SHA-256 digests
+-j JOBS      number of package tarballs extracted in parallel, defaults to the number of CPUs
 {%- if has_conda %}
 -t           run package tests after installation (may install conda-build)
 {%-   if initialize_conda %}
@@ -145,7 +181,7 @@ Installs ${INSTALLER_NAME} ${INSTALLER_VER}
 {%- if enable_shortcuts == "true" %}
 {%-   set getopts_str = getopts_str ~ "m" %}
 {%- endif %}
-{%- set getopts_str = getopts_str ~ "u" %}
+{%- set getopts_str = getopts_str ~ "uVj:" %}
 {%- if has_conda %}
 {%-   set getopts_str = getopts_str ~ "t" %}
 {%-     if initialize_conda %}
@@ -184,6 +220,12 @@ while getopts "{{ getopts_str }}" x; do
         u)
             FORCE=1
             ;;
+        V)
+            STRICT=1
+            ;;
+        j)
+            JOBS="$OPTARG"
+            ;;
 {%- if has_conda %}
         t)
             TEST=1
@@ -201,6 +243,20 @@ while getopts "{{ getopts_str }}" x; do
     esac
 done
 
+case "$JOBS" in
+    ''|*[!0-9]*|0)
+        printf "ERROR: -j expects a positive number of jobs, got '%s'\n" "$JOBS" >&2
+        exit 1
+        ;;
+esac
+
+{%- if streaming %}
+if [ "$STREAM_STDIN" = "1" ] && [ "$BATCH" = "0" ]; then
+    printf "ERROR: installing from standard input requires batch mode (-b)\n" >&2
+    exit 1
+fi
+{%- endif %}
+
 # For pre- and post-install scripts
 export INSTALLER_UNATTENDED="$BATCH"
 
@@ -456,64 +512,175 @@ export PREFIX
 
 printf "PREFIX=%s\\n" "$PREFIX"
 
-# 3-part dd from https://unix.stackexchange.com/a/121798/34459
-# Using a larger block size greatly improves performance, but our payloads
-# will not be aligned with block boundaries. The solution is to extract the
-# bulk of the payload with a larger block size, and use a block size of 1
-# only to extract the partial blocks at the beginning and the end.
+{%- if streaming %}
+# The payload is a single tarball following the header, read sequentially: from this
+# file, or from standard input past the end of this script.
+payload_stream () {
+    if [ "$STREAM_STDIN" = "1" ]; then
+        while IFS= read -r line <&3; do
+            [ "$line" = "@@END_HEADER@@" ] && break
+        done
+        cat <&3
+    else
+        tail -c "+$(( boundary0 + 1 ))" "$THIS_PATH"
+    fi
+}
+{%- else %}
+# The payloads start at multiples of the block size and are followed by zero padding
+# up to the next one, so that each range is read with a single large-block dd call.
+# The padding is harmless for tarballs and gzip/xz streams; the conda executable is
+# truncated to its size after extraction.
 extract_range () {
     # Usage: extract_range first_byte last_byte_plus_1
-    blk_siz=16384
-    dd1_beg=$1
-    dd3_end=$2
-    range_size=$(( dd3_end - dd1_beg ))
-    if [ $blk_siz -gt $range_size ]; then
-        blk_siz=$range_size
-    fi
-    dd1_end=$(( ( dd1_beg / blk_siz + 1 ) * blk_siz ))
-    dd1_cnt=$(( dd1_end - dd1_beg ))
-    dd2_end=$(( dd3_end / blk_siz ))
-    dd2_beg=$(( ( dd1_end - 1 ) / blk_siz + 1 ))
-    dd2_cnt=$(( dd2_end - dd2_beg ))
-    dd3_beg=$(( dd2_end * blk_siz ))
-    dd3_cnt=$(( dd3_end - dd3_beg ))
-    dd if="$THIS_PATH" bs=1 skip="${dd1_beg}" count="${dd1_cnt}" 2>/dev/null
-    dd if="$THIS_PATH" bs="${blk_siz}" skip="${dd2_beg}" count="${dd2_cnt}" 2>/dev/null
-    dd if="$THIS_PATH" bs=1 skip="${dd3_beg}" count="${dd3_cnt}" 2>/dev/null
+    blk_siz={{ payload_block_size }}
+    dd if="$THIS_PATH" bs="${blk_siz}" skip="$(( $1 / blk_siz ))" \
+        count="$(( ( $2 - $1 + blk_siz - 1 ) / blk_siz ))" 2>/dev/null
+}
+{%- endif %}
+
+# The payloads are verified while they are extracted, so that they are read only once:
+# the stream is copied with tee to a FIFO read by the hasher started with hash_start.
+# Consumers that may stop before the end of the stream (tar) are followed by 'cat' to
+# read the rest of it. In strict mode (-V), a mismatch aborts the installation.
+hash_fifo="$PREFIX/.payload-hash.fifo"
+hash_out="$PREFIX/.payload-hash"
+hash_start () {
+    rm -f "$hash_fifo"
+    mkfifo "$hash_fifo"
+    {{ "shasum -a 256" if osx else "sha256sum" }} < "$hash_fifo" > "$hash_out" &
+    hash_pid=$!
+}
+
+hash_check () {
+    # Usage: hash_check payload_name expected_sha256
+    wait "$hash_pid" || true
+    hash_got=$(cut -d ' ' -f 1 < "$hash_out")
+    rm -f "$hash_fifo" "$hash_out"
+    if [ "$hash_got" != "$2" ]; then
+        printf "WARNING: SHA-256 mismatch of the %s payload\n" "$1" >&2
+        printf "expected: %s\n" "$2" >&2
+        printf "     got: %s\n" "$hash_got" >&2
+        if [ "$STRICT" = "1" ]; then
+            printf "ERROR: aborting the installation because of the mismatch (-V)\n" >&2
+            exit 1
+        fi
+    fi
+}
+
+{%- if not streaming %}
+
+# Background jobs, at most $JOBS at a time; wait_jobs fails if any of them failed
+jobs_pids=""
+run_job () {
+    # Usage: run_job command [args...]
+    # shellcheck disable=SC2086
+    if [ "$(echo $jobs_pids | wc -w)" -ge "$JOBS" ]; then
+        oldest_pid="${jobs_pids%% *}"
+        jobs_pids="${jobs_pids#"$oldest_pid"}"
+        jobs_pids="${jobs_pids# }"
+        wait "$oldest_pid" || jobs_failed=1
+    fi
+    "$@" &
+    jobs_pids="${jobs_pids:+$jobs_pids }$!"
+}
+
+wait_jobs () {
+    for pid in $jobs_pids; do
+        wait "$pid" || jobs_failed=1
+    done
+    jobs_pids=""
+    [ "${jobs_failed:-0}" = "0" ]
 }
+{%- endif %}
 
-# the line marking the end of the shell header and the beginning of the payload
-last_line=$(grep -anm 1 '^@@END_HEADER@@' "$THIS_PATH" | sed 's/:.*//')
+# The preconda and postconda archives are compressed with the codec chosen by
+# 'payload_compression' at build time. The codec is detected from the magic bytes
+# of the archive, and named after the tool that decompresses it.
+archive_codec () {
+    # Usage: archive_codec archive
+    case "$(dd if="$1" bs=6 count=1 2>/dev/null | od -An -tx1 | tr -d ' \n')" in
+        1f8b*) echo gzip ;;
+        425a68*) echo bzip2 ;;
+        fd377a585a00) echo xz ;;
+        28b52ffd*) echo zstd ;;
+        *) echo none ;;
+    esac
+}
+
+# The conda executable reads the compressed archives directly. If it cannot (e.g.
+# zstd with conda-standalone), the archive is decompressed with the system tool.
+extract_archive () {
+    # Usage: extract_archive archive
+    archive_codec=$(archive_codec "$1")
+    # shellcheck disable=SC2050
+    if [ "$archive_codec" = "zstd" ] && [ "{{ conda_exe_name }}" = "_conda" ] \
+            && command -v zstd >/dev/null 2>&1; then
+        zstd -dc < "$1" | \
+            CONDA_QUIET="$BATCH" "$CONDA_EXEC" constructor --prefix "$PREFIX" --extract-tarball
+        return
+    fi
+    if CONDA_QUIET="$BATCH" "$CONDA_EXEC" constructor --prefix "$PREFIX" --extract-tarball < "$1"; then
+        return 0
+    fi
+    if [ "$archive_codec" = "none" ] || ! command -v "$archive_codec" >/dev/null 2>&1; then
+        printf "ERROR: could not extract %s (%s compression)\n" "$1" "$archive_codec" >&2
+        return 1
+    fi
+    printf "Retrying the extraction of %s with %s...\n" "$1" "$archive_codec" >&2
+    "$archive_codec" -dc < "$1" | \
+        CONDA_QUIET="$BATCH" "$CONDA_EXEC" constructor --prefix "$PREFIX" --extract-tarball
+}
+
+{%- if streaming %}
+# the start of the payload tarball (right after this header), indexed from zero
+boundary0=$(( {{ boundary0 }} ))
+{%- else %}
+# the byte offsets of the payloads, computed when the installer was built
 # first payload: conda.exe
 # second payload (optional): supporting files for conda.exe (only in conda-standalone onedir)
 # third payload: conda packages
-# the start of the first payload, in bytes, indexed from zero
-boundary0=$(head -n "${last_line}" "${THIS_PATH}" | wc -c | sed 's/ //g')
-# the start of the second payload / the end of the first payload, plus one
-boundary1=$(( boundary0 + {{ first_payload_size }} ))
-# the start of the third payload / the end of the second payload, plus one
-boundary2=$(( boundary1 + {{ conda_exe_payloads_size }} ))
-# the end of the third payload, plus one
-boundary3=$(( boundary2 + {{ second_payload_size }} ))
-
-# verify the MD5 sum of the tarball appended to this header
-MD5=$(extract_range "${boundary0}" "${boundary3}" | {{ "md5" if osx else "md5sum -" }})
-
-if ! echo "$MD5" | grep {{ installer_md5 }} >/dev/null; then
-    printf "WARNING: md5sum mismatch of tar archive\\n" >&2
-    printf "expected: {{ installer_md5 }}\\n" >&2
-    printf "     got: %s\\n" "$MD5" >&2
-fi
+# the start of the first payload (after this header and its padding), indexed from zero
+boundary0=$(( {{ boundary0 }} ))
+# the start of the second payload / the end of the padded first payload
+boundary1=$(( {{ boundary1 }} ))
+# the start of the third payload / the end of the padded second payload
+boundary2=$(( {{ boundary2 }} ))
+# the end of the padded third payload, where the payload index starts
+boundary3=$(( {{ boundary3 }} ))
+# the size of conda.exe, without padding
+conda_exe_size=$(( {{ conda_exe_size }} ))
+{%- endif %}
 
 cd "$PREFIX"
 
 # disable sysconfigdata overrides, since we want whatever was frozen to be used
 unset PYTHON_SYSCONFIGDATA_NAME _CONDA_PYTHON_SYSCONFIGDATA_NAME
 
+CONDA_EXEC="$PREFIX/{{ conda_exe_name }}"
+{%- if streaming %}
+# the payload: the standalone conda executable, the files next to it (only in
+# conda-standalone onedir) and the packages, extracted while they are read
+printf "Unpacking payload...\n"
+hash_start
+payload_stream | tee "$hash_fifo" | { tar -xf - -C "$PREFIX"; cat > /dev/null; }
+hash_check streamed "{{ sha256_stream }}"
+{%-   if bootstrapper_codec %}
+{{ bootstrapper_codec }} -dc < "$CONDA_EXEC{{ bootstrapper_extension }}" > "$CONDA_EXEC"
+rm -f "$CONDA_EXEC{{ bootstrapper_extension }}"
+{%-   endif %}
+{%- else %}
 # the first binary payload: the standalone conda executable
 printf "Unpacking bootstrapper...\n"
-CONDA_EXEC="$PREFIX/{{ conda_exe_name }}"
-extract_range "${boundary0}" "${boundary1}" > "$CONDA_EXEC"
+hash_start
+{%- if bootstrapper_codec %}
+extract_range "${boundary0}" "${boundary1}" | tee "$hash_fifo" | {{ bootstrapper_codec }} -dc > "$CONDA_EXEC"
+{%- else %}
+extract_range "${boundary0}" "${boundary1}" | tee "$hash_fifo" > "$CONDA_EXEC"
+# drop the padding
+dd if=/dev/null of="$CONDA_EXEC" bs=1 seek="${conda_exe_size}" 2>/dev/null
+{%- endif %}
+hash_check bootstrapper "{{ sha256_bootstrapper }}"
+{%- endif %}
 chmod +x "$CONDA_EXEC"
 
 {%- if conda_exe_name != "_conda" %}
@@ -521,17 +688,18 @@ chmod +x "$CONDA_EXEC"
 ln -s -f "$CONDA_EXEC" "$PREFIX"/_conda
 {%- endif %}
 
-{%- for filename, (start, end, executable) in conda_exe_payloads|items %}
-mkdir -p "$(dirname "$PREFIX/{{ filename }}")"
-{%- if start == end %}
-touch "$PREFIX/{{ filename }}"
+{%- if internal_files and not streaming %}
+# the second binary payload: the files next to a onedir conda-standalone, as a tarball
+hash_start
+{%- if bootstrapper_codec %}
+extract_range "${boundary1}" "${boundary2}" | tee "$hash_fifo" | {{ bootstrapper_codec }} -dc | \
+    { tar -xf - -C "$PREFIX"; cat > /dev/null; }
 {%- else %}
-extract_range $(( boundary1 + {{ start }} )) $(( boundary1 + {{ end }} ))  > "$PREFIX/{{ filename }}"
+extract_range "${boundary1}" "${boundary2}" | tee "$hash_fifo" | \
+    { tar -xf - -C "$PREFIX"; cat > /dev/null; }
 {%- endif %}
-{%- if executable %}
-chmod +x "$PREFIX/{{ filename }}"
+hash_check "internal files" "{{ sha256_internal }}"
 {%- endif %}
-{%- endfor %}
 
 export TMP_BACKUP="${TMP:-}"
 export TMP="$PREFIX/install_tmp"
@@ -557,14 +725,42 @@ if [ "$(id -u)" -ne 0 ]; then
     touch "$PREFIX/.nonadmin"
 fi
 
-# the third binary payload: the tarball of packages
+{%- if not streaming %}
+
+# the third binary payload: the packages, in one or more tarballs extracted in parallel
+# shellcheck disable=SC2329  # invoked through run_job
+extract_packages () {
+    # Usage: extract_packages index first_byte last_byte_plus_1 expected_sha256
+    hash_fifo="$PREFIX/.payload-hash-$1.fifo"
+    hash_out="$PREFIX/.payload-hash-$1"
+    hash_start
+    # The pipeline ends with the status of the extraction, not that of 'cat'
+    extract_status=0
+    extract_range "$2" "$3" | tee "$hash_fifo" | {
+        status=0
+        CONDA_QUIET="$BATCH" "$CONDA_EXEC" constructor --extract-tarball --prefix "$PREFIX" \
+            || status=$?
+        cat > /dev/null
+        exit "$status"
+    } || extract_status=$?
+    hash_check "packages ($1)" "$4"
+    return "$extract_status"
+}
+
 printf "Unpacking payload...\n"
-extract_range "${boundary2}" "${boundary3}" | \
-    CONDA_QUIET="$BATCH" "$CONDA_EXEC" constructor --extract-tarball --prefix "$PREFIX"
+# created beforehand, so that concurrent extractions do not race to create it
+mkdir -p "$PREFIX/pkgs"
+{%- for segment in package_segments %}
+run_job extract_packages {{ loop.index0 }} "$(( {{ segment.start }} ))" "$(( {{ segment.end }} ))" "{{ segment.sha256 }}"
+{%- endfor %}
+if ! wait_jobs; then
+    printf "ERROR: could not extract the packages\n" >&2
+    exit 1
+fi
+{%- endif %}
 
-PRECONDA="$PREFIX/preconda.tar.bz2"
-CONDA_QUIET="$BATCH" \
-"$CONDA_EXEC" constructor --prefix "$PREFIX" --extract-tarball < "$PRECONDA" || exit 1
+PRECONDA="$PREFIX/preconda{{ payload_extension }}"
+extract_archive "$PRECONDA" || exit 1
 rm -f "$PRECONDA"
 
 CONDA_QUIET="$BATCH" \
@@ -671,9 +867,8 @@ for env_pkgs in "${PREFIX}"/pkgs/envs/*/; do
 done
 {%- endif %}
 
-POSTCONDA="$PREFIX/postconda.tar.bz2"
-CONDA_QUIET="$BATCH" \
-"$CONDA_EXEC" constructor --prefix "$PREFIX" --extract-tarball < "$POSTCONDA" || exit 1
+POSTCONDA="$PREFIX/postconda{{ payload_extension }}"
+extract_archive "$POSTCONDA" || exit 1
 rm -f "$POSTCONDA"
 rm -rf "$PREFIX/install_tmp"
 export TMP="$TMP_BACKUP"
@@ -871,5 +1066,8 @@ fi
 {%- endif %}
 
 exit 0
+{%- if streaming %}
+}
+{%- endif %}
 # shellcheck disable=SC2317
 @@END_HEADER@@
@@ -12,7 +12,7 @@ import sys
 from io import BytesIO
 from os.path import dirname, join
 from pathlib import Path
-from random import randint
+from random import Random
 
 from PIL import Image, ImageDraw, ImageFont
 
@@ -36,13 +36,14 @@ welcome_side_panel_width_msi = 164  # Width for branding area (matches EXE welco
 header_size_msi = (493, 58)
 
 
-def new_background(size, color, bs=20, boxes=50):
+def new_background(size, color, bs=20, boxes=50, seed=None):
+    rng = Random(seed)
     im = Image.new("RGB", size, color=color)
     d = ImageDraw.Draw(im)
     for unused in range(boxes):
-        x0 = randint(0, size[0] - bs)
-        y0 = randint(0, size[1] - bs)
-        c = tuple(randint(v - 10, v + 10) for v in color)
+        x0 = rng.randint(0, size[0] - bs)
+        y0 = rng.randint(0, size[1] - bs)
+        c = tuple(rng.randint(v - 10, v + 10) for v in color)
         d.rectangle((x0, y0, x0 + bs, y0 + bs), fill=c)
     return im
 
@@ -62,7 +63,7 @@ def add_text(im, xy, text, min_lines, line_height, font, color):
 
 def mk_welcome_image(info):
     font = ImageFont.truetype(BytesIO(ttf_bytes), 20)
-    im = new_background(welcome_size, info["_color"])
+    im = new_background(welcome_size, info["_color"], seed=info.get("_source_date_epoch"))
     text = "\n".join([info["welcome_image_text"], info["version"]])
     add_text(im, (20, 100), text, 2, 30, font, white)
     return im
@@ -88,7 +89,7 @@ def mk_header_image(info):
 
 def mk_icon_image(info):
     font = ImageFont.truetype(BytesIO(ttf_bytes), 200)
-    im = new_background(icon_size, info["_color"])
+    im = new_background(icon_size, info["_color"], seed=info.get("_source_date_epoch"))
     d = ImageDraw.Draw(im)
     d.text((60, 20), info["name"][0], fill=white, font=font)
     return im
@@ -17,6 +17,7 @@ import logging
 import os
 import subprocess
 import sys
+from contextlib import ExitStack
 from os.path import abspath, expanduser, isdir, join
 from pathlib import Path
 from tempfile import TemporaryDirectory
@@ -39,6 +40,7 @@ from .utils import (
     has_docker_buildx,
     identify_conda_exe,
     normalize_path,
+    source_date_epoch,
     yield_lines,
 )
 
@@ -228,6 +230,8 @@ def main_build(
     config_filename: str = "construct.yaml",
     debug: bool = False,
     installer_type: str | None = None,
+    solver: str | None = None,
+    fetch_only: bool = False,
 ):
     logger.info("platform: %s", platform)
     if not os.path.isfile(conda_exe):
@@ -246,16 +250,25 @@ def main_build(
     info["_output_dir"] = output_dir
     info["_platform"] = platform
     info["_download_dir"] = join(cache_dir, platform)
+    # noarch packages are shared by all platforms through a content-addressed store
+    info["_noarch_store_dir"] = join(cache_dir, "noarch")
+    # contents of the extracted packages, indexed once they are first used
+    info["_package_index_path"] = join(cache_dir, "packages.sqlite")
     info["_conda_exe"] = abspath(conda_exe)
     info["_debug"] = debug
+    info["_source_date_epoch"] = source_date_epoch()
     if installer_type:
         info["installer_type"] = installer_type
+    if solver:
+        info["solver"] = solver
+        for env_config in info.get("extra_envs", {}).values():
+            env_config.pop("solver", None)
     try:
         itypes = get_installer_type(info)
     except InvalidInstallerTypeError as e:
         sys.exit(f"Error: {e}")
 
-    if InstallerTypes.DOCKER in itypes:
+    if InstallerTypes.DOCKER in itypes and not fetch_only:
         if not info.get("docker_base_image"):
             sys.exit(
                 "Error: docker_base_image is required when building Docker artifacts. "
@@ -268,7 +281,8 @@ def main_build(
                 "generate the Dockerfile without building the portable image."
             )
     if (
-        platform != cc_platform
+        not fetch_only
+        and platform != cc_platform
         and InstallerTypes.PKG in itypes
         and not cc_platform.startswith("osx-")
     ):
@@ -431,6 +445,11 @@ def main_build(
     if dry_run:
         logger.info("Dry run, no installers or build outputs created.")
         return
+    if fetch_only:
+        logger.info(
+            "Packages for %s (%s) are cached in %s", dir_path, platform, info["_download_dir"]
+        )
+        return
 
     # info has keys
     # 'name', 'version', 'channels', 'exclude',
@@ -455,43 +474,62 @@ def main_build(
 
     os.makedirs(output_dir, exist_ok=True)
     info_dicts = []
-    for itype in itypes:
-        if itype == InstallerTypes.SH:
-            from .shar import create as shar_create
-
-            create = shar_create
-        elif itype == InstallerTypes.PKG:
-            from .osxpkg import create as osxpkg_create
-
-            create = osxpkg_create
-        elif itype == InstallerTypes.EXE:
-            from .winexe import create as winexe_create
+    with ExitStack() as stack:
+        if sum(itype != InstallerTypes.DOCKER for itype in itypes) > 1:
+            # The pre-conda files are the same for all installer types; prepare them once
+            # and let each installer hardlink them into its own workspace
+            from .preconda import prepare_workspace
+
+            preconda_dir = stack.enter_context(TemporaryDirectory(prefix="constructor-preconda-"))
+            prepare_workspace(info, preconda_dir)
+            info["_preconda_dir"] = preconda_dir
+
+        for itype in itypes:
+            if itype == InstallerTypes.SH:
+                from .shar import create as shar_create
+
+                create = shar_create
+            elif itype == InstallerTypes.PKG:
+                from .osxpkg import create as osxpkg_create
+
+                create = osxpkg_create
+            elif itype == InstallerTypes.EXE:
+                from .winexe import create as winexe_create
+
+                create = winexe_create
+            elif itype == InstallerTypes.MSI:
+                logger.warning(
+                    "MSI installer support is experimental and may change in future releases."
+                )
+                from .briefcase import create as briefcase_create
+
+                create = briefcase_create
+            elif itype == InstallerTypes.DOCKER:
+                from .docker_build import create as docker_create
+
+                create = docker_create
+            info["installer_type"] = itype
+            info["_outpath"] = abspath(join(output_dir, get_output_filename(info)))
+
+            create(info, verbose=verbose)
+            if itype in (InstallerTypes.EXE, InstallerTypes.PKG):
+                # SH installers embed their payload index instead
+                from .payload_index import write_index_sidecar
+
+                write_index_sidecar(info)
+            if len(itypes) > 1:
+                info_dicts.append(info.copy())
+            if itype == InstallerTypes.DOCKER:
+                logger.info(
+                    "Docker output complete. Docker directory: '%s'",
+                    Path(info["_output_dir"]),
+                )
+            else:
+                logger.info("Successfully created '%(_outpath)s'.", info)
 
-            create = winexe_create
-        elif itype == InstallerTypes.MSI:
-            logger.warning(
-                "MSI installer support is experimental and may change in future releases."
-            )
-            from .briefcase import create as briefcase_create
-
-            create = briefcase_create
-        elif itype == InstallerTypes.DOCKER:
-            from .docker_build import create as docker_create
-
-            create = docker_create
-        info["installer_type"] = itype
-        info["_outpath"] = abspath(join(output_dir, get_output_filename(info)))
-
-        create(info, verbose=verbose)
-        if len(itypes) > 1:
-            info_dicts.append(info.copy())
-        if itype == InstallerTypes.DOCKER:
-            logger.info(
-                "Docker output complete. Docker directory: '%s'",
-                Path(info["_output_dir"]),
-            )
-        else:
-            logger.info("Successfully created '%(_outpath)s'.", info)
+    info.pop("_preconda_dir", None)
+    for info_dict in info_dicts:
+        info_dict.pop("_preconda_dir", None)
 
     # Merge info files for each installer type
     if len(itypes) > 1:
@@ -568,7 +606,35 @@ class _HelpConstructAction(argparse.Action):
         )
 
 
+def resolve_conda_exe(parser: argparse.ArgumentParser, conda_exe: str | None, platform: str) -> str:
+    """Return the path of the standalone conda to use, or exit through ``parser``."""
+    conda_exe_default_path = os.path.join(sys.prefix, "standalone_conda", "conda.exe")
+    conda_exe_default_path = normalize_path(conda_exe_default_path)
+    if conda_exe:
+        conda_exe_path = normalize_path(os.path.abspath(conda_exe))
+    elif platform != cc_platform:
+        parser.error("setting --conda-exe is required for building a non-native installer")
+    else:
+        conda_exe_path = conda_exe_default_path
+    if not os.path.isfile(conda_exe_path):
+        if conda_exe_path != conda_exe_default_path:
+            parser.error("file not found: %s" % conda_exe)
+        parser.error(
+            """
+no standalone conda executable was found. The
+easiest way to obtain one is to install the 'conda-standalone' package.
+Alternatively, you can download an executable manually and supply its
+path with the --conda-exe argument. Self-contained executables can be
+downloaded from https://repo.anaconda.com/pkgs/misc/conda-execs/ and/or
+https://github.com/conda/conda-standalone/releases""".lstrip()
+        )
+    return conda_exe_path
+
+
 def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
     logging.basicConfig(level=logging.INFO)
     p = argparse.ArgumentParser(description="build an installer from <DIRECTORY>/construct.yaml")
 
@@ -653,6 +719,14 @@ def main(argv=None):
         choices=[str(t) for t in InstallerTypes],
     )
 
+    p.add_argument(
+        "--solver",
+        help="conda solver backend used to solve the environments (e.g. classic, libmamba); "
+        "overrides 'solver' from the config, including the per-env values.",
+        action="store",
+        metavar="NAME",
+    )
+
     p.add_argument(
         "dir_path",
         help="directory containing construct.yaml",
@@ -692,27 +766,7 @@ def main(argv=None):
         print(construct_render(full_config_path, platform=platform))
         return
 
-    conda_exe = args.conda_exe
-    conda_exe_default_path = os.path.join(sys.prefix, "standalone_conda", "conda.exe")
-    conda_exe_default_path = normalize_path(conda_exe_default_path)
-    if conda_exe:
-        conda_exe = normalize_path(os.path.abspath(conda_exe))
-    elif args.platform != cc_platform:
-        p.error("setting --conda-exe is required for building a non-native installer")
-    else:
-        conda_exe = conda_exe_default_path
-    if not os.path.isfile(conda_exe):
-        if conda_exe != conda_exe_default_path:
-            p.error("file not found: %s" % args.conda_exe)
-        p.error(
-            """
-no standalone conda executable was found. The
-easiest way to obtain one is to install the 'conda-standalone' package.
-Alternatively, you can download an executable manually and supply its
-path with the --conda-exe argument. Self-contained executables can be
-downloaded from https://repo.anaconda.com/pkgs/misc/conda-execs/ and/or
-https://github.com/conda/conda-standalone/releases""".lstrip()
-        )
+    conda_exe = resolve_conda_exe(p, args.conda_exe, args.platform)
 
     out_dir = normalize_path(args.output_dir)
     main_build(
@@ -726,6 +780,7 @@ https://github.com/conda/conda-standalone/releases""".lstrip()
         config_filename=args.config_filename,
         debug=args.debug,
         installer_type=args.installer_type,
+        solver=args.solver,
     )
 
 
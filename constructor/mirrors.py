@@ -0,0 +1,199 @@
+# (c) 2016 Anaconda, Inc. / https://anaconda.com
+# All Rights Reserved
+#
+# constructor is distributed under the terms of the BSD 3-clause license.
+# Consult LICENSE.txt or http://opensource.org/licenses/BSD-3-Clause.
+"""
+Build-time support for `mirrored_channels`.
+
+The mirrors of a channel (and the channel itself) are treated as equivalent sources.
+They are raced against each other before solving, the fastest one is used to solve
+and fetch, and the others are kept as fallbacks for metadata and package downloads.
+Whatever a mirror served is presented in the installer under the original channel
+URL, much like an implicit `channels_remap` entry.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .conda_interface import Channel, CondaSession, PackageRecord
+
+logger = logging.getLogger(__name__)
+
+#: Seconds to wait for a mirror to answer before considering it unavailable
+PROBE_TIMEOUT = 10
+
+
+def _base_urls(channel: str) -> list[str]:
+    """
+    Return the base URLs of ``channel``. Multi-channels like ``defaults`` have no base URL
+    of their own, but one for each of the channels they stand for.
+    """
+    channel = Channel(channel)
+    if channel.base_url:
+        return [channel.base_url.rstrip("/")]
+    urls = (url.rstrip("/").rsplit("/", 1)[0] for url in channel.urls(with_credentials=False))
+    return list(dict.fromkeys(urls))
+
+
+def _canonical(key: str, mirrors: list[str]) -> str:
+    """
+    Return the base URL the ``mirrors`` of the ``mirrored_channels`` entry ``key`` stand
+    in for. For a multi-channel, that is the member listed among its mirrors, if any.
+    """
+    base_urls = _base_urls(key)
+    return next((url for url in base_urls if url in mirrors), base_urls[0])
+
+
+def _probe(url: str, timeout: float) -> float:
+    """Return the number of seconds it took for ``url`` to start responding."""
+    start = time.monotonic()
+    with CondaSession().get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+    return time.monotonic() - start
+
+
+def rank_mirrors(urls: list[str], timeout: float = PROBE_TIMEOUT) -> list[str]:
+    """
+    Race a metadata request against each of the ``urls`` (channel base URLs) and return
+    them sorted from fastest to slowest. Unresponsive URLs are kept at the end, in their
+    original order, so they can still be tried as a last resort.
+    """
+    urls = list(dict.fromkeys(url.rstrip("/") for url in urls))
+    if len(urls) < 2:
+        return urls
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        futures = {
+            url: executor.submit(_probe, f"{url}/noarch/repodata.json", timeout) for url in urls
+        }
+    latencies = {}
+    for url, future in futures.items():
+        try:
+            latencies[url] = future.result()
+        except Exception as exc:
+            logger.warning("Mirror %s did not respond: %s", url, exc)
+        else:
+            logger.info("Mirror %s responded in %.3f s", url, latencies[url])
+    ranked = sorted(latencies, key=latencies.get)
+    return ranked + [url for url in urls if url not in latencies]
+
+
+def _find_mirrors(channel: str, mirrored_channels: dict[str, list[str]]) -> list[str] | None:
+    channel = channel.rstrip("/")
+    for key, mirrors in mirrored_channels.items():
+        mirrors = [mirror.rstrip("/") for mirror in mirrors]
+        canonical = _canonical(key, mirrors)
+        if channel in (key, *mirrors) or canonical in _base_urls(channel):
+            return [canonical, *mirrors]
+    return None
+
+
+def resolve_mirrors(
+    channels, mirrored_channels: dict[str, list[str]], timeout: float = PROBE_TIMEOUT
+) -> dict[str, list[str]]:
+    """
+    Return a mapping of the base URL of every mirrored channel found in ``channels`` to
+    the base URLs able to serve it (the channel itself included), fastest first.
+    """
+    mirrors = {}
+    if not mirrored_channels:
+        return mirrors
+    for channel in channels:
+        candidates = _find_mirrors(channel, mirrored_channels)
+        if candidates is None or candidates[0] in mirrors:
+            continue
+        ranked = rank_mirrors(candidates, timeout=timeout)
+        logger.info("Using %s for channel %s", ranked[0], candidates[0])
+        mirrors[candidates[0]] = ranked
+    return mirrors
+
+
+def apply_mirrors(channels, mirrors: dict[str, list[str]]) -> list[str]:
+    """
+    Replace each mirrored channel in ``channels`` with its fastest mirror. Multi-channels
+    with a mirrored member are expanded into their members.
+    """
+    if not mirrors:
+        return list(channels)
+    result = []
+    for channel in channels:
+        ranked = next(
+            (ranked for ranked in mirrors.values() if channel.rstrip("/") in ranked), None
+        )
+        if ranked is not None:
+            result.append(ranked[0])
+            continue
+        base_urls = _base_urls(channel)
+        if any(url in mirrors for url in base_urls):
+            result.extend(mirrors[url][0] if url in mirrors else url for url in base_urls)
+        else:
+            result.append(channel)
+    return result
+
+
+def mirror_of(url: str, mirrors: dict[str, list[str]]) -> tuple[str, str] | tuple[None, None]:
+    """Return the ``(canonical, mirror)`` base URLs ``url`` belongs to, if any."""
+    for canonical, ranked in (mirrors or {}).items():
+        for mirror in ranked:
+            if url == mirror or url.startswith(mirror + "/"):
+                return canonical, mirror
+    return None, None
+
+
+def canonical_url(url: str, mirrors: dict[str, list[str]]) -> str:
+    """Rewrite ``url`` so that it points at the channel its mirror stands in for."""
+    canonical, mirror = mirror_of(url, mirrors)
+    if mirror is None or mirror == canonical:
+        return url
+    return canonical + url[len(mirror) :]
+
+
+def next_mirror_url(url: str, mirrors: dict[str, list[str]]) -> str | None:
+    """Return ``url`` as served by the next mirror in line, or None if there is none."""
+    canonical, mirror = mirror_of(url, mirrors)
+    if mirror is None:
+        return None
+    ranked = mirrors[canonical]
+    index = ranked.index(mirror)
+    if index + 1 >= len(ranked):
+        return None
+    return ranked[index + 1] + url[len(mirror) :]
+
+
+def next_mirror_urls(urls, mirrors: dict[str, list[str]]) -> list[str] | None:
+    """
+    Return ``urls`` with the mirrored ones served by their next mirror, or None if none
+    of them has a mirror left.
+    """
+    next_urls = [next_mirror_url(url, mirrors) for url in urls]
+    if not any(next_urls):
+        return None
+    return [next_url or url for url, next_url in zip(urls, next_urls)]
+
+
+def switch_mirror(prec: PackageRecord, mirrors: dict[str, list[str]]) -> PackageRecord | None:
+    """Return a copy of ``prec`` downloaded from the next mirror, or None."""
+    url = next_mirror_url(prec.url, mirrors)
+    if url is None:
+        return None
+    _, mirror = mirror_of(url, mirrors)
+    logger.warning("Retrying %s from %s", prec.fn, mirror)
+    return PackageRecord.from_objects(prec, url=url, channel=Channel(mirror))
+
+
+def get_with_failover(fetch, url: str, mirrors: dict[str, list[str]]):
+    """
+    Call ``fetch(url)``, retrying with the next mirrors of ``url`` on errors.
+    """
+    while True:
+        try:
+            return fetch(url)
+        except Exception as exc:
+            next_url = next_mirror_url(url, mirrors)
+            if next_url is None:
+                raise
+            logger.warning("Fetching %s failed (%s); trying %s", url, exc, next_url)
+            url = next_url
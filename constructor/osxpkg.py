@@ -12,29 +12,28 @@ import xml.etree.ElementTree as ET
 from os.path import abspath, dirname, exists, isdir, join
 from pathlib import Path
 from plistlib import dump as plist_dump
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp
 
 from . import preconda
 from ._schema import InstallerTypes
 from .conda_interface import conda_context
 from .construct import ns_platform, parse
+from .context import BuildContext
 from .imaging import write_images
 from .jinja import render_template
 from .signing import CodeSign
 from .utils import (
     DEFAULT_REVERSE_DOMAIN_ID,
     approx_size_kb,
+    atomic_output,
     copy_conda_exe,
     explained_check_call,
     format_conda_exe_name,
-    get_final_channels,
-    parse_virtual_specs,
     rm_rf,
-    shortcuts_flags,
 )
 
 OSX_DIR = join(dirname(__file__), "osx")
-CACHE_DIR = PACKAGE_ROOT = PACKAGES_DIR = SCRIPTS_DIR = None
+CACHE_DIR = WORK_DIR = PACKAGE_ROOT = PACKAGES_DIR = PLUGINS_DIR = SCRIPTS_DIR = None
 
 logger = logging.getLogger(__name__)
 
@@ -82,13 +81,8 @@ def write_readme(dst, info):
     with open(dst, "w") as f:
         f.write(data)
 
-        all_dists = info["_dists"].copy()
-        for env_info in info.get("_extra_envs_info", {}).values():
-            all_dists += env_info["_dists"]
-        all_dists = list({dist: None for dist in all_dists})  # de-duplicate
-
         # TODO: Split output by env name
-        for dist in sorted(all_dists):
+        for dist in sorted(BuildContext.from_info(info).all_dists):
             if dist.startswith("_"):
                 continue
             f.write(
@@ -235,7 +229,7 @@ def modify_xml(xml_path, info):
 
     # -- __osx virtual package checks -- #
     # Reference: https://developer.apple.com/library/archive/documentation/DeveloperTools/Reference/DistributionDefinitionRef/Chapters/Distribution_XML_Ref.html
-    osx_versions = parse_virtual_specs(info).get("__osx")
+    osx_versions = BuildContext.from_info(info).virtual_specs.get("__osx")
     if osx_versions:
         if "min" not in osx_versions:
             raise ValueError("Specifying __osx requires a lower bound with `>=`")
@@ -394,12 +388,12 @@ def move_script(src, dst, info, ensure_shebang=False, user_script_type=None):
     variables["installer_name"] = info["name"]
     variables["installer_version"] = info["version"]
     variables["installer_platform"] = info["_platform"]
-    variables["final_channels"] = get_final_channels(info)
+    variables["final_channels"] = list(BuildContext.from_info(info).final_channels)
     variables["path_exists_error_text"] = path_exists_error_text
     variables["progress_notifications"] = info.get("progress_notifications", False)
     variables["pre_or_post"] = user_script_type or "__PRE_OR_POST__"
     variables["constructor_version"] = info["CONSTRUCTOR_VERSION"]
-    variables["shortcuts"] = shortcuts_flags(info)
+    variables["shortcuts"] = BuildContext.from_info(info).shortcuts_flags
     variables["enable_shortcuts"] = str(info["_enable_shortcuts"]).lower()
     variables["register_envs"] = str(info.get("register_envs", True)).lower()
     variables["virtual_specs"] = shlex.join(virtual_specs)
@@ -581,154 +575,162 @@ def create(info, verbose=False):
                     "installation! Aborting!"
                 )
 
-    global CACHE_DIR, PACKAGE_ROOT, PACKAGES_DIR, PLUGINS_DIR, SCRIPTS_DIR
+    global CACHE_DIR, WORK_DIR, PACKAGE_ROOT, PACKAGES_DIR, PLUGINS_DIR, SCRIPTS_DIR
 
     CACHE_DIR = info["_download_dir"]
-    SCRIPTS_DIR = join(CACHE_DIR, "scripts")
-    PACKAGE_ROOT = join(CACHE_DIR, "package_root")
-    PACKAGES_DIR = join(CACHE_DIR, "built_pkgs")
-    PLUGINS_DIR = join(CACHE_DIR, "plugins")
-
-    fresh_dir(PACKAGES_DIR)
-    prefix = join(PACKAGE_ROOT, info.get("pkg_name", info["name"]).lower())
-
-    # We need to split tasks in sub-PKGs so the GUI allows the user to enable/disable
-    # the ones marked as optional. Optionality is controlled in modify_xml() by
-    # patching the XML blocks corresponding to each sub-PKG name.
-    # See http://stackoverflow.com/a/11487658/161801 for how all this works.
-
-    # 1. Prepare installation
-    # The 'prepare_installation' package contains the prepopulated package cache, the modified
-    # conda-meta metadata staged into pkgs/conda-meta, _conda (conda-standalone, [--conda-exe]),
-    # Optionally, extra files and the user-provided scripts.
-    # We first populate PACKAGE_ROOT with everything needed, and then run pkg build on that dir
-    fresh_dir(PACKAGE_ROOT)
-    fresh_dir(SCRIPTS_DIR)
-    pkgs_dir = join(prefix, "pkgs")
-    os.makedirs(pkgs_dir)
-    preconda.write_files(info, prefix)
-    preconda.copy_extra_files(info.get("extra_files", []), prefix)
-
-    # Add potential license file
-    if license_file := info.get("license_file"):
-        preconda.copy_extra_files([license_file], prefix)
-    # These are the user-provided scripts, maybe patched to have a shebang
-    # They will be called by a wrapping script added later, if present
-    if info.get("pre_install"):
+    # Each build gets its own workspace so that builds sharing a cache do not clobber each other
+    WORK_DIR = mkdtemp(prefix="osxpkg-", dir=CACHE_DIR)
+    SCRIPTS_DIR = join(WORK_DIR, "scripts")
+    PACKAGE_ROOT = join(WORK_DIR, "package_root")
+    PACKAGES_DIR = join(WORK_DIR, "built_pkgs")
+    PLUGINS_DIR = join(WORK_DIR, "plugins")
+
+    try:
+        fresh_dir(PACKAGES_DIR)
+        prefix = join(PACKAGE_ROOT, info.get("pkg_name", info["name"]).lower())
+
+        # We need to split tasks in sub-PKGs so the GUI allows the user to enable/disable
+        # the ones marked as optional. Optionality is controlled in modify_xml() by
+        # patching the XML blocks corresponding to each sub-PKG name.
+        # See http://stackoverflow.com/a/11487658/161801 for how all this works.
+
+        # 1. Prepare installation
+        # The 'prepare_installation' package contains the prepopulated package cache, the modified
+        # conda-meta metadata staged into pkgs/conda-meta, _conda (conda-standalone, [--conda-exe]),
+        # Optionally, extra files and the user-provided scripts.
+        # We first populate PACKAGE_ROOT with everything needed, and then run pkg build on that dir
+        fresh_dir(PACKAGE_ROOT)
+        fresh_dir(SCRIPTS_DIR)
+        pkgs_dir = join(prefix, "pkgs")
+        os.makedirs(pkgs_dir)
+        preconda.write_files(info, prefix)
+        preconda.copy_extra_files(info.get("extra_files", []), prefix)
+
+        # Add potential license file
+        if license_file := info.get("license_file"):
+            preconda.copy_extra_files([license_file], prefix)
+        # These are the user-provided scripts, maybe patched to have a shebang
+        # They will be called by a wrapping script added later, if present
+        if info.get("pre_install"):
+            move_script(
+                abspath(info["pre_install"]),
+                abspath(join(pkgs_dir, "user_pre_install")),
+                info,
+                ensure_shebang=True,
+            )
+        if info.get("post_install"):
+            move_script(
+                abspath(info["post_install"]),
+                abspath(join(pkgs_dir, "user_post_install")),
+                info,
+                ensure_shebang=True,
+            )
+
+        for dist in BuildContext.from_info(info).all_dists:
+            os.link(join(CACHE_DIR, dist), join(pkgs_dir, dist))
+
+        exe_name = format_conda_exe_name(info["_conda_exe"])
+        copy_conda_exe(prefix, exe_name, info["_conda_exe"])
+
+        # Sign conda-standalone so it can pass notarization
+        codesigner = None
+        if notarization_identity_name := info.get("notarization_identity_name"):
+            codesigner = CodeSign(
+                notarization_identity_name,
+                prefix=info.get("reverse_domain_identifier", info["name"]),
+            )
+            sign_standalone_binary(Path(prefix, exe_name), codesigner)
+
+        # This script checks to see if the install location already exists and/or contains spaces
+        # Not to be confused with the user-provided pre_install!
         move_script(
-            abspath(info["pre_install"]),
-            abspath(join(pkgs_dir, "user_pre_install")),
-            info,
-            ensure_shebang=True,
+            join(OSX_DIR, "checks_before_install.sh"), join(SCRIPTS_DIR, "preinstall"), info
         )
-    if info.get("post_install"):
+        # This script populates the cache, mainly
         move_script(
-            abspath(info["post_install"]),
-            abspath(join(pkgs_dir, "user_post_install")),
-            info,
-            ensure_shebang=True,
-        )
-
-    all_dists = info["_dists"].copy()
-    for env_info in info.get("_extra_envs_info", {}).values():
-        all_dists += env_info["_dists"]
-    all_dists = list({dist: None for dist in all_dists})  # de-duplicate
-    for dist in all_dists:
-        os.link(join(CACHE_DIR, dist), join(pkgs_dir, dist))
-
-    exe_name = format_conda_exe_name(info["_conda_exe"])
-    copy_conda_exe(prefix, exe_name, info["_conda_exe"])
-
-    # Sign conda-standalone so it can pass notarization
-    codesigner = None
-    if notarization_identity_name := info.get("notarization_identity_name"):
-        codesigner = CodeSign(
-            notarization_identity_name, prefix=info.get("reverse_domain_identifier", info["name"])
+            join(OSX_DIR, "prepare_installation.sh"), join(SCRIPTS_DIR, "postinstall"), info
         )
-        sign_standalone_binary(Path(prefix, exe_name), codesigner)
-
-    # This script checks to see if the install location already exists and/or contains spaces
-    # Not to be confused with the user-provided pre_install!
-    move_script(join(OSX_DIR, "checks_before_install.sh"), join(SCRIPTS_DIR, "preinstall"), info)
-    # This script populates the cache, mainly
-    move_script(join(OSX_DIR, "prepare_installation.sh"), join(SCRIPTS_DIR, "postinstall"), info)
-    pkgbuild_prepare_installation(info)
-    names = ["prepare_installation"]
-
-    # 2. (Optional) Run user-provided pre-install script
-    # The preinstall script is run _after_ the tarballs have been extracted!
-    if info.get("pre_install"):
-        pkgbuild_script(
-            "user_pre_install", info, "run_user_script.sh", user_script_type="pre_install"
-        )
-        names.append("user_pre_install")
-
-    # pre-3. Enable or disable shortcuts creation
-    if info["_enable_shortcuts"] is True:
-        pkgbuild_script("shortcuts", info, "check_shortcuts.sh")
-        names.append("shortcuts")
-
-    # 3. Run the installation
-    # This script-only package will run conda to link and install the packages
-    pkgbuild_script("run_installation", info, "run_installation.sh")
-    names.append("run_installation")
-
-    # 4. The user-supplied post-install script
-    if info.get("post_install"):
-        pkgbuild_script(
-            "user_post_install", info, "run_user_script.sh", user_script_type="post_install"
-        )
-        names.append("user_post_install")
-
-    # 5. The script to run conda init
-    if info.get("_has_conda") and info.get("initialize_conda", "classic"):
-        pkgbuild_script("run_conda_init", info, "run_conda_init.sh")
-        names.append("run_conda_init")
-
-    # 6. The script to clear the package cache
-    if not info.get("keep_pkgs"):
-        pkgbuild_script("cacheclean", info, "clean_cache.sh")
-        names.append("cacheclean")
-
-    # The default distribution file needs to be modified, so we create
-    # it to a temporary location, edit it, and supply it to the final call.
-    xml_path = join(PACKAGES_DIR, "distribution.xml")
-    # hardcode to system location to avoid accidental clobber in PATH
-    args = ["/usr/bin/productbuild", "--synthesize"]
-    for name in names:
-        args.extend(["--package", join(PACKAGES_DIR, "%s.pkg" % name)])
-    args.append(xml_path)
-    explained_check_call(args)
-    modify_xml(xml_path, info)
-
-    if plugins := info.get("post_install_pages"):
-        create_plugins(plugins, codesigner=codesigner)
-
-    identity_name = info.get("signing_identity_name")
-    build_cmd = [
-        "/usr/bin/productbuild",
-        "--distribution",
-        xml_path,
-        "--package-path",
-        PACKAGES_DIR,
-        "--identifier",
-        info.get("reverse_domain_identifier", info["name"]),
-    ]
-    if plugins:
-        build_cmd.extend(["--plugins", PLUGINS_DIR])
-    build_cmd.append("tmp.pkg" if identity_name else info["_outpath"])
-    explained_check_call(build_cmd)
-    if identity_name:
-        explained_check_call(
-            [
-                # hardcode to system location to avoid accidental clobber in PATH
-                "/usr/bin/productsign",
-                "--sign",
-                identity_name,
-                "tmp.pkg",
-                info["_outpath"],
-            ]
-        )
-        os.unlink("tmp.pkg")
-
+        pkgbuild_prepare_installation(info)
+        names = ["prepare_installation"]
+
+        # 2. (Optional) Run user-provided pre-install script
+        # The preinstall script is run _after_ the tarballs have been extracted!
+        if info.get("pre_install"):
+            pkgbuild_script(
+                "user_pre_install", info, "run_user_script.sh", user_script_type="pre_install"
+            )
+            names.append("user_pre_install")
+
+        # pre-3. Enable or disable shortcuts creation
+        if info["_enable_shortcuts"] is True:
+            pkgbuild_script("shortcuts", info, "check_shortcuts.sh")
+            names.append("shortcuts")
+
+        # 3. Run the installation
+        # This script-only package will run conda to link and install the packages
+        pkgbuild_script("run_installation", info, "run_installation.sh")
+        names.append("run_installation")
+
+        # 4. The user-supplied post-install script
+        if info.get("post_install"):
+            pkgbuild_script(
+                "user_post_install", info, "run_user_script.sh", user_script_type="post_install"
+            )
+            names.append("user_post_install")
+
+        # 5. The script to run conda init
+        if info.get("_has_conda") and info.get("initialize_conda", "classic"):
+            pkgbuild_script("run_conda_init", info, "run_conda_init.sh")
+            names.append("run_conda_init")
+
+        # 6. The script to clear the package cache
+        if not info.get("keep_pkgs"):
+            pkgbuild_script("cacheclean", info, "clean_cache.sh")
+            names.append("cacheclean")
+
+        # The default distribution file needs to be modified, so we create
+        # it to a temporary location, edit it, and supply it to the final call.
+        xml_path = join(PACKAGES_DIR, "distribution.xml")
+        # hardcode to system location to avoid accidental clobber in PATH
+        args = ["/usr/bin/productbuild", "--synthesize"]
+        for name in names:
+            args.extend(["--package", join(PACKAGES_DIR, "%s.pkg" % name)])
+        args.append(xml_path)
+        explained_check_call(args)
+        modify_xml(xml_path, info)
+
+        if plugins := info.get("post_install_pages"):
+            create_plugins(plugins, codesigner=codesigner)
+
+        identity_name = info.get("signing_identity_name")
+        build_cmd = [
+            "/usr/bin/productbuild",
+            "--distribution",
+            xml_path,
+            "--package-path",
+            PACKAGES_DIR,
+            "--identifier",
+            info.get("reverse_domain_identifier", info["name"]),
+        ]
+        if plugins:
+            build_cmd.extend(["--plugins", PLUGINS_DIR])
+        with atomic_output(info["_outpath"]) as tmp_outpath:
+            unsigned_pkg = join(WORK_DIR, "tmp.pkg")
+            build_cmd.append(unsigned_pkg if identity_name else tmp_outpath)
+            explained_check_call(build_cmd)
+            if identity_name:
+                explained_check_call(
+                    [
+                        # hardcode to system location to avoid accidental clobber in PATH
+                        "/usr/bin/productsign",
+                        "--sign",
+                        identity_name,
+                        unsigned_pkg,
+                        tmp_outpath,
+                    ]
+                )
+                os.unlink(unsigned_pkg)
+    finally:
+        if not info.get("_debug"):
+            rm_rf(WORK_DIR)
     logger.info("done")
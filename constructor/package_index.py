@@ -0,0 +1,252 @@
+# (c) 2016 Anaconda, Inc. / https://anaconda.com
+# All Rights Reserved
+#
+# constructor is distributed under the terms of the BSD 3-clause license.
+# Consult LICENSE.txt or http://opensource.org/licenses/BSD-3-Clause.
+"""
+Persistent index of the contents of the extracted packages in the cache.
+
+The files (with their sizes), license files and record metadata of an extracted
+package are read once and stored in a SQLite database next to the package cache, with
+the total size and the longest path of each package. Later builds query the database
+instead of parsing `info/paths.json` and walking `info/licenses` again.
+An entry is refreshed whenever the metadata of the extracted package changes on disk.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from os.path import isdir, isfile, join, relpath
+
+from .conda_interface import read_paths_json
+
+logger = logging.getLogger(__name__)
+
+#: Bump when the layout of the tables changes; older databases are rebuilt
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    extracted_dir TEXT NOT NULL UNIQUE,
+    fn TEXT NOT NULL,
+    stamp TEXT NOT NULL,
+    name TEXT,
+    version TEXT,
+    build TEXT,
+    channel TEXT,
+    url TEXT,
+    md5 TEXT,
+    sha256 TEXT,
+    size INTEGER NOT NULL,
+    max_path_length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    package_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_package_id ON files (package_id);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+CREATE TABLE IF NOT EXISTS licenses (
+    package_id INTEGER NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS licenses_package_id ON licenses (package_id);
+"""
+_RECORD_FIELDS = ("name", "version", "build", "channel", "url", "md5", "sha256")
+
+
+def getsize(filename):
+    """Return the size of a file, reported by os.lstat as opposed to os.stat."""
+    # Symlinks might be reported as "not found" if they are provided by a
+    # package's dependencies
+    # We use lstat to obtain the size of the symlink, as opposed to the
+    # size of the file it points to
+    # From the docstring of the os.lstat function
+    #    > On platforms that do not support symbolic links, this is an
+    #    > alias for stat().
+    # https://github.com/conda/constructor/issues/311
+    # https://docs.python.org/3/library/os.html
+    return os.lstat(filename).st_size
+
+
+def _stamp(extracted_dir: str) -> str:
+    """Identify the current extraction of a package by its metadata files."""
+    parts = []
+    for name in ("paths.json", "files", "index.json", "repodata_record.json"):
+        path = join(extracted_dir, "info", name)
+        if isfile(path):
+            st = os.stat(path)
+            parts.append(f"{name}:{st.st_size}:{st.st_mtime_ns}")
+    return ";".join(parts)
+
+
+def package_files(extracted_dir: str) -> list[tuple[str, int]]:
+    """Read the ``(short_path, size)`` of each file in an extracted package."""
+    files = []
+    for path_data in read_paths_json(extracted_dir).paths:
+        short_path = path_data.path
+        size = getattr(path_data, "size_in_bytes", None) or getsize(join(extracted_dir, short_path))
+        files.append((short_path, size))
+    return files
+
+
+def package_record(extracted_dir: str) -> dict:
+    """
+    Read the record metadata of an extracted package from ``info/repodata_record.json``,
+    or from ``info/index.json`` if the package was not extracted by conda.
+    """
+    for name in ("repodata_record.json", "index.json"):
+        path = join(extracted_dir, "info", name)
+        if isfile(path):
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+            return {field: record.get(field) for field in _RECORD_FIELDS}
+    return dict.fromkeys(_RECORD_FIELDS)
+
+
+def package_license_files(extracted_dir: str) -> list[str]:
+    """Find the files under ``info/licenses`` in an extracted package (relative paths)."""
+    licenses_dir = join(extracted_dir, "info", "licenses")
+    if not isdir(licenses_dir):
+        return []
+    return [
+        relpath(join(directory, filename), extracted_dir)
+        for directory, _, filenames in os.walk(licenses_dir)
+        for filename in filenames
+    ]
+
+
+class PackageIndex:
+    """
+    SQLite-backed index of extracted packages, keyed by their extraction directory.
+    Use it as a context manager to close the database when done.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Concurrent builds sharing a cache wait for each other's writes. The default
+        # rollback journal is kept: WAL relies on shared memory, which is unreliable
+        # when the cache lives on a network filesystem. Transactions are explicit.
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with self._transaction():
+                # Another build may have rebuilt the tables while we waited for the lock
+                if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    for table in ("packages", "files", "licenses"):
+                        self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+                    for statement in _SCHEMA.split(";"):
+                        if statement.strip():
+                            self._conn.execute(statement)
+                    self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction holding the database lock from the start."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def __enter__(self) -> PackageIndex:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def _package_id(self, extracted_dir: str, fn: str = "") -> int:
+        extracted_dir = os.path.normpath(extracted_dir)
+        stamp = _stamp(extracted_dir)
+        row = self._conn.execute(
+            "SELECT id, stamp FROM packages WHERE extracted_dir = ?", (extracted_dir,)
+        ).fetchone()
+        if row is not None and row[1] == stamp:
+            return row[0]
+
+        logger.debug("Indexing %s", extracted_dir)
+        files = package_files(extracted_dir)
+        licenses = package_license_files(extracted_dir)
+        record = package_record(extracted_dir)
+        with self._transaction():
+            # Another build may have indexed the package since the first look
+            row = self._conn.execute(
+                "SELECT id, stamp FROM packages WHERE extracted_dir = ?", (extracted_dir,)
+            ).fetchone()
+            if row is not None and row[1] == stamp:
+                return row[0]
+            if row is not None:
+                for table in ("files", "licenses"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE package_id = ?", (row[0],))
+                self._conn.execute("DELETE FROM packages WHERE id = ?", (row[0],))
+            package_id = self._conn.execute(
+                f"INSERT INTO packages (extracted_dir, fn, stamp, {', '.join(_RECORD_FIELDS)},"
+                f" size, max_path_length) VALUES ({', '.join('?' * (len(_RECORD_FIELDS) + 5))})",
+                (
+                    extracted_dir,
+                    fn or os.path.basename(extracted_dir),
+                    stamp,
+                    *(record[field] for field in _RECORD_FIELDS),
+                    sum(size for _, size in files),
+                    max((len(path) for path, _ in files), default=0),
+                ),
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO files (package_id, path, size) VALUES (?, ?, ?)",
+                ((package_id, path, size) for path, size in files),
+            )
+            self._conn.executemany(
+                "INSERT INTO licenses (package_id, path) VALUES (?, ?)",
+                ((package_id, path) for path in licenses),
+            )
+        return package_id
+
+    def files(self, extracted_dir: str, fn: str = "") -> list[tuple[str, int]]:
+        """Return the ``(short_path, size)`` of each file in the package."""
+        package_id = self._package_id(extracted_dir, fn)
+        return self._conn.execute(
+            "SELECT path, size FROM files WHERE package_id = ? ORDER BY rowid", (package_id,)
+        ).fetchall()
+
+    def summary(self, extracted_dir: str, fn: str = "") -> tuple[int, int]:
+        """Return the total size of the files in the package and the length of its longest path."""
+        package_id = self._package_id(extracted_dir, fn)
+        return self._conn.execute(
+            "SELECT size, max_path_length FROM packages WHERE id = ?", (package_id,)
+        ).fetchone()
+
+    def record(self, extracted_dir: str, fn: str = "") -> dict:
+        """Return the record metadata of the package (name, version, channel, URL, hashes...)."""
+        package_id = self._package_id(extracted_dir, fn)
+        row = self._conn.execute(
+            f"SELECT {', '.join(_RECORD_FIELDS)} FROM packages WHERE id = ?", (package_id,)
+        ).fetchone()
+        return dict(zip(_RECORD_FIELDS, row))
+
+    def license_files(self, extracted_dir: str, fn: str = "") -> list[str]:
+        """Return the absolute paths of the files under ``info/licenses`` in the package."""
+        package_id = self._package_id(extracted_dir, fn)
+        rows = self._conn.execute(
+            "SELECT path FROM licenses WHERE package_id = ? ORDER BY rowid", (package_id,)
+        )
+        return [join(extracted_dir, path) for (path,) in rows]
+
+    def packages_with_file(self, short_path: str) -> list[str]:
+        """Return the filenames of the indexed packages that ship ``short_path``."""
+        rows = self._conn.execute(
+            "SELECT DISTINCT packages.fn FROM files JOIN packages ON packages.id = files.package_id"
+            " WHERE files.path = ? ORDER BY packages.fn",
+            (short_path,),
+        )
+        return [fn for (fn,) in rows]
@@ -0,0 +1,234 @@
+# (c) 2016 Anaconda, Inc. / https://anaconda.com
+# All Rights Reserved
+#
+# constructor is distributed under the terms of the BSD 3-clause license.
+# Consult LICENSE.txt or http://opensource.org/licenses/BSD-3-Clause.
+"""
+Machine-readable index of the payloads of an installer, and `constructor-inspect`.
+
+SH installers embed the index after their last payload; the header records where it
+starts. The index lists the segments of the installer (offset, size and SHA-256 of
+each) and the packages stored in them, with the offset of their bytes in the file.
+For the other installer types, the same index is written next to the installer as a
+``<installer>.index.json`` sidecar, with a single segment spanning the whole file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+from os.path import basename, getsize, isfile, join
+
+from .context import BuildContext
+from .utils import artifact_digests, dumps_json, filename_dist
+
+logger = logging.getLogger(__name__)
+
+#: Bump when the layout of the index changes in a way older readers cannot handle
+INDEX_VERSION = 1
+SIDECAR_SUFFIX = ".index.json"
+_COPY_BUFSIZE = 262144
+
+
+def installer_index(info, segments=(), packages=None) -> dict:
+    """
+    Build the index of the installer described by ``info``. ``segments`` are dicts with
+    the ``name``, ``offset``, ``size`` and ``sha256`` of each segment. ``packages`` are
+    dicts with the ``filename``, ``size`` and, if they can be read directly from the
+    installer, the ``segment`` and ``offset`` of each package; if not given, they are
+    taken from the download directory. The MD5 sums of the package files in the
+    download directory are added here, so transmuted packages get their own.
+    """
+    context = BuildContext.from_info(info)
+    download_dir = info["_download_dir"]
+    if packages is None:
+        packages = [
+            {"filename": fn, "size": getsize(join(download_dir, fn))}
+            for fn in map(filename_dist, context.all_dists)
+        ]
+    return {
+        "index_version": INDEX_VERSION,
+        "name": info["name"],
+        "version": info["version"],
+        "platform": info["_platform"],
+        "installer_type": str(info["installer_type"]),
+        "segments": list(segments),
+        "packages": [
+            {**package, "md5": artifact_digests(join(download_dir, package["filename"]))["md5"]}
+            for package in packages
+        ],
+    }
+
+
+def file_segment(path, name="installer") -> dict:
+    "Segment spanning the whole file at ``path``."
+    size = getsize(path)
+    with open(path, "rb") as f:
+        sha256 = _copy_range(f, 0, size)["sha256"]
+    return {"name": name, "offset": 0, "size": size, "sha256": sha256}
+
+
+def write_index_sidecar(info) -> str:
+    "Write the index of the installer at ``info['_outpath']`` next to it."
+    outpath = info["_outpath"] + SIDECAR_SUFFIX
+    index = installer_index(info, [file_segment(info["_outpath"])])
+    with open(outpath, "w", encoding="utf-8") as f:
+        f.write(dumps_json(index))
+    logger.info("Payload index: %s", outpath)
+    return outpath
+
+
+def read_index(path) -> dict:
+    """
+    Read the index of the installer at ``path``: the one embedded in a SH installer,
+    or else the ``.index.json`` sidecar next to it.
+    """
+    from .shar import read_header
+
+    try:
+        header = read_header(path)
+    except ValueError:
+        sidecar = path + SIDECAR_SUFFIX
+        if not isfile(sidecar):
+            raise ValueError(f"{path} has no embedded index and there is no {sidecar}")
+        with open(sidecar, encoding="utf-8") as f:
+            index = f.read()
+    else:
+        match = re.search(rb"^# PAYLOAD_INDEX: *(\d+) +(\d+)$", header, re.MULTILINE)
+        if not match:
+            raise ValueError(f"{path} was built without a payload index")
+        offset, size = map(int, match.groups())
+        with open(path, "rb") as f:
+            f.seek(offset)
+            index = f.read(size).decode("utf-8")
+    index = json.loads(index)
+    if index.get("index_version", 0) > INDEX_VERSION:
+        raise ValueError(
+            f"The index of {path} has version {index['index_version']}; "
+            f"this constructor reads up to version {INDEX_VERSION}"
+        )
+    return index
+
+
+def _copy_range(f, offset, size, out=None):
+    "Read ``size`` bytes at ``offset`` of ``f``, writing them to ``out``; return their hashes."
+    hashes = {"md5": hashlib.md5(), "sha256": hashlib.sha256()}
+    f.seek(offset)
+    while size > 0:
+        chunk = f.read(min(size, _COPY_BUFSIZE))
+        if not chunk:
+            break
+        size -= len(chunk)
+        for h in hashes.values():
+            h.update(chunk)
+        if out is not None:
+            out.write(chunk)
+    if size:
+        raise ValueError(f"{f.name} is truncated")
+    return {name: h.hexdigest() for name, h in hashes.items()}
+
+
+def verify_segments(path, index) -> list[str]:
+    "Return the names of the segments of the installer whose SHA-256 does not match."
+    mismatches = []
+    with open(path, "rb") as f:
+        for segment in index["segments"]:
+            digest = _copy_range(f, segment["offset"], segment["size"])["sha256"]
+            if digest != segment["sha256"]:
+                mismatches.append(segment["name"])
+    return mismatches
+
+
+def extract_package(path, index, filename, output_dir) -> str:
+    "Copy the package ``filename`` out of the installer into ``output_dir``."
+    package = next((pkg for pkg in index["packages"] if pkg["filename"] == filename), None)
+    if package is None:
+        raise ValueError(f"{filename} is not in {path}")
+    if "offset" not in package:
+        raise ValueError(f"The index of {path} does not record where {filename} is stored")
+    os.makedirs(output_dir, exist_ok=True)
+    outpath = join(output_dir, filename)
+    with open(path, "rb") as f, open(outpath, "wb") as out:
+        digests = _copy_range(f, package["offset"], package["size"], out)
+    if package.get("md5") and digests["md5"] != package["md5"]:
+        os.unlink(outpath)
+        raise ValueError(f"MD5 mismatch of {filename} in {path}")
+    return outpath
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser(
+        prog="constructor-inspect",
+        description="list the contents of a built <INSTALLER>, verify its payloads or "
+        "extract packages from it, using its payload index",
+    )
+    p.add_argument(
+        "--json",
+        action="store_true",
+        help="print the payload index as JSON",
+    )
+    p.add_argument(
+        "--verify",
+        action="store_true",
+        help="check the SHA-256 of each segment of the installer",
+    )
+    p.add_argument(
+        "--extract",
+        action="append",
+        default=[],
+        help="package filename to copy out of the installer; can be repeated",
+        metavar="FILENAME",
+    )
+    p.add_argument(
+        "--output-dir",
+        action="store",
+        default=os.getcwd(),
+        help=f"directory to extract packages to, defaults to CWD ('{os.getcwd()}')",
+        metavar="PATH",
+    )
+    p.add_argument("installer", help="SH, PKG or EXE installer", metavar="INSTALLER")
+    args = p.parse_args(argv)
+
+    if not isfile(args.installer):
+        p.error("no such file: %s" % args.installer)
+    try:
+        index = read_index(args.installer)
+    except ValueError as exc:
+        sys.exit(f"Error: {exc}")
+
+    if args.json:
+        print(dumps_json(index))
+    elif not (args.verify or args.extract):
+        print(
+            f"{index['name']} {index['version']} ({index['platform']}, {index['installer_type']})"
+        )
+        print("Segments:")
+        for segment in index["segments"]:
+            print(f"  {segment['name']:<16} {segment['offset']:>12} {segment['size']:>12}")
+        print(f"Packages ({len(index['packages'])}):")
+        for package in index["packages"]:
+            print(f"  {package['filename']:<60} {package['size']:>12}")
+
+    if args.verify:
+        mismatches = verify_segments(args.installer, index)
+        if mismatches:
+            sys.exit(
+                f"Error: SHA-256 mismatch of {', '.join(mismatches)} in {basename(args.installer)}"
+            )
+        logger.info("All %d segments match their SHA-256", len(index["segments"]))
+    for filename in args.extract:
+        try:
+            outpath = extract_package(args.installer, index, filename, args.output_dir)
+        except ValueError as exc:
+            sys.exit(f"Error: {exc}")
+        logger.info("Extracted %s", outpath)
+
+
+if __name__ == "__main__":
+    main()
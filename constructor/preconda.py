@@ -14,6 +14,7 @@ import platform
 import shutil
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from os.path import isdir, join
 from os.path import split as path_split
 from pathlib import Path
@@ -29,15 +30,20 @@ from .conda_interface import (
     all_channel_urls,
     default_prefix,
     get_repodata,
+    repodata_keep_filenames,
     write_repodata,
 )
 from .conda_interface import distro as conda_distro
+from .context import BuildContext
+from .mirrors import apply_mirrors, get_with_failover, mirror_of
 from .utils import (
+    ChannelRemap,
+    dumps_json,
     ensure_transmuted_ext,
     filename_dist,
     get_condarc_content,
     get_final_channels,
-    get_final_url,
+    hardlink_or_copy,
     shortcuts_flags,
 )
 
@@ -57,6 +63,9 @@ files = (
     "conda-meta/initial-state.explicit.txt",
 )
 
+#: Maximum number of repodata indexes fetched concurrently by `write_index_cache`
+REPODATA_FETCH_WORKERS = 8
+
 
 def write_index_cache(info: dict, dst_dir: str, used_packages: list[str]):
     cache_dir = join(dst_dir, "cache")
@@ -72,20 +81,50 @@ def write_index_cache(info: dict, dst_dir: str, used_packages: list[str]):
         _env_channels += env_info.get("channels", [])
 
     _remaps = {url["src"].rstrip("/"): url["dest"].rstrip("/") for url in _remap_configs}
+    _mirrors = info.get("_mirrors", {})
+    all_urls = BuildContext.from_info(info).all_urls
+    # Repodata of mirrored channels comes from the fastest mirror, and from whichever
+    # fallback mirrors served packages; it is cached under the original channel URL
+    for canonical, ranked in _mirrors.items():
+        if ranked[0] != canonical:
+            _remaps[ranked[0]] = canonical
+    for url, _ in all_urls:
+        canonical, mirror = mirror_of(url, _mirrors)
+        if mirror is not None and mirror != canonical:
+            _remaps[mirror] = canonical
     _channels = [
         url.rstrip("/")
         for url in list(_remaps)
-        + info.get("channels", [])
-        + info.get("conda_default_channels", [])
-        + _env_channels
+        + apply_mirrors(
+            info.get("channels", []) + info.get("conda_default_channels", []) + _env_channels,
+            _mirrors,
+        )
     ]
-    _urls = all_channel_urls(_channels, subdirs=_platforms)
-    repodatas = {url: get_repodata(url) for url in _urls if url is not None}
-
-    all_urls = info["_urls"].copy()
-    for env_info in info.get("_extra_envs_info", {}).values():
-        all_urls += env_info["_urls"]
-
+    _urls = [url for url in all_channel_urls(_channels, subdirs=_platforms) if url is not None]
+    # Only the package entries written below are kept, and the subdirs are fetched
+    # concurrently; each full index is discarded as soon as it has been trimmed
+    keep = repodata_keep_filenames(
+        [*used_packages, *(url.rsplit("/", 1)[-1] for url, _ in all_urls)]
+    )
+
+    fetch_repodata = get_repodata
+    if info.get("_repodata_session") is not None:
+        fetch_repodata = info["_repodata_session"].get_repodata
+
+    def fetch(url):
+        return get_with_failover(lambda u: fetch_repodata(u, keep=keep), url, _mirrors)
+
+    with ThreadPoolExecutor(max_workers=min(REPODATA_FETCH_WORKERS, len(_urls) or 1)) as pool:
+        repodatas = dict(zip(_urls, pool.map(fetch, _urls)))
+
+    for canonical, ranked in _mirrors.items():
+        if ranked[0] == canonical:
+            continue
+        for subdir in _platforms:
+            src = "%s/%s" % (ranked[0], subdir)
+            dst = "%s/%s" % (canonical, subdir)
+            if repodatas.get(src) is not None:
+                repodatas[dst] = {**repodatas[src], "_url": dst}
     for url, _ in all_urls:
         src, subdir, fn = url.rsplit("/", 2)
         dst = _remaps.get(src)
@@ -115,7 +154,11 @@ def write_index_cache(info: dict, dst_dir: str, used_packages: list[str]):
             os.unlink(join(cache_dir, cache_file))
 
 
-def system_info():
+def system_info(reproducible: bool = False):
+    """
+    Describe the build tools and the machine they run on. For reproducible builds, only
+    the versions of the tools are kept, since the rest differs between build hosts.
+    """
     out = {
         "constructor": CONSTRUCTOR_VERSION,
         "conda": CONDA_INTERFACE_VERSION,
@@ -139,6 +182,12 @@ def system_info():
         nsis_prefix_rec = next((rec for rec in prefix_records if rec.name == "nsis"), None)
         if nsis_prefix_rec:
             out["nsis"] = nsis_prefix_rec.version
+    if reproducible:
+        out = {
+            key: value
+            for key, value in out.items()
+            if key in ("constructor", "conda", "python_version", "nsis")
+        }
     return out
 
 
@@ -160,13 +209,20 @@ def write_files(info: dict, workspace: str):
     - Their corresponding `envs/<env-name>/conda-meta/` files.
     - Their corresponding `pkgs/channels.txt` and `pkgs/shortcuts.txt` under
       `pkgs/envs/<env-name>`.
+
+    If the files were already prepared for this build with `prepare_workspace` (see
+    `info["_preconda_dir"]`), they are hardlinked from there instead of being recomputed;
+    only `.installer.info`, which depends on the installer type, is written every time.
     """
-    os.makedirs(join(workspace, "conda-meta"), exist_ok=True)
-    pkgs_dir = join(workspace, "pkgs")
-    os.makedirs(pkgs_dir, exist_ok=True)
-    with open(join(pkgs_dir, ".constructor-build.info"), "w") as fo:
-        json.dump(system_info(), fo)
+    shared_dir = info.get("_preconda_dir")
+    if shared_dir:
+        shutil.copytree(shared_dir, workspace, copy_function=hardlink_or_copy, dirs_exist_ok=True)
+    else:
+        prepare_workspace(info, workspace)
+    write_installer_info(info, workspace)
+
 
+def write_installer_info(info: dict, workspace: str):
     out = {
         "name": info.get("name"),
         "version": info.get("version"),
@@ -175,13 +231,31 @@ def write_files(info: dict, workspace: str):
     }
     with open(join(workspace, ".installer.info"), "w") as fo:
         json.dump(out, fo)
+    os.chmod(join(workspace, ".installer.info"), 0o664)
 
-    all_urls = info["_urls"].copy()
-    for env_info in info.get("_extra_envs_info", {}).values():
-        all_urls += env_info["_urls"]
 
-    final_urls_md5s = tuple((get_final_url(info, url), md5) for url, md5 in info["_urls"])
-    all_final_urls_md5s = tuple((get_final_url(info, url), md5) for url, md5 in all_urls)
+def prepare_workspace(info: dict, workspace: str):
+    """
+    Write the pre-conda files that do not depend on the installer type (everything
+    `write_files` writes, except `.installer.info`) to ``workspace``.
+
+    Multi-type builds call this once and share the result across installer types;
+    the files must not be modified in place afterwards since they are hardlinked.
+    """
+    os.makedirs(join(workspace, "conda-meta"), exist_ok=True)
+    pkgs_dir = join(workspace, "pkgs")
+    os.makedirs(pkgs_dir, exist_ok=True)
+    with open(join(pkgs_dir, ".constructor-build.info"), "w") as fo:
+        json.dump(system_info(reproducible=info.get("_source_date_epoch") is not None), fo)
+
+    context = BuildContext.from_info(info)
+    all_urls = context.all_urls
+
+    remap = ChannelRemap.from_info(info)
+    all_final_urls_md5s = tuple(
+        zip(remap.final_urls(url for url, _ in all_urls), (md5 for _, md5 in all_urls))
+    )
+    final_urls_md5s = all_final_urls_md5s[: len(info["_urls"])]
 
     with open(join(pkgs_dir, "urls"), "w") as fo:
         for url, md5 in all_final_urls_md5s:
@@ -195,12 +269,7 @@ def write_files(info: dict, workspace: str):
         for url, _ in all_final_urls_md5s:
             fo.write("%s\n" % url)
 
-    all_dists = info["_dists"].copy()
-    for env_info in info.get("_extra_envs_info", {}).values():
-        all_dists += env_info["_dists"]
-    all_dists = list({dist: None for dist in all_dists})  # de-duplicate
-
-    write_index_cache(info, pkgs_dir, all_dists)
+    write_index_cache(info, pkgs_dir, context.all_dists)
 
     # base environment conda-meta
     write_conda_meta(info, join(workspace, "conda-meta"), final_urls_md5s)
@@ -218,7 +287,8 @@ def write_files(info: dict, workspace: str):
     write_condarc(info, workspace)
 
     for fn in files:
-        os.chmod(join(workspace, fn), 0o664)
+        if fn != ".installer.info":
+            os.chmod(join(workspace, fn), 0o664)
 
     for env_name, env_info in info.get("_extra_envs_info", {}).items():
         env_config = info["extra_envs"][env_name]
@@ -227,7 +297,7 @@ def write_files(info: dict, workspace: str):
         os.makedirs(env_pkgs, exist_ok=True)
         os.makedirs(env_conda_meta, exist_ok=True)
         # environment conda-meta
-        env_urls_md5 = tuple((get_final_url(info, url), md5) for url, md5 in env_info["_urls"])
+        env_urls_md5 = tuple((remap.final_url(url), md5) for url, md5 in env_info["_urls"])
         user_requested_specs = env_config.get("user_requested_specs", env_config.get("specs", ()))
         write_conda_meta(info, env_conda_meta, env_urls_md5, user_requested_specs)
         # environment installation list
@@ -250,11 +320,17 @@ def write_conda_meta(
         user_requested_specs = info.get("user_requested_specs", info.get("specs", ()))
 
     cmd = path_split(sys.argv[0])[-1]
-    if len(sys.argv) > 1:
-        cmd = "%s %s" % (cmd, " ".join(sys.argv[1:]))
+    epoch = info.get("_source_date_epoch")
+    if epoch is None:
+        if len(sys.argv) > 1:
+            cmd = "%s %s" % (cmd, " ".join(sys.argv[1:]))
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        # Reproducible builds: the arguments contain paths specific to the build machine
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
 
     builder = [
-        "==> %s <==" % time.strftime("%Y-%m-%d %H:%M:%S"),
+        "==> %s <==" % timestamp,
         "# cmd: %s" % cmd,
     ]
     dists = tuple(Dist(url) for url, _ in final_urls_md5s)
@@ -278,10 +354,9 @@ def write_frozen(freeze_info: dict | None, dst_dir: str):
 
 
 def write_repodata_record(info: dict, dst_dir: str):
-    all_dists = info["_dists"].copy()
-    for env_data in info.get("_extra_envs_info", {}).values():
-        all_dists += env_data["_dists"]
-    for dist in all_dists:
+    compact = info.get("compact_metadata", False)
+    remap = ChannelRemap.from_info(info)
+    for dist in BuildContext.from_info(info).all_dists:
         if filename_dist(dist).endswith(".conda"):
             _dist = filename_dist(dist)[:-6]
         elif filename_dist(dist).endswith(".tar.bz2"):
@@ -292,16 +367,16 @@ def write_repodata_record(info: dict, dst_dir: str):
         with open(record_file_src) as rf:
             rr_json = json.load(rf)
 
-        rr_json["url"] = get_final_url(info, rr_json["url"])
-        rr_json["channel"] = get_final_url(info, rr_json["channel"])
+        rr_json["url"] = remap.final_url(rr_json["url"])
+        rr_json["channel"] = remap.final_url(rr_json["channel"])
 
         if not isdir(join(dst_dir, _dist, "info")):
             os.makedirs(join(dst_dir, _dist, "info"))
 
         record_file_dest = join(dst_dir, record_file)
 
-        with open(record_file_dest, "w") as rf:
-            json.dump(rr_json, rf, indent=2, sort_keys=True)
+        with open(record_file_dest, "w", encoding="utf-8") as rf:
+            rf.write(dumps_json(rr_json, compact=compact, sort_keys=True))
 
 
 def write_initial_state_explicit_txt(info: dict, dst_dir: str, urls: tuple[str, str]):
@@ -359,6 +434,12 @@ def write_condarc(info: dict, dst_dir: str):
         f.write(condarc)
 
 
+def _unlink_shared(path: Path):
+    # Files hardlinked from a shared workspace must be replaced, not written through
+    if path.is_file() and path.stat().st_nlink > 1:
+        path.unlink()
+
+
 def copy_extra_files(
     extra_files: list[os.PathLike | Mapping], workdir: os.PathLike
 ) -> list[os.PathLike]:
@@ -387,6 +468,7 @@ def copy_extra_files(
     for path in extra_files:
         if isinstance(path, str):
             orig_path = validate_file_path(path)
+            _unlink_shared(Path(workdir) / orig_path.name)
             copied.append(shutil.copy(orig_path, workdir))
         elif isinstance(path, dict):
             assert len(path) == 1
@@ -394,5 +476,6 @@ def copy_extra_files(
             orig_path = validate_file_path(origin)
             dest_path = Path(workdir) / destination
             dest_path.parent.mkdir(parents=True, exist_ok=True)
+            _unlink_shared(dest_path)
             copied.append(shutil.copy(orig_path, dest_path))
     return copied
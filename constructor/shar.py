@@ -9,34 +9,46 @@ Logic to build the SH installers for Linux and macOS.
 shar = SHell ARchive.
 """
 
+import bz2
+import gzip
+import hashlib
 import logging
+import lzma
 import os
+import re
 import shlex
 import shutil
 import stat
+import subprocess
+import sys
 import tarfile
 import tempfile
 from contextlib import nullcontext
-from io import BytesIO
 from os.path import basename, dirname, getsize, isdir, join, relpath
 
 from .construct import ns_platform
+from .context import BuildContext
 from .jinja import render_template
+from .payload_index import installer_index
 from .preconda import copy_extra_files
 from .preconda import files as preconda_files
 from .preconda import write_files as preconda_write_files
 from .utils import (
     approx_size_kb,
+    atomic_output,
     copy_conda_exe,
+    dumps_json,
     filename_dist,
     format_conda_exe_name,
-    get_final_channels,
-    hash_files,
-    parse_virtual_specs,
     read_ascii_only,
-    shortcuts_flags,
+    reproducible_tar_filter,
 )
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 THIS_DIR = dirname(__file__)
 
 logger = logging.getLogger(__name__)
@@ -52,6 +64,124 @@ def make_executable(tarinfo):
     return tarinfo
 
 
+#: Payloads start at multiples of this size, so that the header can read them with
+#: a single large-block `dd` call
+PAYLOAD_BLOCK_SIZE = 65536
+COPY_BUFSIZE = 262144
+
+#: File extension of the preconda/postconda archives for each `payload_compression` codec
+PAYLOAD_EXTENSIONS = {
+    "none": ".tar",
+    "bz2": ".tar.bz2",
+    "gzip": ".tar.gz",
+    "xz": ".tar.xz",
+    "zstd": ".tar.zst",
+}
+
+#: Suffix of the conda executable compressed with each `bootstrapper_compression` codec
+BOOTSTRAPPER_EXTENSIONS = {"gzip": ".gz", "xz": ".xz"}
+
+
+def payload_compression(info) -> tuple[str, int | None, int | None]:
+    "Return the ``(codec, level, threads)`` set by the `payload_compression` key."
+    value = info.get("payload_compression") or "bz2"
+    if isinstance(value, str):
+        value = {"codec": value}
+    codec = value.get("codec") or "bz2"
+    if codec not in PAYLOAD_EXTENSIONS:
+        sys.exit(f"Error: unknown payload_compression codec '{codec}'")
+    return codec, value.get("level"), value.get("threads")
+
+
+def _compression_command(codec, level=None, threads=None):
+    """
+    Command line of the external tool that compresses with ``codec``, or None to
+    compress in-process. Tools are only needed for multi-threaded xz, and for zstd
+    when the `zstandard` package is not installed.
+    """
+    if codec == "zstd":
+        if zstandard is not None:
+            return None
+    elif codec != "xz" or threads in (None, 1):
+        return None
+    tool = shutil.which(codec)
+    if tool is None:
+        if codec == "zstd":
+            sys.exit(
+                "Error: payload_compression 'zstd' needs the 'zstandard' Python package "
+                "or the 'zstd' tool."
+            )
+        logger.warning("'xz' not found; compressing the payload with a single thread.")
+        return None
+    cmd = [tool, "-c", f"-T{1 if threads is None else threads}"]
+    if level is not None:
+        if codec == "zstd" and level > 19:
+            cmd.append("--ultra")
+        cmd.append(f"-{level}")
+    if codec == "zstd":
+        cmd.append("-q")
+    return cmd
+
+
+def compress_payload(path, codec, level=None, threads=None, mtime=None):
+    """
+    Compress the tarball ``path`` with ``codec`` and return the path of the compressed
+    file, which replaces the tarball. ``mtime`` is stored in gzip headers.
+    """
+    if codec == "none":
+        return path
+    compressed = path + PAYLOAD_EXTENSIONS[codec][len(".tar") :]
+    cmd = _compression_command(codec, level, threads)
+    logger.info("Compressing %s with %s", basename(path), codec)
+    with open(path, "rb") as fi:
+        if cmd:
+            with open(compressed, "wb") as fo:
+                subprocess.run(cmd, stdin=fi, stdout=fo, check=True)
+        elif codec == "zstd":
+            # zstandard uses -1 for one thread per CPU core, and 0 for no worker threads
+            cctx = zstandard.ZstdCompressor(
+                level=3 if level is None else level,
+                threads=-1 if threads == 0 else threads or 0,
+            )
+            with open(compressed, "wb") as fo:
+                cctx.copy_stream(fi, fo)
+        else:
+            with open(compressed, "wb") as fo, compressed_writer(fo, codec, level, mtime) as fz:
+                shutil.copyfileobj(fi, fz, COPY_BUFSIZE)
+    os.unlink(path)
+    return compressed
+
+
+def compressed_writer(fileobj, codec, level=None, mtime=None):
+    "Return a file object that writes data compressed with ``codec`` (gzip, bz2, xz) to ``fileobj``."
+    if codec == "gzip":
+        compresslevel = 9 if level is None else level
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=compresslevel, mtime=mtime)
+    if codec == "bz2":
+        return bz2.BZ2File(fileobj, "wb", compresslevel=9 if level is None else level)
+    if codec == "xz":
+        return lzma.LZMAFile(fileobj, "wb", preset=level)
+    raise ValueError(f"Unsupported codec: {codec}")
+
+
+def compress_bootstrapper(conda_exec, codec, tmp_dir, mtime=None):
+    """
+    Compress the conda executable with ``codec``. Return the path of the file to store
+    and the codec used, which is empty if compression does not make it smaller.
+    """
+    compressed_exec = join(tmp_dir, basename(conda_exec) + BOOTSTRAPPER_EXTENSIONS[codec])
+    with open(conda_exec, "rb") as fi, open(compressed_exec, "wb") as fo:
+        with compressed_writer(fo, codec, mtime=mtime) as fz:
+            shutil.copyfileobj(fi, fz, COPY_BUFSIZE)
+    raw_size = getsize(conda_exec)
+    size = getsize(compressed_exec)
+    if size >= raw_size:
+        logger.info("Compressing the bootstrapper does not make it smaller; storing it as is")
+        return conda_exec, ""
+    logger.info("Compressed the bootstrapper with %s: %d -> %d bytes", codec, raw_size, size)
+    return compressed_exec, codec
+
+
 def read_header_template():
     path = join(THIS_DIR, "header.sh")
     logger.info("Reading: %s", path)
@@ -59,8 +189,111 @@ def read_header_template():
         return fi.read()
 
 
-def get_header(conda_exec, tarball, info):
+class HashingWriter:
+    "Write-only file object that updates ``hasher`` with everything written through it."
+
+    def __init__(self, fileobj, hasher):
+        self.fileobj = fileobj
+        self.hasher = hasher
+        self.size = 0
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+def header_placeholder(key: str) -> str:
+    """
+    Fixed-width stand-in rendered in the header for a value that is only known once the
+    payloads are written: a SHA-256 digest (``sha256_*`` keys) or a number.
+    """
+    width = 64 if key.startswith("sha256_") else 20
+    placeholder = f"@@{key.upper()}@@"
+    assert len(placeholder) <= width, key
+    return placeholder.ljust(width, "@")
+
+
+def fill_header(header: bytes, **values) -> bytes:
+    """
+    Replace the placeholders rendered by `get_header` with their final values, given
+    by key (see `header_placeholder`). Numbers are right-aligned to keep the size.
+    """
+    filled = header
+    for key, value in values.items():
+        placeholder = header_placeholder(key)
+        filled = filled.replace(placeholder.encode(), str(value).rjust(len(placeholder)).encode())
+    assert len(filled) == len(header)
+    return filled
+
+
+def split_segments(filenames, sizes, n):
+    """
+    Split ``filenames`` in at most ``n`` groups of similar total size: the largest files
+    are assigned first, each to the smallest group so far. Each group keeps the order
+    of ``filenames``.
+    """
+    n = max(1, min(n, len(filenames)))
+    totals = [0] * n
+    assignment = {}
+    for fn in sorted(filenames, key=lambda fn: (-sizes[fn], fn)):
+        i = totals.index(min(totals))
+        assignment[fn] = i
+        totals[i] += sizes[fn]
+    return [[fn for fn in filenames if assignment[fn] == i] for i in range(n)]
+
+
+def _padding(size: int) -> int:
+    "Number of zero bytes that align a payload of ``size`` bytes to `PAYLOAD_BLOCK_SIZE`."
+    return -size % PAYLOAD_BLOCK_SIZE
+
+
+def read_header(path) -> bytes:
+    """
+    Read the beginning of the SH installer at ``path``, up to the end of its header
+    at least. Raise `ValueError` if it is not a SH installer.
+    """
+    header = b""
+    with open(path, "rb") as f:
+        while b"\n@@END_HEADER@@\n" not in header:
+            chunk = f.read(COPY_BUFSIZE)
+            if not chunk or not (header + chunk).startswith(b"#!"):
+                raise ValueError(f"{path} is not a SH installer")
+            header += chunk
+    return header
+
+
+def read_payload_offsets(path) -> tuple[int, ...]:
+    """
+    Return the offsets of the payloads embedded in the header of the SH installer at
+    ``path``: the start of the conda executable, of the internal files and of the
+    packages, and the end of the packages, where the payload index starts. Each payload
+    is followed by zero padding up to the start of the next one.
+    """
+    header = read_header(path)
+    offsets = dict(re.findall(rb"^boundary(\d)=\$\(\( *(\d+) \)\)$", header, re.MULTILINE))
+    if len(offsets) < 4:
+        raise ValueError(f"{path} does not use the seekable payload layout")
+    return tuple(int(offsets[str(i).encode()]) for i in range(4))
+
+
+def get_header(info, internal_files=False, bootstrapper_codec="", package_segments=1):
+    """
+    Render the header of the installer. The digests and the offsets of the payloads
+    are not known yet; `fill_header` replaces their placeholders later. The conda
+    executable is stored compressed with ``bootstrapper_codec`` if set, and
+    ``internal_files`` tells whether the files of a onedir conda-standalone follow it.
+    The packages are split in ``package_segments`` tarballs. With the streaming
+    ``payload_layout``, all of them are stored in a single tarball instead.
+    """
     name = info["name"]
+    context = BuildContext.from_info(info)
 
     has_license = bool(info.get("license_file"))
     variables = ns_platform(info["_platform"])
@@ -89,16 +322,39 @@ def get_header(conda_exec, tarball, info):
     variables["installer_name"] = name
     variables["installer_version"] = info["version"]
     variables["installer_platform"] = info["_platform"]
-    variables["installer_md5"] = hash_files([conda_exec, *info["_internal_conda_files"], tarball])
     variables["default_prefix"] = info.get("default_prefix", "${HOME:-/opt}/%s" % name.lower())
-    variables["first_payload_size"] = getsize(conda_exec)
-    variables["second_payload_size"] = getsize(tarball)
-    variables["conda_exe_payloads"] = info.get("_conda_exe_payloads", {})
-    variables["conda_exe_payloads_size"] = info.get("_conda_exe_payloads_size", 0)
-    variables["final_channels"] = get_final_channels(info)
+    for key in (
+        "boundary0",
+        "boundary1",
+        "boundary2",
+        "boundary3",
+        "conda_exe_size",
+        "sha256_bootstrapper",
+        "sha256_internal",
+        "index_offset",
+        "index_size",
+        "sha256_stream",
+    ):
+        variables[key] = header_placeholder(key)
+    variables["package_segments"] = [
+        {
+            "start": header_placeholder(f"segment{i}"),
+            "end": header_placeholder(
+                f"segment{i + 1}" if i + 1 < package_segments else "boundary3"
+            ),
+            "sha256": header_placeholder(f"sha256_packages{i}"),
+        }
+        for i in range(package_segments)
+    ]
+    variables["payload_block_size"] = PAYLOAD_BLOCK_SIZE
+    variables["internal_files"] = internal_files
+    variables["bootstrapper_codec"] = bootstrapper_codec
+    variables["bootstrapper_extension"] = BOOTSTRAPPER_EXTENSIONS.get(bootstrapper_codec, "")
+    variables["streaming"] = info.get("payload_layout") == "streaming"
+    variables["final_channels"] = list(context.final_channels)
     variables["conclusion_text"] = info.get("conclusion_text", "installation finished.")
     variables["pycache"] = "__pycache__"
-    variables["shortcuts"] = shortcuts_flags(info)
+    variables["shortcuts"] = context.shortcuts_flags
     variables["register_envs"] = str(info.get("register_envs", True)).lower()
     variables["total_installation_size_kb"] = str(approx_size_kb(info, "total"))
     variables["virtual_specs"] = shlex.join(virtual_specs)
@@ -106,7 +362,7 @@ def get_header(conda_exec, tarball, info):
     if has_license:
         variables["license"] = read_ascii_only(info["license_file"])
 
-    virtual_specs = parse_virtual_specs(info)
+    virtual_specs = context.virtual_specs
     min_osx_version = virtual_specs.get("__osx", {}).get("min") or ""
     variables["min_osx_version"] = min_osx_version
     variables["conda_exe_name"] = format_conda_exe_name(info["_conda_exe"])
@@ -114,10 +370,119 @@ def get_header(conda_exec, tarball, info):
     variables["min_glibc_version"] = min_glibc_version
 
     variables["script_env_variables"] = info.get("script_env_variables", {})
+    variables["payload_extension"] = PAYLOAD_EXTENSIONS[payload_compression(info)[0]]
 
     return render_template(read_header_template(), **variables)
 
 
+def _add_files(t, info, files, package_files, tar_filter) -> list[dict]:
+    """
+    Add the ``(path, arcname)`` pairs of ``files`` and then the packages named in
+    ``package_files`` to the tarball ``t``. Return where the data of each package is
+    stored, relative to the start of the tarball.
+    """
+    for path, arcname in files:
+        t.add(path, arcname, filter=tar_filter)
+    packages = []
+    for fn in package_files:
+        t.add(join(info["_download_dir"], fn), "pkgs/" + fn, filter=tar_filter)
+        # The data of the member ends at the current offset of the archive,
+        # followed by padding up to a full tar block
+        size = t.members[-1].size
+        data_offset = t.offset - -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        packages.append({"filename": fn, "offset": data_offset, "size": size})
+    return packages
+
+
+def _write_segments(
+    fo, info, conda_exec, bootstrapper_codec, internal_dir, files, segments, tar_filter
+):
+    """
+    Write the payloads of the default layout to ``fo``, which is positioned after the
+    padded header: the conda executable, the tarball of ``internal_dir`` (if any) and
+    one tarball per package segment, each padded to `PAYLOAD_BLOCK_SIZE`. Return the
+    values of the header placeholders, and the segments and packages of the index.
+    """
+    start = fo.tell()
+    exec_writer = HashingWriter(fo, hashlib.sha256())
+    with open(conda_exec, "rb") as fi:
+        shutil.copyfileobj(fi, exec_writer, COPY_BUFSIZE)
+    conda_exe_size = exec_writer.size
+    exec_writer.write(b"\0" * _padding(exec_writer.size))
+    internal_writer = HashingWriter(fo, hashlib.sha256())
+    if internal_dir:
+        # The files of a onedir conda-standalone, unpacked with a single `tar`
+        with (
+            compressed_writer(
+                internal_writer, bootstrapper_codec, mtime=info.get("_source_date_epoch")
+            )
+            if bootstrapper_codec
+            else nullcontext(internal_writer) as fz,
+            tarfile.open(fileobj=fz, mode="w", copybufsize=COPY_BUFSIZE) as t,
+        ):
+            t.add(internal_dir, "_internal", filter=tar_filter)
+        internal_writer.write(b"\0" * _padding(internal_writer.size))
+    segment_writers = []
+    segment_packages = []
+    for segment_files, filenames in zip(files, segments):
+        writer = HashingWriter(fo, hashlib.sha256())
+        with tarfile.open(fileobj=writer, mode="w", copybufsize=COPY_BUFSIZE) as t:
+            segment_packages.append(_add_files(t, info, segment_files, filenames, tar_filter))
+        writer.write(b"\0" * _padding(writer.size))
+        segment_writers.append(writer)
+
+    writers = (exec_writer, internal_writer, *segment_writers)
+    offsets = [start]
+    for writer in writers:
+        offsets.append(offsets[-1] + writer.size)
+    names = ["bootstrapper", "internal"] + [f"packages{i}" for i in range(len(segments))]
+    index_segments = [
+        {"name": name, "offset": offset, "size": writer.size, "sha256": writer.hasher.hexdigest()}
+        for name, offset, writer in zip(names, offsets, writers)
+    ]
+    packages = [
+        {**package, "segment": name, "offset": offset + package["offset"]}
+        for name, offset, packages in zip(names[2:], offsets[2:], segment_packages)
+        for package in packages
+    ]
+    values = {
+        "conda_exe_size": conda_exe_size,
+        **{f"boundary{i}": offset for i, offset in enumerate(offsets[:3])},
+        "boundary3": offsets[-1],
+        **{f"segment{i}": offset for i, offset in enumerate(offsets[2:-1])},
+        **{f"sha256_{segment['name']}": segment["sha256"] for segment in index_segments},
+    }
+    return values, index_segments, packages
+
+
+def _write_stream(fo, info, files, package_files, tar_filter, hasher):
+    """
+    Write the payloads of the streaming layout to ``fo``, right after the header: a
+    single uncompressed tarball with ``files`` and then the packages, in the order the
+    installer needs them. ``hasher`` is updated with the tarball; the installer hashes
+    everything after the header, so the caller adds the index to it. Return the values
+    of the header placeholders, and the segments and packages of the index.
+    """
+    start = fo.tell()
+    writer = HashingWriter(fo, hasher)
+    with tarfile.open(fileobj=writer, mode="w", copybufsize=COPY_BUFSIZE) as t:
+        packages = _add_files(t, info, files, package_files, tar_filter)
+    index_segments = [
+        {
+            "name": "stream",
+            "offset": start,
+            "size": writer.size,
+            "sha256": writer.hasher.hexdigest(),
+        }
+    ]
+    packages = [
+        {**package, "segment": "stream", "offset": start + package["offset"]}
+        for package in packages
+    ]
+    values = {"boundary0": start}
+    return values, index_segments, packages
+
+
 def create(info, verbose=False):
     tmp_dir_base_path = join(dirname(info["_outpath"]), "tmp")
     try:
@@ -127,37 +492,39 @@ def create(info, verbose=False):
     tmp_dir = tempfile.mkdtemp(dir=tmp_dir_base_path)
     preconda_write_files(info, tmp_dir)
 
-    preconda_tarball = join(tmp_dir, "preconda.tar.bz2")
-    postconda_tarball = join(tmp_dir, "postconda.tar.bz2")
-    pre_t = tarfile.open(preconda_tarball, "w:bz2")
-    post_t = tarfile.open(postconda_tarball, "w:bz2")
+    # Normalizes the archive entries in reproducible builds (no-op otherwise)
+    tar_filter = reproducible_tar_filter(info.get("_source_date_epoch"))
+    preconda_tarball = join(tmp_dir, "preconda.tar")
+    postconda_tarball = join(tmp_dir, "postconda.tar")
+    pre_t = tarfile.open(preconda_tarball, "w")
+    post_t = tarfile.open(postconda_tarball, "w")
     for rel_path in preconda_files:
-        pre_t.add(join(tmp_dir, rel_path), rel_path)
+        pre_t.add(join(tmp_dir, rel_path), rel_path, filter=tar_filter)
 
     for env_name in info.get("_extra_envs_info", ()):
         for rel_path in (
             f"pkgs/envs/{env_name}/shortcuts.txt",
             f"envs/{env_name}/conda-meta/initial-state.explicit.txt",
         ):
-            pre_t.add(join(tmp_dir, rel_path), rel_path)
+            pre_t.add(join(tmp_dir, rel_path), rel_path, filter=tar_filter)
 
     for key in "pre_install", "post_install":
         if key in info:
             pre_t.add(
                 info[key],
                 "pkgs/%s.sh" % key,
-                filter=make_executable if has_shebang(info[key]) else None,
+                filter=reproducible_tar_filter(
+                    info.get("_source_date_epoch"),
+                    make_executable if has_shebang(info[key]) else None,
+                ),
             )
     cache_dir = join(tmp_dir, "pkgs", "cache")
     if isdir(cache_dir):
-        for cf in os.listdir(cache_dir):
+        for cf in sorted(os.listdir(cache_dir)):
             if cf.endswith(".json"):
-                pre_t.add(join(cache_dir, cf), "pkgs/cache/" + cf)
+                pre_t.add(join(cache_dir, cf), "pkgs/cache/" + cf, filter=tar_filter)
 
-    all_dists = info["_dists"].copy()
-    for env_data in info.get("_extra_envs_info", {}).values():
-        all_dists += env_data["_dists"]
-    all_dists = list({dist: None for dist in all_dists})  # de-duplicate
+    all_dists = BuildContext.from_info(info).all_dists
 
     for dist in all_dists:
         if filename_dist(dist).endswith(".conda"):
@@ -167,81 +534,112 @@ def create(info, verbose=False):
         record_file = join(_dist, "info", "repodata_record.json")
         record_file_src = join(tmp_dir, "pkgs", record_file)
         record_file_dest = join("pkgs", record_file)
-        pre_t.add(record_file_src, record_file_dest)
+        pre_t.add(record_file_src, record_file_dest, filter=tar_filter)
     pre_t.addfile(tarinfo=tarfile.TarInfo("conda-meta/history"))
-    post_t.add(join(tmp_dir, "conda-meta", "history"), "conda-meta/history")
+    post_t.add(join(tmp_dir, "conda-meta", "history"), "conda-meta/history", filter=tar_filter)
 
     if os.path.exists(join(tmp_dir, "conda-meta", "frozen")):
-        post_t.add(join(tmp_dir, "conda-meta", "frozen"), "conda-meta/frozen")
+        post_t.add(join(tmp_dir, "conda-meta", "frozen"), "conda-meta/frozen", filter=tar_filter)
 
     if os.path.exists(join(tmp_dir, ".condarc")):
-        post_t.add(join(tmp_dir, ".condarc"), ".condarc")
+        post_t.add(join(tmp_dir, ".condarc"), ".condarc", filter=tar_filter)
 
     for env_name in info.get("_extra_envs_info", {}):
         pre_t.addfile(tarinfo=tarfile.TarInfo(f"envs/{env_name}/conda-meta/history"))
         post_t.add(
             join(tmp_dir, "envs", env_name, "conda-meta", "history"),
             f"envs/{env_name}/conda-meta/history",
+            filter=tar_filter,
         )
         if os.path.exists(join(tmp_dir, "envs", env_name, "conda-meta", "frozen")):
             post_t.add(
                 join(tmp_dir, "envs", env_name, "conda-meta", "frozen"),
                 f"envs/{env_name}/conda-meta/frozen",
+                filter=tar_filter,
             )
 
     extra_files = copy_extra_files(info.get("extra_files", []), tmp_dir)
     for path in extra_files:
-        post_t.add(path, relpath(path, tmp_dir))
+        post_t.add(path, relpath(path, tmp_dir), filter=tar_filter)
 
     pre_t.close()
     post_t.close()
+    codec, level, threads = payload_compression(info)
+    preconda_tarball, postconda_tarball = (
+        compress_payload(path, codec, level, threads, mtime=info.get("_source_date_epoch"))
+        for path in (preconda_tarball, postconda_tarball)
+    )
 
-    tarball = join(tmp_dir, "pkgs", "tmp.tar")
-    t = tarfile.open(tarball, "w")
-    t.add(preconda_tarball, basename(preconda_tarball))
-    t.add(postconda_tarball, basename(postconda_tarball))
-    if "license_file" in info:
-        t.add(info["license_file"], "LICENSE.txt")
-    for dist in all_dists:
-        fn = filename_dist(dist)
-        t.add(join(info["_download_dir"], fn), "pkgs/" + fn)
-    t.close()
-
-    info["_internal_conda_files"] = copy_conda_exe(tmp_dir, "_conda", info["_conda_exe"])
-    if info["_internal_conda_files"]:
-        conda_exe_payloads: dict[str, tuple[int, int, bool]] = {}
-        memfile = BytesIO()
-        start = 0
-        end = 0
-        for path in info["_internal_conda_files"]:
-            relative_path = str(path.relative_to(tmp_dir))
-            memfile.write(path.read_bytes())
-            size = os.path.getsize(path)
-            end = start + size
-            executable = os.access(path, os.X_OK)
-            conda_exe_payloads[relative_path] = (start, end, executable)
-            start = end
-
-        info["_conda_exe_payloads"] = conda_exe_payloads
-        info["_conda_exe_payloads_size"] = end
-        memfile.seek(0)
-        maybe_memfile = (memfile,)
-    else:
-        maybe_memfile = ()
+    internal_files = copy_conda_exe(tmp_dir, "_conda", info["_conda_exe"])
     conda_exec = info["_conda_exe"]
-    header = get_header(conda_exec, tarball, info)
+    bootstrapper_codec = ""
+    if info.get("bootstrapper_compression"):
+        conda_exec, bootstrapper_codec = compress_bootstrapper(
+            conda_exec,
+            info["bootstrapper_compression"],
+            tmp_dir,
+            mtime=info.get("_source_date_epoch"),
+        )
+    # The payloads are written right after the header in a single pass and hashed on
+    # the way; the placeholders in the header are filled in once they are complete.
+    package_files = [filename_dist(dist) for dist in all_dists]
+    segments = split_segments(
+        package_files,
+        {fn: getsize(join(info["_download_dir"], fn)) for fn in package_files},
+        info.get("payload_segments", 1),
+    )
+    header = get_header(info, bool(internal_files), bootstrapper_codec, len(segments))
+    header = header.encode("utf-8")
+    first_files = [
+        (preconda_tarball, basename(preconda_tarball)),
+        (postconda_tarball, basename(postconda_tarball)),
+    ]
+    if "license_file" in info:
+        first_files.append((info["license_file"], "LICENSE.txt"))
     shar_path = info["_outpath"]
-    with open(shar_path, "wb") as fo:
-        fo.write(header.encode("utf-8"))
-        for payload in [conda_exec, *maybe_memfile, tarball]:
-            with open(payload, "rb") if isinstance(payload, str) else nullcontext(payload) as fi:
-                while True:
-                    chunk = fi.read(262144)
-                    if not chunk:
-                        break
-                    fo.write(chunk)
-
-    os.unlink(tarball)
-    os.chmod(shar_path, 0o755)
+    with atomic_output(shar_path) as tmp_shar_path:
+        with open(tmp_shar_path, "wb") as fo:
+            fo.write(header)
+            streaming = info.get("payload_layout") == "streaming"
+            if streaming:
+                stream_hasher = hashlib.sha256()
+                conda_member = format_conda_exe_name(info["_conda_exe"])
+                if bootstrapper_codec:
+                    conda_member += BOOTSTRAPPER_EXTENSIONS[bootstrapper_codec]
+                values, index_segments, packages = _write_stream(
+                    fo,
+                    info,
+                    [(conda_exec, conda_member)]
+                    + ([(join(tmp_dir, "_internal"), "_internal")] if internal_files else [])
+                    + first_files,
+                    package_files,
+                    tar_filter,
+                    stream_hasher,
+                )
+            else:
+                fo.write(b"\0" * _padding(len(header)))
+                values, index_segments, packages = _write_segments(
+                    fo,
+                    info,
+                    conda_exec,
+                    bootstrapper_codec,
+                    join(tmp_dir, "_internal") if internal_files else None,
+                    [first_files] + [[]] * (len(segments) - 1),
+                    segments,
+                    tar_filter,
+                )
+            index = installer_index(info, index_segments, packages)
+            index = dumps_json(index).encode("utf-8")
+            values["index_offset"] = fo.tell()
+            values["index_size"] = len(index)
+            fo.write(index)
+            if streaming:
+                # The installer hashes the rest of the file, up to the end of the index
+                stream_hasher.update(index)
+                values["sha256_stream"] = stream_hasher.hexdigest()
+            fo.seek(0)
+            fo.write(fill_header(header, **values))
+        os.chmod(tmp_shar_path, 0o755)
+
     if not info.get("_debug"):
         shutil.rmtree(tmp_dir)
@@ -0,0 +1,140 @@
+# (c) 2016 Anaconda, Inc. / https://anaconda.com
+# All Rights Reserved
+#
+# constructor is distributed under the terms of the BSD 3-clause license.
+# Consult LICENSE.txt or http://opensource.org/licenses/BSD-3-Clause.
+"""
+Topological ordering of package records.
+
+This produces the same order as `conda.models.prefix_graph.PrefixGraph` (including its
+special cases and cycle handling), but resolves `depends` through a by-name index
+instead of matching every record against all the others, and memoizes the result
+for each record set.
+"""
+
+from __future__ import annotations
+
+import sys
+from collections import defaultdict
+from functools import cache, lru_cache
+from typing import TYPE_CHECKING
+
+from .conda_interface import CyclicalDependencyError, MatchSpec, NoarchType, conda_context
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from .conda_interface import PackageRecord
+
+
+@cache
+def _match_spec(spec: str) -> MatchSpec:
+    return MatchSpec(spec)
+
+
+def _parents(records: tuple[PackageRecord, ...]) -> dict[PackageRecord, set[PackageRecord]]:
+    by_name = defaultdict(list)
+    for record in records:
+        by_name[record.name].append(record)
+    graph = {}
+    for record in records:
+        parents = set()
+        for dep in record.depends:
+            spec = _match_spec(dep)
+            parents.update(rec for rec in by_name.get(spec.name, ()) if spec.match(rec))
+        graph[record] = parents
+    return graph
+
+
+def _prepare_graph(graph: dict[PackageRecord, set[PackageRecord]]):
+    "Same special cases as `PrefixGraph._toposort_prepare_graph`."
+    nodes = {node.name: node for node in graph}
+    python_node = nodes.get("python")
+    # 1. Remove any circular dependency between python and pip
+    for node, parents in graph.items():
+        if node.name == "python":
+            parents.difference_update([parent for parent in parents if parent.name == "pip"])
+    # 2. Always link menuinst before anything that depends on python
+    menuinst_node = nodes.get("menuinst")
+    if menuinst_node is not None and python_node is not None:
+        menuinst_parents = graph[menuinst_node]
+        for node, parents in graph.items():
+            if python_node in parents and node not in menuinst_parents:
+                parents.add(menuinst_node)
+    # 3. On Windows, noarch: python packages depend implicitly on conda
+    conda_node = nodes.get("conda")
+    if sys.platform == "win32" and conda_node is not None:
+        conda_parents = graph[conda_node]
+        for node, parents in graph.items():
+            if getattr(node, "noarch", None) == NoarchType.python and node not in conda_parents:
+                parents.add(conda_node)
+
+
+def _sort(graph: dict[PackageRecord, set[PackageRecord]]) -> list[PackageRecord]:
+    """
+    Kahn's algorithm processed in rounds: each round yields all the nodes without
+    pending parents, sorted by name. Cycles are broken like conda does, by popping
+    the node with the fewest pending parents (ties resolved by `dist_str`).
+    """
+    allow_cycles = getattr(conda_context, "allow_cycles", True)
+    children = defaultdict(list)
+    pending = {}
+    for node, parents in graph.items():
+        if allow_cycles:
+            # remove edges that point directly back to the node
+            parents.discard(node)
+        pending[node] = len(parents)
+        for parent in parents:
+            children[parent].append(node)
+
+    order = []
+    if allow_cycles:
+        # disconnected nodes go first
+        order.extend(
+            sorted(
+                (node for node in graph if not pending[node] and not children[node]),
+                key=lambda node: node.name,
+            )
+        )
+
+    def remove(node):
+        del pending[node]
+        for child in children[node]:
+            if child in pending:
+                pending[child] -= 1
+
+    ready = [node for node, count in pending.items() if count == 0]
+    while pending:
+        if not ready:
+            if not allow_cycles:
+                raise CyclicalDependencyError(tuple(pending))
+            node = min(pending, key=lambda node: (pending[node], node.dist_str()))
+            order.append(node)
+            remove(node)
+        else:
+            ready.sort(key=lambda node: node.name)
+            for node in ready:
+                order.append(node)
+                remove(node)
+        ready = [node for node, count in pending.items() if count == 0]
+    return list(dict.fromkeys(order))
+
+
+@lru_cache(maxsize=32)
+def _toposort(records: tuple[PackageRecord, ...]) -> tuple[PackageRecord, ...]:
+    graph = _parents(records)
+    _prepare_graph(graph)
+    return tuple(_sort(graph))
+
+
+def toposort_records(records: Iterable[PackageRecord]) -> list[PackageRecord]:
+    """
+    Return ``records`` sorted so that dependencies come before their dependents,
+    like ``PrefixGraph(records).graph`` would.
+    """
+    records = tuple(records)
+    # Records compare equal by name, version, build and channel only, so the memoized
+    # result may hold equal records from an earlier call, with a different URL or
+    # checksum. Return the caller's own objects instead.
+    own = {record: record for record in records}
+    return [own[record] for record in _toposort(records)]
@@ -9,17 +9,21 @@ Miscellaneous utilities to support other parts of the library.
 
 from __future__ import annotations
 
+import errno
 import hashlib
+import json
 import logging
 import math
 import re
 import shutil
 import subprocess
 import sys
+import time
 import warnings
+from contextlib import contextmanager
 from io import StringIO
-from os import environ, sep, unlink
-from os.path import isdir, isfile, islink, join, normpath
+from os import environ, fstat, getpid, link, replace, sep, stat, unlink
+from os.path import basename, dirname, isdir, isfile, islink, join, normpath, samestat
 from pathlib import Path
 from shutil import rmtree
 from subprocess import CalledProcessError, check_call, check_output
@@ -27,6 +31,11 @@ from subprocess import CalledProcessError, check_call, check_output
 from conda.models.version import VersionOrder
 from ruamel.yaml import YAML
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 DEFAULT_REVERSE_DOMAIN_ID = "io.continuum"
 
 logger = logging.getLogger(__name__)
@@ -88,6 +97,99 @@ def hash_files(paths, algorithm="md5"):
     return h.hexdigest()
 
 
+def source_date_epoch() -> int | None:
+    """
+    Return the ``SOURCE_DATE_EPOCH`` timestamp (see https://reproducible-builds.org),
+    or None if it is not set. When it is set, builds are made reproducible.
+    """
+    value = environ.get("SOURCE_DATE_EPOCH", "").strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        sys.exit(f"Error: SOURCE_DATE_EPOCH must be an integer timestamp, got '{value}'.")
+
+
+def reproducible_tar_filter(epoch: int | None, filter=None):
+    """
+    Return a `tarfile` filter that applies ``filter`` (if given) and, if ``epoch`` is not
+    None, sets the timestamps of the entries to ``epoch`` and drops their ownership, so
+    that archives only depend on the contents added to them.
+    """
+    if epoch is None:
+        return filter
+
+    def _filter(tarinfo):
+        if filter is not None:
+            tarinfo = filter(tarinfo)
+            if tarinfo is None:
+                return None
+        tarinfo.mtime = epoch
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ""
+        return tarinfo
+
+    return _filter
+
+
+def dumps_json(obj, compact=False, sort_keys=False) -> str:
+    """
+    Serialize ``obj`` as indented JSON or, if ``compact``, without any whitespace;
+    compact output uses `orjson` when available. The result may contain non-ASCII
+    characters, so write it with UTF-8 encoding.
+    """
+    if not compact:
+        return json.dumps(obj, indent=2, sort_keys=sort_keys)
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0).decode()
+    return json.dumps(obj, separators=(",", ":"), sort_keys=sort_keys)
+
+
+def _digests_sidecar(path):
+    return f"{path}.digests.json"
+
+
+def record_artifact_digests(path):
+    """
+    Compute the size, MD5 and SHA256 of ``path`` in a single read, and store them in
+    a sidecar file next to it so that later consumers do not need to hash it again.
+    """
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    with open(path, "rb") as fi:
+        while True:
+            chunk = fi.read(262144)
+            if not chunk:
+                break
+            md5.update(chunk)
+            sha256.update(chunk)
+    st = stat(path)
+    digests = {"size": st.st_size, "md5": md5.hexdigest(), "sha256": sha256.hexdigest()}
+    try:
+        with atomic_output(_digests_sidecar(path)) as tmp:
+            with open(tmp, "w") as fo:
+                json.dump({**digests, "mtime_ns": st.st_mtime_ns}, fo)
+    except OSError as exc:
+        logger.debug("Could not record digests for %s: %s", path, exc)
+    return digests
+
+
+def artifact_digests(path):
+    """
+    Return the size, MD5 and SHA256 of ``path``, from its sidecar file if it is still
+    up to date, computing (and recording) them otherwise.
+    """
+    try:
+        with open(_digests_sidecar(path)) as fi:
+            recorded = json.load(fi)
+        st = stat(path)
+        if (recorded["size"], recorded["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+            return {key: recorded[key] for key in ("size", "md5", "sha256")}
+    except (OSError, ValueError, KeyError):
+        pass
+    return record_artifact_digests(path)
+
+
 def make_VIProductVersion(version):
     """
     always create a version of the form X.X.X.X
@@ -193,53 +295,106 @@ def ensure_transmuted_ext(info, url):
     return url
 
 
-def get_final_url(info, url):
-    mapping = info.get("channels_remap", [])
-    if not url.lower().endswith((".tar.bz2", ".conda", "/")):
-        url += "/"
-        added_slash = True
-    else:
-        added_slash = False
-    for entry in mapping:
-        src = entry["src"]
-        dst = entry["dest"]
-        # Treat http:// and https:// as equivalent
-        if src.startswith("http"):
-            srcs = tuple(
-                dict.fromkeys(
+class ChannelRemap:
+    """
+    Compiled form of a `channels_remap` table (plus the build-time mirrors, if any)
+    used to rewrite channel and package URLs into the ones shipped in the installer.
+
+    Sources are matched as URL prefixes, in the order they were given, treating
+    ``http://`` and ``https://`` as equivalent. Results are memoized per URL, so
+    rewriting the same URL again is a dictionary lookup and logs no new warnings.
+    """
+
+    def __init__(self, channels_remap=(), mirrors=None):
+        rules = []
+        for entry in channels_remap:
+            src = entry["src"]
+            if src.startswith("http"):
+                srcs = dict.fromkeys(
                     [src.replace("http://", "https://"), src.replace("https://", "http://")]
                 )
+            else:
+                srcs = (src,)
+            rules.extend((src, entry["dest"]) for src in srcs)
+        self._rules = tuple(rules)
+        self._sources = tuple(src for src, _ in rules)
+        self._mirrors = mirrors
+        self._cache = {}
+        self._local_warned = set()
+
+    @classmethod
+    def from_info(cls, info) -> ChannelRemap:
+        """Return the remap engine for ``info``, compiling and storing it on first use."""
+        remap = info.get("_channel_remap")
+        if remap is None:
+            remap = info["_channel_remap"] = cls(
+                info.get("channels_remap", ()), info.get("_mirrors")
             )
+        return remap
+
+    def dump(self) -> list[dict]:
+        """The rules as ``src``/``dest`` entries, for ``info.json``."""
+        return [{"src": src, "dest": dest} for src, dest in self._rules]
+
+    def final_url(self, url: str) -> str:
+        try:
+            return self._cache[url]
+        except KeyError:
+            pass
+        new_url = self._cache[url] = self._remap(url)
+        return new_url
+
+    def final_urls(self, urls) -> list[str]:
+        return [self.final_url(url) for url in urls]
+
+    def final_channels(self, channels) -> list[str]:
+        mapped_channels = []
+        for channel in channels:
+            url = self.final_url(channel)
+            if url.startswith("file://"):
+                if url not in self._local_warned:
+                    self._local_warned.add(url)
+                    logger.warning(
+                        "local channel %s does not have a remap. "
+                        "It will not be included in the installer",
+                        url,
+                    )
+                continue
+            mapped_channels.append(url)
+        return mapped_channels
+
+    def _remap(self, url: str) -> str:
+        if self._mirrors:
+            # Mirrors serve the same packages as their channel; present them as such
+            from .mirrors import canonical_url
+
+            url = canonical_url(url, self._mirrors)
+        if not url.lower().endswith((".tar.bz2", ".conda", "/")):
+            url += "/"
+            added_slash = True
         else:
-            srcs = (src,)
-        if url.startswith(srcs):
-            new_url = url
-            for src in srcs:
-                new_url = new_url.replace(src, dst)
-            if url.endswith(".tar.bz2"):
-                logger.warning(
-                    "You need to make the package %s available at %s",
-                    url.rsplit("/", 1)[1],
-                    new_url,
-                )
-            if added_slash:
-                new_url = new_url[:-1]
-            return new_url
-    return url
+            added_slash = False
+        if not url.startswith(self._sources):
+            return url
+        src, dst = next((src, dst) for src, dst in self._rules if url.startswith(src))
+        new_url = dst + url[len(src) :]
+        if url.endswith(".tar.bz2"):
+            logger.warning(
+                "You need to make the package %s available at %s",
+                url.rsplit("/", 1)[1],
+                new_url,
+            )
+        if added_slash:
+            new_url = new_url[:-1]
+        return new_url
+
+
+def get_final_url(info, url):
+    return ChannelRemap.from_info(info).final_url(url)
 
 
 def get_final_channels(info):
-    mapped_channels = []
-    for channel in info.get("channels", []):
-        url = get_final_url(info, channel)
-        if url.startswith("file://"):
-            logger.warning(
-                "local channel %s does not have a remap. It will not be included in the installer",
-                url,
-            )
-            continue
-        mapped_channels.append(url)
-    return mapped_channels
+    return ChannelRemap.from_info(info).final_channels(info.get("channels", []))
 
 
 def normalize_path(path):
@@ -263,6 +418,105 @@ def rm_rf(path):
         pass
 
 
+def hardlink_or_copy(src, dst):
+    """
+    Hardlink ``src`` to ``dst``, falling back to a regular copy if hardlinks
+    are not supported (e.g. across filesystems).
+    """
+    try:
+        link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _lock_file(f, path, timeout):
+    if sys.platform == "win32":
+        import msvcrt
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError as exc:
+                # LK_LOCK retries for ~10 seconds, then fails with EDEADLK (or EACCES
+                # on some versions) if the lock is still held; keep waiting only then
+                if exc.errno not in (errno.EACCES, errno.EDEADLK):
+                    raise
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for the lock on {path}") from exc
+    else:
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f):
+    if sys.platform == "win32":
+        import msvcrt
+
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def file_lock(path, timeout=600):
+    """
+    Hold an exclusive advisory lock on ``path`` (created if needed) for the duration
+    of the context. Used to serialize access to shared cache entries across processes.
+    On Windows, waiting for the lock gives up after ``timeout`` seconds.
+
+    The lock file is removed when the lock is released. A process that was waiting on
+    the removed file notices it once it gets the lock, and locks the new file instead.
+    """
+    while True:
+        f = open(path, "a+b")
+        try:
+            _lock_file(f, path, timeout)
+        except BaseException:
+            f.close()
+            raise
+        try:
+            locked = samestat(fstat(f.fileno()), stat(path))
+        except FileNotFoundError:
+            locked = False
+        if locked:
+            break
+        _unlock_file(f)
+        f.close()
+    try:
+        yield
+    finally:
+        # Removed while still locked, so that no one else can lock this file anymore;
+        # Windows does not remove open files, so the lock file is left there
+        try:
+            unlink(path)
+        except OSError:
+            pass
+        _unlock_file(f)
+        f.close()
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Yield a temporary sibling path for ``path`` and move it into place once the
+    context exits successfully, so readers never observe a partially written file.
+    The temporary name keeps the original extension for tools that care about it.
+    """
+    tmp = join(dirname(path), f".tmp{getpid()}-{basename(path)}")
+    try:
+        yield tmp
+        replace(tmp, path)
+    finally:
+        rm_rf(tmp)
+
+
 def yield_lines(path):
     for line in open(path):
         line = line.strip()
@@ -20,6 +20,7 @@ from subprocess import check_output, run
 from typing import TYPE_CHECKING
 
 from .construct import ns_platform
+from .context import BuildContext
 from .imaging import write_images
 from .jinja import render_template
 from .preconda import copy_extra_files
@@ -27,6 +28,7 @@ from .preconda import write_files as preconda_write_files
 from .signing import create_windows_signing_tool
 from .utils import (
     approx_size_kb,
+    atomic_output,
     copy_conda_exe,
     filename_dist,
     get_final_channels,
@@ -78,6 +80,7 @@ def custom_nsi_insert_from_file(filepath: os.PathLike) -> str:
 
 
 def setup_envs_commands(info, dir_path):
+    context = BuildContext.from_info(info)
     environments = []
     # set up the base environment
     environments.append(
@@ -93,8 +96,8 @@ def setup_envs_commands(info, dir_path):
             "frozen_abspath": join(dir_path, "conda-meta", "frozen")
             if info.get("freeze_base", {}).get("conda") is not None
             else "",
-            "final_channels": get_final_channels(info),
-            "shortcuts": shortcuts_flags(info),
+            "final_channels": list(context.final_channels),
+            "shortcuts": context.shortcuts_flags,
             "register_envs": str(info.get("register_envs", True)).lower(),
             "no_rcs_arg": info.get("_ignore_condarcs_arg", ""),
         }
@@ -140,6 +143,7 @@ def make_nsi(
     extra_files: list = None,
     temp_extra_files: list = None,
     signing_tool: AzureSignTool | WindowsSignTool = None,
+    outfile: str | None = None,
 ):
     "Creates the tmp/main.nsi from the template file"
 
@@ -150,10 +154,8 @@ def make_nsi(
     name = info["name"]
     download_dir = info["_download_dir"]
 
-    dists = info["_dists"].copy()
-    for env_info in info["_extra_envs_info"].values():
-        dists += env_info["_dists"]
-    dists = list({dist: None for dist in dists})  # de-duplicate
+    context = BuildContext.from_info(info)
+    dists = context.all_dists
 
     arch = int(info["_platform"].split("-")[1])
     info["pre_install_desc"] = info.get("pre_install_desc", "")
@@ -175,7 +177,7 @@ def make_nsi(
         "pre_install_desc": info["pre_install_desc"],
         "post_install_desc": info["post_install_desc"],
         "enable_shortcuts": "yes" if info["_enable_shortcuts"] is True else "no",
-        "outfile": info["_outpath"],
+        "outfile": outfile or info["_outpath"],
         "vipv": make_VIProductVersion(info["version"]),
         "constructor_version": info["CONSTRUCTOR_VERSION"],
         # @-prefixed paths point to {dir_path}
@@ -389,27 +391,29 @@ def create(info, verbose=False):
             fo.write(":: this is an empty pre uninstall .bat script\n")
 
     write_images(info, tmp_dir)
-    nsi = make_nsi(
-        info,
-        tmp_dir,
-        extra_files=extra_conda_exe_files + copied_extra_files,
-        temp_extra_files=copied_temp_extra_files,
-        signing_tool=signing_tool,
-    )
-    verbosity = f"{'/' if sys.platform == 'win32' else '-'}V{4 if verbose else 2}"
-    args = [MAKENSIS_EXE, verbosity, nsi]
-    logger.info("Calling: %s", args)
-    process = run(args, capture_output=True, text=True)
-    if process.returncode:
-        logger.info("makensis stdout:\n'%s'", process.stdout)
-        logger.error("makensis stderr:\n'%s'", process.stderr)
-        sys.exit(f"Failed to run {args}. Exit code: {process.returncode}.")
-    else:
-        logger.debug("makensis stdout:\n'%s'", process.stdout)
-        logger.debug("makensis stderr:\n'%s'", process.stderr)
-
-    if signing_tool:
-        signing_tool.verify_signature(info["_outpath"])
+    with atomic_output(info["_outpath"]) as outfile:
+        nsi = make_nsi(
+            info,
+            tmp_dir,
+            extra_files=extra_conda_exe_files + copied_extra_files,
+            temp_extra_files=copied_temp_extra_files,
+            signing_tool=signing_tool,
+            outfile=outfile,
+        )
+        verbosity = f"{'/' if sys.platform == 'win32' else '-'}V{4 if verbose else 2}"
+        args = [MAKENSIS_EXE, verbosity, nsi]
+        logger.info("Calling: %s", args)
+        process = run(args, capture_output=True, text=True)
+        if process.returncode:
+            logger.info("makensis stdout:\n'%s'", process.stdout)
+            logger.error("makensis stderr:\n'%s'", process.stderr)
+            sys.exit(f"Failed to run {args}. Exit code: {process.returncode}.")
+        else:
+            logger.debug("makensis stdout:\n'%s'", process.stdout)
+            logger.debug("makensis stderr:\n'%s'", process.stderr)
+
+        if signing_tool:
+            signing_tool.verify_signature(outfile)
 
     if not info.get("_debug"):
         shutil.rmtree(tmp_dir)
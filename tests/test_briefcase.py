@@ -245,6 +245,22 @@ def test_payload_archive(tmp_path: Path):
         assert f.read().decode("utf-8") == expected_text
 
 
+@pytest.mark.skipif(sys.platform != "win32", reason="Windows only")
+def test_payload_archive_reproducible(tmp_path: Path):
+    """Test that payload archives are byte-identical when SOURCE_DATE_EPOCH is set."""
+    info = mock_info.copy()
+    info["_source_date_epoch"] = 1700000000
+    payload = Payload(info)
+
+    archives = []
+    for name in ("first", "second"):
+        foo_dir = tmp_path / name / "foo"
+        foo_dir.mkdir(parents=True)
+        (foo_dir / "hello.txt").write_text("some test text", encoding="utf-8")
+        archives.append(payload.make_archive(foo_dir, tmp_path / name).read_bytes())
+    assert archives[0] == archives[1]
+
+
 @pytest.mark.skipif(sys.platform != "win32", reason="Windows only")
 def test_payload_remove():
     """Test removing the payload."""
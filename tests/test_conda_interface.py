@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from constructor.conda_interface import repodata_keep_filenames, trim_repodata
+
+REPODATA = {
+    "info": {"subdir": "linux-64"},
+    "repodata_version": 1,
+    "packages": {
+        "a-1.0-0.tar.bz2": {"name": "a", "size": 1.5, "depends": ["b"]},
+        "spyder-5.0-0.tar.bz2": {"name": "spyder", "depends": []},
+        "z.b-1.0-0.tar.bz2": {"name": "z.b", "extra": {"k": [1, {"q": None}]}},
+    },
+    "packages.conda": {
+        "b-1.0-0.conda": {"name": "b", "md5": "0123"},
+        "c-1.0-0.conda": {"name": "c"},
+    },
+    "removed": ["x-1.0-0.tar.bz2"],
+}
+
+
+def test_trim_repodata():
+    keep = repodata_keep_filenames(["b-1.0-0.conda", "z.b-1.0-0.conda"])
+    assert trim_repodata(REPODATA, keep) == {
+        "info": {"subdir": "linux-64"},
+        "repodata_version": 1,
+        "packages": {
+            # kept because of NAV_APPS
+            "spyder-5.0-0.tar.bz2": REPODATA["packages"]["spyder-5.0-0.tar.bz2"],
+            # kept as the original of a transmuted package
+            "z.b-1.0-0.tar.bz2": REPODATA["packages"]["z.b-1.0-0.tar.bz2"],
+        },
+        "packages.conda": {"b-1.0-0.conda": REPODATA["packages.conda"]["b-1.0-0.conda"]},
+        "removed": [],
+    }
+
+
+def test_stream_trimmed_repodata(tmp_path):
+    pytest.importorskip("ijson")
+    from constructor.conda_interface import _stream_trimmed_repodata
+
+    path = tmp_path / "repodata.json"
+    path.write_text(json.dumps(REPODATA))
+    keep = repodata_keep_filenames(["a-1.0-0.conda", "b-1.0-0.conda"])
+    assert _stream_trimmed_repodata(path, keep) == trim_repodata(REPODATA, keep)
+
+
+def test_repodata_session(tmp_path, mocker):
+    from constructor import conda_interface
+    from constructor.conda_interface import (
+        RepodataSession,
+        conda_replace_context_default,
+        env_vars,
+    )
+
+    channel = tmp_path / "channel"
+    for subdir in ("linux-64", "noarch"):
+        (channel / subdir).mkdir(parents=True)
+        (channel / subdir / "repodata.json").write_text(json.dumps(REPODATA))
+    url = f"{channel.as_uri()}/linux-64"
+    keep = repodata_keep_filenames(["b-1.0-0.conda"])
+
+    with env_vars({"CONDA_PKGS_DIRS": str(tmp_path / "pkgs")}, conda_replace_context_default):
+        session = RepodataSession()
+        fetch = mocker.spy(conda_interface, "get_repodata")
+        repodata = session.get_repodata(url, keep=keep)
+        assert repodata == trim_repodata(REPODATA, keep)
+        assert session.get_repodata(url, keep=keep) is repodata
+        assert fetch.call_count == 1
+
+        # Indexes fetched by the solver are read from conda's cache without refetching
+        solved = RepodataSession()
+        solved.mark_fresh([url])
+        assert solved.get_repodata(url, keep=keep) == repodata
+        assert fetch.call_count == 1
+
+        # Indexes left untouched by the solver (e.g. libmamba) are fetched as usual
+        noarch_url = f"{channel.as_uri()}/noarch"
+        untouched = RepodataSession()
+        stamps = untouched.cache_stamps([url, noarch_url])
+        untouched.mark_fresh([url, noarch_url], since=stamps)
+        assert untouched.get_repodata(url, keep=keep) == repodata
+        assert fetch.call_count == 2
+
+        # Those the solver wrote into conda's cache are not fetched again
+        refreshed = RepodataSession()
+        stamps = refreshed.cache_stamps([noarch_url])
+        conda_interface.get_repodata(noarch_url)
+        refreshed.mark_fresh([noarch_url], since=stamps)
+        calls = fetch.call_count
+        refreshed.get_repodata(noarch_url, keep=keep)
+        assert fetch.call_count == calls
+        assert refreshed.dump() == [noarch_url]
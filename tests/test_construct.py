@@ -3,10 +3,13 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 import pytest
+from pydantic import ValidationError
 
+from constructor._schema import PayloadCompression
 from constructor.conda_interface import cc_platform
 from constructor.construct import parse as construct_parse
 from constructor.construct import render as construct_render
+from constructor.construct import verify as construct_verify
 
 if TYPE_CHECKING:
     from pathlib import Path
@@ -110,3 +113,29 @@ def test_parse_error(tmp_path):
         construct_parse(construct_yaml_file, cc_platform)
     assert exc.value.code != 0
     assert "Unable to parse" in str(exc.getrepr())
+
+
+@pytest.mark.parametrize(
+    "value, valid",
+    [
+        ({"codec": "gzip", "level": 0}, True),
+        ({"codec": "zstd", "level": 22}, True),
+        ({"codec": "xz"}, True),
+        ({"level": 9}, True),
+        ({"level": 0}, False),
+        ({"codec": "gzip", "level": 10}, False),
+        ({"codec": "zstd", "level": 23}, False),
+        ({"codec": "none", "level": 1}, False),
+        ({"codec": "xz", "threads": -1}, False),
+    ],
+)
+def test_payload_compression_level(value, valid):
+    info = {"name": "Installer", "version": "1.0.0", "payload_compression": value}
+    if valid:
+        construct_verify(info)
+        PayloadCompression(**value)
+    else:
+        with pytest.raises(SystemExit):
+            construct_verify(info)
+        with pytest.raises(ValidationError):
+            PayloadCompression(**value)
@@ -0,0 +1,33 @@
+from constructor.context import BuildContext
+
+
+def test_build_context_views():
+    info = {
+        "_dists": ["a-1.0-0.conda", "b-1.0-0.conda"],
+        "_urls": [("https://repo.test/main/linux-64/a-1.0-0.conda", "md5a")],
+        "_extra_envs_info": {
+            "env": {
+                "_dists": ["b-1.0-0.conda", "c-1.0-0.conda"],
+                "_urls": [("https://repo.test/main/linux-64/c-1.0-0.conda", "md5c")],
+            }
+        },
+        "channels": ["https://repo.test/main"],
+        "menu_packages": [],
+        "virtual_specs": ["__glibc>=2.17"],
+    }
+    context = BuildContext.from_info(info)
+    assert context.all_dists == ("a-1.0-0.conda", "b-1.0-0.conda", "c-1.0-0.conda")
+    assert [url for url, _ in context.all_urls] == [
+        "https://repo.test/main/linux-64/a-1.0-0.conda",
+        "https://repo.test/main/linux-64/c-1.0-0.conda",
+    ]
+    assert context.final_channels == ("https://repo.test/main/",)
+    assert context.virtual_specs["__glibc"] == {"min": "2.17"}
+    assert context.shortcuts_flags == "--no-shortcuts"
+
+    # Views are memoized, and copies of info get their own context
+    assert context.all_dists is context.all_dists
+    assert BuildContext.from_info(info) is context
+    copy = info.copy()
+    assert BuildContext.from_info(copy) is not context
+    assert BuildContext.from_info(copy).info is copy
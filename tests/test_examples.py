@@ -299,8 +299,8 @@ def _run_installer_sh(
             cmd.append("-x")
         cmd += [installer, "-b", *options, "-p", install_dir]
     process = _execute(cmd, installer_input=installer_input, timeout=timeout, check=check)
-    if "WARNING: md5sum mismatch of tar archive" in process.stdout + process.stderr:
-        raise AssertionError("MD5 mismatch in SH payload!")
+    if "WARNING: SHA-256 mismatch" in process.stdout + process.stderr:
+        raise AssertionError("SHA-256 mismatch in SH payload!")
     return process
 
 
@@ -3,8 +3,20 @@ from __future__ import annotations
 from contextlib import nullcontext
 
 import pytest
-
-from constructor.fcp import check_duplicates, check_duplicates_files, exclude_packages
+from conda.models.records import PackageRecord
+
+from constructor.fcp import (
+    _add_to_noarch_store,
+    _find_out_of_date_precs,
+    _link_from_noarch_store,
+    _noarch_store_entry,
+    _prec_from_url,
+    _solve,
+    _solve_precs,
+    check_duplicates,
+    check_duplicates_files,
+    exclude_packages,
+)
 
 
 class GenericObject:
@@ -111,7 +123,7 @@ def test_check_duplicates_files_returns_max_path_length(mocker):
             return MockPathsJson(pc_rec1._paths)
         return MockPathsJson(pc_rec2._paths)
 
-    mock_read_paths = mocker.patch("constructor.fcp.read_paths_json")
+    mock_read_paths = mocker.patch("constructor.package_index.read_paths_json")
     mock_read_paths.side_effect = read_paths_side_effect
 
     result = check_duplicates_files([pc_rec1, pc_rec2], "win-64", duplicate_files="skip")
@@ -137,7 +149,7 @@ def test_check_duplicates_files_accounts_for_pkgs_cache_path(mocker):
         paths=["lib/x.py"],  # 8 chars, final linked path in base env
     )
 
-    mock_read_paths = mocker.patch("constructor.fcp.read_paths_json")
+    mock_read_paths = mocker.patch("constructor.package_index.read_paths_json")
     mock_read_paths.return_value = MockPathsJson(pc_rec._paths)
 
     result = check_duplicates_files([pc_rec], "win-64", duplicate_files="skip")
@@ -159,7 +171,7 @@ def test_check_duplicates_files_long_env_name_beats_pkgs_path(mocker):
         paths=["lib/x.py"],  # 8 chars
     )
 
-    mock_read_paths = mocker.patch("constructor.fcp.read_paths_json")
+    mock_read_paths = mocker.patch("constructor.package_index.read_paths_json")
     mock_read_paths.return_value = MockPathsJson(pc_rec._paths)
 
     env_prefixes = {pc_rec: "envs/a-very-long-environment-name/"}  # 34 chars
@@ -175,7 +187,7 @@ def test_check_duplicates_files_long_env_name_beats_pkgs_path(mocker):
 
 def test_check_duplicates_files_empty_packages(mocker):
     """Verify returns 0 when no packages provided."""
-    mock_read_paths = mocker.patch("constructor.fcp.read_paths_json")
+    mock_read_paths = mocker.patch("constructor.package_index.read_paths_json")
 
     result = check_duplicates_files([], "win-64", duplicate_files="skip")
 
@@ -202,7 +214,7 @@ def test_check_duplicates_files_with_env_prefixes(mocker):
             return MockPathsJson(pc_rec_base._paths)
         return MockPathsJson(pc_rec_env._paths)
 
-    mock_read_paths = mocker.patch("constructor.fcp.read_paths_json")
+    mock_read_paths = mocker.patch("constructor.package_index.read_paths_json")
     mock_read_paths.side_effect = read_paths_side_effect
 
     env_prefixes = {pc_rec_env: "envs/myenv/"}
@@ -227,7 +239,7 @@ def test_check_duplicates_files_env_prefix_normalizes_trailing_slash(mocker):
         paths=["lib/file.py"],  # 11 chars
     )
 
-    mock_read_paths = mocker.patch("constructor.fcp.read_paths_json")
+    mock_read_paths = mocker.patch("constructor.package_index.read_paths_json")
     mock_read_paths.return_value = MockPathsJson(pc_rec._paths)
 
     # Missing trailing slash should be normalized (not raise error)
@@ -238,3 +250,153 @@ def test_check_duplicates_files_env_prefix_normalizes_trailing_slash(mocker):
 
     # "envs/myenv/" (11) + "lib/file.py" (11) = 22
     assert result[2] == 22
+
+
+def test_noarch_store_roundtrip(tmp_path):
+    prec = PackageRecord(
+        name="pkg",
+        version="1.0",
+        build="py_0",
+        build_number=0,
+        subdir="noarch",
+        fn="pkg-1.0-py_0.conda",
+        md5="0123456789abcdef0123456789abcdef",
+    )
+    arch_prec = PackageRecord(
+        name="other",
+        version="1.0",
+        build="0",
+        build_number=0,
+        subdir="linux-64",
+        fn="other-1.0-0.conda",
+        md5="fedcba9876543210fedcba9876543210",
+    )
+    store = tmp_path / "noarch"
+    linux = tmp_path / "linux-64"
+    osx = tmp_path / "osx-arm64"
+    for cache in (linux, osx):
+        cache.mkdir()
+    for fn in (prec.fn, arch_prec.fn):
+        (linux / fn).write_text(fn)
+        extracted = linux / fn[: -len(".conda")] / "info"
+        extracted.mkdir(parents=True)
+        (extracted / "index.json").write_text("{}")
+
+    _add_to_noarch_store(str(linux), [prec, arch_prec], str(store))
+    entry = tmp_path / _noarch_store_entry(str(store), prec)
+    assert (entry / prec.fn).is_file()
+    assert (entry / "pkg-1.0-py_0" / "info" / "index.json").is_file()
+    assert not (store / arch_prec.md5).exists()
+
+    assert _link_from_noarch_store(str(osx), [prec, arch_prec], str(store)) == 2
+    assert (osx / prec.fn).read_text() == prec.fn
+    assert (osx / "pkg-1.0-py_0" / "info" / "index.json").is_file()
+    assert not (osx / arch_prec.fn).exists()
+    # Nothing left to link the second time around
+    assert _link_from_noarch_store(str(osx), [prec], str(store)) == 0
+
+
+def test_noarch_store_is_per_channel(tmp_path):
+    precs = [
+        PackageRecord(
+            name="pkg",
+            version="1.0",
+            build="py_0",
+            build_number=0,
+            subdir="noarch",
+            fn="pkg-1.0-py_0.conda",
+            md5="0123456789abcdef0123456789abcdef",
+            url=f"https://{channel}.test/channel/noarch/pkg-1.0-py_0.conda",
+        )
+        for channel in ("a", "b")
+    ]
+    store = str(tmp_path / "noarch")
+    assert _noarch_store_entry(store, precs[0]) != _noarch_store_entry(store, precs[1])
+
+    cache_a = tmp_path / "a"
+    record = cache_a / "pkg-1.0-py_0" / "info" / "repodata_record.json"
+    record.parent.mkdir(parents=True)
+    record.write_text(precs[0].url)
+    _add_to_noarch_store(str(cache_a), [precs[0]], store)
+
+    cache_b = tmp_path / "b"
+    cache_b.mkdir()
+    assert _link_from_noarch_store(str(cache_b), [precs[1]], store) == 0
+    assert _link_from_noarch_store(str(cache_b), [precs[0]], store) == 1
+
+
+@pytest.mark.parametrize("fallback", (None, "classic"))
+def test_solve_precs_solver_fallback(mocker, fallback):
+    record = GenericObject("pkg")
+    solve = mocker.patch(
+        "constructor.fcp._solve", side_effect=[RuntimeError("solver crashed"), [record]]
+    )
+    kwargs = dict(
+        channel_urls=("https://example.com/channel",),
+        specs=("pkg",),
+        verbose=False,
+        extra_env=True,
+        solver="libmamba",
+        solver_fallback=fallback,
+    )
+    if fallback is None:
+        with pytest.raises(RuntimeError):
+            _solve_precs("env", "1.0", "/tmp/pkgs", "linux-64", **kwargs)
+        assert solve.call_count == 1
+    else:
+        assert _solve_precs("env", "1.0", "/tmp/pkgs", "linux-64", **kwargs) == [record]
+        assert [call.kwargs["solver"] for call in solve.call_args_list] == ["libmamba", "classic"]
+
+
+def test_prec_from_url():
+    url = "https://repo.test/main/noarch/pkg-name-1.0-py_0.tar.bz2"
+    prec = _prec_from_url(url, "sha256:" + "a" * 64)
+    assert (prec.name, prec.version, prec.build) == ("pkg-name", "1.0", "py_0")
+    assert prec.subdir == "noarch"
+    assert prec.fn == "pkg-name-1.0-py_0.tar.bz2"
+    assert prec.url == url
+    assert prec.sha256 == "a" * 64
+    assert _prec_from_url(url, "0" * 32).md5 == "0" * 32
+
+
+def test_find_out_of_date_precs(mocker):
+    repodata = {
+        "https://repo.test/linux-64": {
+            "packages.conda": {
+                "a-1.0-0.conda": {"name": "a", "version": "1.0", "build_number": 0},
+                "a-1.0-1.conda": {"name": "a", "version": "1.0", "build_number": 1},
+                "b-2.0-0.conda": {"name": "b", "version": "2.0", "build_number": 0},
+            },
+        },
+        "https://repo.test/noarch": {
+            "packages": {"a-1.1-0.tar.bz2": {"name": "a", "version": "1.1", "build_number": 0}},
+        },
+    }
+    session = mocker.Mock()
+    session.get_repodata.side_effect = repodata.__getitem__
+    precs = [
+        PackageRecord(name="a", version="1.0", build="0", build_number=0),
+        PackageRecord(name="b", version="2.0", build="0", build_number=0),
+    ]
+    assert _find_out_of_date_precs(precs, list(repodata), session) == {
+        "a": "https://repo.test/noarch/a-1.1-0.tar.bz2"
+    }
+    assert session.get_repodata.call_count == 2
+
+
+def test_solve_mirror_failover(mocker):
+    mirrors = {"https://a.test/c": ["https://b.test/c", "https://a.test/c"]}
+    record = GenericObject("pkg")
+    solve = mocker.patch(
+        "constructor.fcp._solve_once", side_effect=[RuntimeError("bad repodata"), [record]]
+    )
+    urls = ["https://b.test/c/linux-64", "https://b.test/c/noarch"]
+    assert _solve("env", urls, "linux-64", ("pkg",), mirrors=mirrors) == [record]
+    assert solve.call_args_list[1].args[1] == [
+        "https://a.test/c/linux-64",
+        "https://a.test/c/noarch",
+    ]
+
+    solve.side_effect = RuntimeError("bad repodata")
+    with pytest.raises(RuntimeError):
+        _solve("env", urls, "linux-64", ("pkg",))
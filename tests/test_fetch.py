@@ -0,0 +1,56 @@
+import pytest
+
+from constructor.fetch import main, read_explicit_lockfile
+
+LOCKFILE = """\
+# This file may be used to create an environment using:
+# $ conda create --name <env> --file <this file>
+# platform: linux-64
+@EXPLICIT
+https://repo.test/main/linux-64/a-1.0-0.conda#0123456789abcdef0123456789abcdef
+https://repo.test/main/noarch/b-2.0-py_0.tar.bz2
+"""
+
+
+def test_read_explicit_lockfile(tmp_path):
+    lockfile = tmp_path / "lockfile.base.txt"
+    lockfile.write_text(LOCKFILE)
+    assert read_explicit_lockfile(str(lockfile)) == (
+        "linux-64",
+        [
+            (
+                "https://repo.test/main/linux-64/a-1.0-0.conda",
+                "0123456789abcdef0123456789abcdef",
+            ),
+            ("https://repo.test/main/noarch/b-2.0-py_0.tar.bz2", None),
+        ],
+    )
+
+    pkg_list = tmp_path / "pkg-list.base.txt"
+    pkg_list.write_text("# test 1.0, env=base\na-1.0-0.conda")
+    with pytest.raises(ValueError, match="pkg-list"):
+        read_explicit_lockfile(str(pkg_list))
+
+
+def test_fetch_lockfile(tmp_path, mocker):
+    lockfile = tmp_path / "lockfile.base.txt"
+    lockfile.write_text(LOCKFILE)
+    fetch_explicit = mocker.patch("constructor.fcp.fetch_explicit", return_value=["a-1.0-0.conda"])
+
+    main(["--cache-dir", str(tmp_path / "cache"), "--platform", "osx-arm64", str(lockfile)])
+
+    fetch_explicit.assert_called_once()
+    urls, download_dir = fetch_explicit.call_args.args
+    assert len(urls) == 2
+    # the platform in the lockfile wins
+    assert download_dir == str(tmp_path / "cache" / "linux-64")
+    assert fetch_explicit.call_args.kwargs["noarch_store_dir"] == str(tmp_path / "cache" / "noarch")
+
+
+def test_fetch_reports_failures(tmp_path, mocker):
+    lockfile = tmp_path / "lockfile.base.txt"
+    lockfile.write_text(LOCKFILE)
+    mocker.patch("constructor.fcp.fetch_explicit", side_effect=OSError("unreachable"))
+
+    with pytest.raises(SystemExit, match="1 of 1 targets"):
+        main(["--cache-dir", str(tmp_path / "cache"), str(lockfile)])
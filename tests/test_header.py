@@ -1,3 +1,5 @@
+import hashlib
+import re
 import subprocess
 import sys
 import tempfile
@@ -96,7 +98,8 @@ def test_osxpkg_scripts_shellcheck(arch, check_path_spaces, script):
 @pytest.mark.parametrize("enable_shortcuts", ["true"])
 @pytest.mark.parametrize("min_glibc_version", ["2.17"])
 @pytest.mark.parametrize("min_osx_version", ["10.13"])
-@pytest.mark.parametrize("conda_exe_payloads_and_size", [({"path": (0, 10, False)}, 10)])
+@pytest.mark.parametrize("internal_files", [False, True])
+@pytest.mark.parametrize("streaming", [False, True])
 def test_template_shellcheck(
     osx,
     arch,
@@ -114,7 +117,8 @@ def test_template_shellcheck(
     enable_shortcuts,
     min_glibc_version,
     min_osx_version,
-    conda_exe_payloads_and_size,
+    internal_files,
+    streaming,
 ):
     template = read_header_template()
     processed = render_template(
@@ -142,13 +146,24 @@ def test_template_shellcheck(
             "enable_shortcuts": enable_shortcuts,
             "min_glibc_version": min_glibc_version,
             "min_osx_version": min_osx_version,
-            "first_payload_size": "1024",
-            "second_payload_size": "512",
+            "boundary0": "65536",
+            "boundary1": "131072",
+            "boundary2": "196608",
+            "boundary3": "200000",
+            "conda_exe_size": "1024",
+            "payload_block_size": "65536",
             "constructor_version": __version__,
             "installer_name": "Example",
             "installer_version": "1.2.3",
             "installer_platform": "linux-64",
-            "installer_md5": "a0098a2c837f4cf50180cfc0a041b2af",
+            "sha256_bootstrapper": "0" * 64,
+            "sha256_internal": "1" * 64,
+            "index_offset": "200000",
+            "index_size": "1000",
+            "package_segments": [
+                {"start": "196608", "end": "262144", "sha256": "2" * 64},
+                {"start": "262144", "end": "300000", "sha256": "3" * 64},
+            ],
             "script_env_variables": {},  # TODO: Fill this in with actual value
             "default_prefix": "/opt/Example",
             "license": "Some text",
@@ -162,9 +177,13 @@ def test_template_shellcheck(
             "conclusion_text": "Something",
             "final_channels": "",
             "write_condarc": "",
-            "conda_exe_payloads": conda_exe_payloads_and_size[0],
-            "conda_exe_payloads_size": conda_exe_payloads_and_size[1],
+            "internal_files": internal_files,
             "conda_exe_name": "_conda",
+            "payload_extension": ".tar.zst",
+            "bootstrapper_codec": "xz",
+            "bootstrapper_extension": ".xz",
+            "streaming": streaming,
+            "sha256_stream": "4" * 64,
         },
     )
 
@@ -172,3 +191,33 @@ def test_template_shellcheck(
     print(*findings, sep="\n")
     assert findings == []
     assert returncode == 0
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires a POSIX shell")
+@pytest.mark.parametrize("conda_status", [0, 3])
+def test_extract_packages_status(tmp_path, conda_status):
+    "A failed extraction fails the job, even though the rest of the stream is drained."
+    template = read_header_template()
+    functions = "\n".join(
+        re.search(rf"^{name} \(\) {{\n.*?^}}\n", template, re.MULTILINE | re.DOTALL).group(0)
+        for name in ("hash_start", "hash_check", "extract_packages")
+    )
+    conda_exec = tmp_path / "conda"
+    conda_exec.write_text(f"#!/bin/sh\nhead -c 3 > /dev/null\nexit {conda_status}\n")
+    conda_exec.chmod(0o755)
+    script = f"""
+set -eu
+PREFIX="{tmp_path}"
+CONDA_EXEC="{conda_exec}"
+BATCH=1
+STRICT=1
+extract_range () {{
+    printf 'payload'
+}}
+{render_template(functions, osx=sys.platform == "darwin", streaming=False)}
+# errexit does not apply in the function when its status is tested
+extract_packages 0 0 7 "{hashlib.sha256(b"payload").hexdigest()}" || exit "$?"
+"""
+    result = subprocess.run(["sh", "-c", script], capture_output=True, text=True)
+    assert result.returncode == conda_status, result.stderr
+    assert "mismatch" not in result.stderr
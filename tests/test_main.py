@@ -51,3 +51,12 @@ def test_installer_type_flag_invalid_for_platform(tmp_path):
     with pytest.raises(SystemExit) as exc:
         main([str(tmp_path), "--installer-type", bad, "--dry-run"])
     assert "invalid installer type" in str(exc.value)
+
+
+@pytest.mark.parametrize("dirname", ["fetch", "inspect"])
+def test_directory_named_like_a_command(tmp_path, monkeypatch, capsys, dirname):
+    (tmp_path / dirname).mkdir()
+    (tmp_path / dirname / "construct.yaml").write_text(_CONSTRUCT)
+    monkeypatch.chdir(tmp_path)
+    main([dirname, "--render"])
+    assert "name: test_installer_type_flag" in capsys.readouterr().out
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from conda.models.records import PackageRecord
+
+from constructor.mirrors import (
+    apply_mirrors,
+    canonical_url,
+    get_with_failover,
+    next_mirror_url,
+    next_mirror_urls,
+    rank_mirrors,
+    resolve_mirrors,
+    switch_mirror,
+)
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    """Serve `/<mirror>/...` with a per-mirror behaviour: `fast`, `slow` or `broken`."""
+
+    def do_GET(self):
+        mirror = self.path.strip("/").split("/")[0]
+        if mirror == "broken":
+            self.send_error(404)
+            return
+        if mirror == "slow":
+            time.sleep(0.5)
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MirrorHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_rank_mirrors(server_url):
+    urls = [f"{server_url}/broken", f"{server_url}/slow", f"{server_url}/fast"]
+    assert rank_mirrors(urls) == [f"{server_url}/fast", f"{server_url}/slow", urls[0]]
+
+
+def test_resolve_and_apply_mirrors(server_url):
+    canonical = f"{server_url}/slow"
+    mirrored_channels = {canonical: [f"{server_url}/broken", f"{server_url}/fast"]}
+    mirrors = resolve_mirrors([canonical, f"{server_url}/other"], mirrored_channels)
+    assert mirrors == {
+        canonical: [f"{server_url}/fast", canonical, f"{server_url}/broken"],
+    }
+    assert apply_mirrors([f"{canonical}/", f"{server_url}/other"], mirrors) == [
+        f"{server_url}/fast",
+        f"{server_url}/other",
+    ]
+
+    pkg = "linux-64/pkg-1.0-0.conda"
+    assert canonical_url(f"{server_url}/fast/{pkg}", mirrors) == f"{canonical}/{pkg}"
+    assert canonical_url(f"{server_url}/other/{pkg}", mirrors) == f"{server_url}/other/{pkg}"
+    assert next_mirror_url(f"{server_url}/fast/{pkg}", mirrors) == f"{canonical}/{pkg}"
+    assert next_mirror_url(f"{server_url}/broken/{pkg}", mirrors) is None
+
+
+def test_mirrored_multichannel(mocker):
+    mocker.patch(
+        "constructor.mirrors.rank_mirrors",
+        side_effect=lambda urls, timeout: list(dict.fromkeys(urls))[::-1],
+    )
+    main = "https://repo.anaconda.com/pkgs/main"
+    mirrored_channels = {"defaults": [main, "https://mirror.test/pkgs/main"]}
+    mirrors = resolve_mirrors(["defaults", "conda-forge"], mirrored_channels)
+    assert mirrors == {main: ["https://mirror.test/pkgs/main", main]}
+
+    channels = apply_mirrors(["defaults", "conda-forge"], mirrors)
+    assert channels[0] == "https://mirror.test/pkgs/main"
+    assert "https://repo.anaconda.com/pkgs/r" in channels
+    assert main not in channels
+    assert channels[-1] == "conda-forge"
+    assert resolve_mirrors([main], mirrored_channels) == mirrors
+
+
+def test_get_with_failover():
+    mirrors = {"https://a.test/c": ["https://b.test/c", "https://a.test/c"]}
+    calls = []
+
+    def fetch(url):
+        calls.append(url)
+        if url.startswith("https://b.test"):
+            raise OSError("unreachable")
+        return url
+
+    assert get_with_failover(fetch, "https://b.test/c/noarch", mirrors) == "https://a.test/c/noarch"
+    assert calls == ["https://b.test/c/noarch", "https://a.test/c/noarch"]
+    with pytest.raises(OSError):
+        get_with_failover(fetch, "https://b.test/other/noarch", mirrors)
+
+
+def test_next_mirror_urls():
+    mirrors = {"https://a.test/c": ["https://b.test/c", "https://a.test/c"]}
+    urls = ["https://b.test/c/linux-64", "https://b.test/c/noarch", "https://other.test/d"]
+    assert next_mirror_urls(urls, mirrors) == [
+        "https://a.test/c/linux-64",
+        "https://a.test/c/noarch",
+        "https://other.test/d",
+    ]
+    assert next_mirror_urls(next_mirror_urls(urls, mirrors), mirrors) is None
+
+
+def test_switch_mirror():
+    mirrors = {"https://a.test/c": ["https://b.test/c", "https://a.test/c"]}
+    prec = PackageRecord(
+        name="pkg",
+        version="1.0",
+        build="0",
+        build_number=0,
+        subdir="noarch",
+        fn="pkg-1.0-0.conda",
+        url="https://b.test/c/noarch/pkg-1.0-0.conda",
+    )
+    switched = switch_mirror(prec, mirrors)
+    assert switched.url == "https://a.test/c/noarch/pkg-1.0-0.conda"
+    assert switched.channel.base_url == "https://a.test/c"
+    assert switch_mirror(switched, mirrors) is None
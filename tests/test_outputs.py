@@ -1,9 +1,13 @@
+import json
 from contextlib import nullcontext
 from pathlib import Path
 
 import pytest
+from conda.models.records import PackageRecord
 
-from constructor.build_outputs import dump_hash
+from constructor.build_outputs import dump_hash, dump_info, dump_lockfile
+from constructor.context import BuildContext
+from constructor.utils import ChannelRemap
 
 TEST_FILES = {
     "test.txt": {
@@ -47,3 +51,46 @@ def test_hash_dump(tmp_path, algorithm, context):
                 filehash, filename = content.strip().split()
                 assert filename == Path(file).name
                 assert filehash == TEST_FILES[filename][algo]
+
+
+def test_dump_info(tmp_path):
+    info = {
+        "_output_dir": str(tmp_path),
+        "channels": ["https://repo.test/main"],
+        "channels_remap": [{"src": "https://repo.test/main", "dest": "https://mirror.test/main"}],
+        "_dists": ["a-1.0-0.conda"],
+    }
+    ChannelRemap.from_info(info).final_channels(info["channels"])
+    BuildContext.from_info(info).all_dists
+    with open(dump_info(info)) as f:
+        dumped = json.load(f)
+    assert dumped["_channel_remap"] == [
+        {"src": "https://repo.test/main", "dest": "https://mirror.test/main"},
+        {"src": "http://repo.test/main", "dest": "https://mirror.test/main"},
+    ]
+    assert dumped["_context"] == {"all_dists": ["a-1.0-0.conda"]}
+
+
+def test_dump_lockfile_canonical_urls(tmp_path):
+    info = {
+        "name": "test",
+        "version": "1.0",
+        "_platform": "linux-64",
+        "_output_dir": str(tmp_path),
+        "_mirrors": {"https://a.test/c": ["https://b.test/c", "https://a.test/c"]},
+        "_records": [
+            PackageRecord(
+                name="pkg",
+                version="1.0",
+                build="0",
+                build_number=0,
+                subdir="noarch",
+                fn="pkg-1.0-0.conda",
+                url="https://b.test/c/noarch/pkg-1.0-0.conda",
+                md5="0" * 32,
+            )
+        ],
+    }
+    with open(dump_lockfile(info)) as f:
+        lines = f.read().splitlines()
+    assert lines[-1] == f"https://a.test/c/noarch/pkg-1.0-0.conda#{'0' * 32}"
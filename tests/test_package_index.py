@@ -0,0 +1,123 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+
+from constructor import package_index
+from constructor.fcp import check_duplicates_files
+from constructor.package_index import PackageIndex
+
+
+def make_package(pkgs_dir, name, paths):
+    extracted_dir = pkgs_dir / name
+    (extracted_dir / "info" / "licenses").mkdir(parents=True)
+    (extracted_dir / "info" / "index.json").write_text(json.dumps({"name": name}))
+    record = {"name": name, "url": f"https://repo.test/noarch/{name}.conda", "md5": "1" * 32}
+    (extracted_dir / "info" / "repodata_record.json").write_text(json.dumps(record))
+    (extracted_dir / "info" / "licenses" / "LICENSE").write_text("BSD")
+    paths_json = {
+        "paths_version": 1,
+        "paths": [
+            {"_path": path, "path_type": "hardlink", "sha256": "0" * 64, "size_in_bytes": size}
+            for path, size in paths.items()
+        ],
+    }
+    (extracted_dir / "info" / "paths.json").write_text(json.dumps(paths_json))
+    return str(extracted_dir)
+
+
+def test_package_index(tmp_path, mocker):
+    pkg_a = make_package(tmp_path, "a-1.0-0", {"lib/a.py": 3, "lib/shared.py": 5})
+    pkg_b = make_package(tmp_path, "b-1.0-0", {"lib/shared.py": 7})
+    db = str(tmp_path / "packages.sqlite")
+
+    with PackageIndex(db) as index:
+        assert index.files(pkg_a, "a-1.0-0.conda") == [("lib/a.py", 3), ("lib/shared.py", 5)]
+        assert index.license_files(pkg_b, "b-1.0-0.conda") == [
+            os.path.join(pkg_b, "info", "licenses", "LICENSE")
+        ]
+        assert index.packages_with_file("lib/shared.py") == ["a-1.0-0.conda", "b-1.0-0.conda"]
+        assert index.summary(pkg_a) == (8, len("lib/shared.py"))
+        record = index.record(pkg_b)
+        assert record["url"] == "https://repo.test/noarch/b-1.0-0.conda"
+        assert record["md5"] == "1" * 32
+
+    # A new build reads the contents from the database
+    scan = mocker.spy(package_index, "package_files")
+    with PackageIndex(db) as index:
+        assert index.files(pkg_a) == [("lib/a.py", 3), ("lib/shared.py", 5)]
+        assert scan.call_count == 0
+
+        # ... unless the package was extracted again
+        paths_json = os.path.join(pkg_a, "info", "paths.json")
+        with open(paths_json) as f:
+            data = json.load(f)
+        data["paths"] = data["paths"][:1]
+        with open(paths_json, "w") as f:
+            json.dump(data, f)
+        assert index.files(pkg_a) == [("lib/a.py", 3)]
+        assert scan.call_count == 1
+        assert index.packages_with_file("lib/shared.py") == ["b-1.0-0.conda"]
+
+
+class PackageCacheRecord(dict):
+    def __init__(self, fn, extracted_package_dir):
+        super().__init__(size=1)
+        self.fn = fn
+        self.extracted_package_dir = extracted_package_dir
+
+    __hash__ = object.__hash__
+
+
+def test_check_duplicates_files_summary(tmp_path):
+    pc_recs = [
+        PackageCacheRecord("a-1.0-0.conda", make_package(tmp_path, "a-1.0-0", {"lib/a.py": 3})),
+        PackageCacheRecord("b-1.0-0.conda", make_package(tmp_path, "b-1.0-0", {"bin/b": 4})),
+        PackageCacheRecord("c-1.0-0.conda", make_package(tmp_path, "c-1.0-0", {})),
+    ]
+    env_prefixes = {pc_recs[1]: "envs/a-very-long-environment-name/"}
+    expected = check_duplicates_files(
+        pc_recs, "linux-64", duplicate_files="warn", env_prefixes=dict(env_prefixes)
+    )
+    with PackageIndex(str(tmp_path / "packages.sqlite")) as index:
+        result = check_duplicates_files(
+            pc_recs, "linux-64", "skip", env_prefixes=dict(env_prefixes), package_index=index
+        )
+    assert result == expected
+
+
+def _index_packages(db, extracted_dirs, barrier, errors):
+    barrier.wait()
+    try:
+        with PackageIndex(db) as index:
+            for extracted_dir in extracted_dirs:
+                index.files(extracted_dir)
+    except Exception as exc:
+        errors.put(repr(exc))
+
+
+def test_package_index_concurrent(tmp_path):
+    extracted_dirs = [
+        make_package(tmp_path, f"p{i}-1.0-0", {f"lib/p{i}.py": i + 1}) for i in range(20)
+    ]
+    db = str(tmp_path / "packages.sqlite")
+    # Builds with an older constructor left a database with another schema
+    with sqlite3.connect(db) as conn:
+        conn.execute("CREATE TABLE packages (id INTEGER PRIMARY KEY)")
+        conn.execute("PRAGMA user_version = 0")
+    ctx = multiprocessing.get_context()
+    barrier = ctx.Barrier(4)
+    errors = ctx.Queue()
+    procs = [
+        ctx.Process(target=_index_packages, args=(db, extracted_dirs, barrier, errors))
+        for _ in range(4)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    assert errors.empty(), errors.get()
+    assert all(proc.exitcode == 0 for proc in procs)
+    with PackageIndex(db) as index:
+        assert index.files(extracted_dirs[3]) == [("lib/p3.py", 4)]
+        assert index._conn.execute("SELECT COUNT(*) FROM packages").fetchone()[0] == 20
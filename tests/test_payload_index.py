@@ -0,0 +1,137 @@
+import hashlib
+import json
+
+import pytest
+
+from constructor.payload_index import (
+    extract_package,
+    main,
+    read_index,
+    verify_segments,
+    write_index_sidecar,
+)
+
+
+def _info(tmp_path, installer_type="exe"):
+    download_dir = tmp_path / "pkgs"
+    download_dir.mkdir()
+    (download_dir / "a-1.0-0.conda").write_bytes(b"a" * 100)
+    installer = tmp_path / f"Example.{installer_type}"
+    installer.write_bytes(b"installer")
+    return {
+        "name": "Example",
+        "version": "1.0",
+        "_platform": "win-64",
+        "installer_type": installer_type,
+        "_dists": ["a-1.0-0.conda"],
+        "_urls": [("https://repo.test/win-64/a-1.0-0.conda", hashlib.md5(b"a" * 100).hexdigest())],
+        "_download_dir": str(download_dir),
+        "_outpath": str(installer),
+    }
+
+
+def _fake_shar(path, package):
+    "Write a minimal SH installer with one package segment and its payload index."
+    header = b"#!/bin/sh\n# PAYLOAD_INDEX: %20d %20d\n@@END_HEADER@@\n"
+    offset = len(header % (0, 0))
+    index = {
+        "index_version": 1,
+        "name": "Example",
+        "version": "1.0",
+        "platform": "linux-64",
+        "installer_type": "sh",
+        "segments": [
+            {
+                "name": "packages0",
+                "offset": offset,
+                "size": len(package),
+                "sha256": hashlib.sha256(package).hexdigest(),
+            }
+        ],
+        "packages": [
+            {
+                "filename": "a-1.0-0.conda",
+                "segment": "packages0",
+                "offset": offset,
+                "size": len(package),
+                "md5": hashlib.md5(package).hexdigest(),
+            }
+        ],
+    }
+    index = json.dumps(index).encode()
+    path.write_bytes(header % (offset + len(package), len(index)) + package + index)
+
+
+def test_sidecar(tmp_path):
+    info = _info(tmp_path)
+    outpath = write_index_sidecar(info)
+    assert outpath == info["_outpath"] + ".index.json"
+
+    index = read_index(info["_outpath"])
+    assert index["installer_type"] == "exe"
+    assert index["segments"] == [
+        {
+            "name": "installer",
+            "offset": 0,
+            "size": 9,
+            "sha256": hashlib.sha256(b"installer").hexdigest(),
+        }
+    ]
+    assert index["packages"] == [
+        {"filename": "a-1.0-0.conda", "size": 100, "md5": hashlib.md5(b"a" * 100).hexdigest()}
+    ]
+    assert verify_segments(info["_outpath"], index) == []
+    with pytest.raises(ValueError, match="does not record"):
+        extract_package(info["_outpath"], index, "a-1.0-0.conda", str(tmp_path / "out"))
+
+    (tmp_path / "Example.exe").write_bytes(b"tampered!")
+    assert verify_segments(info["_outpath"], index) == ["installer"]
+
+
+def test_sidecar_transmuted(tmp_path):
+    info = _info(tmp_path)
+    # Downloaded as .tar.bz2 and transmuted to the .conda shipped in the installer
+    info["_urls"] = [("https://repo.test/win-64/a-1.0-0.tar.bz2", "1" * 32)]
+    write_index_sidecar(info)
+    index = read_index(info["_outpath"])
+    assert index["packages"][0]["md5"] == hashlib.md5(b"a" * 100).hexdigest()
+
+
+def test_missing_index(tmp_path):
+    installer = tmp_path / "Example.pkg"
+    installer.write_bytes(b"installer")
+    with pytest.raises(ValueError, match="no embedded index"):
+        read_index(str(installer))
+
+
+def test_embedded_index(tmp_path, capsys):
+    installer = tmp_path / "Example.sh"
+    _fake_shar(installer, b"package bytes")
+
+    main([str(installer)])
+    out = capsys.readouterr().out
+    assert "Example 1.0 (linux-64, sh)" in out
+    assert "a-1.0-0.conda" in out
+
+    main(
+        [
+            "--verify",
+            "--extract",
+            "a-1.0-0.conda",
+            "--output-dir",
+            str(tmp_path / "out"),
+            str(installer),
+        ]
+    )
+    assert (tmp_path / "out" / "a-1.0-0.conda").read_bytes() == b"package bytes"
+
+    with pytest.raises(SystemExit, match="not in"):
+        main(["--extract", "b-1.0-0.conda", str(installer)])
+
+    data = installer.read_bytes().replace(b"package bytes", b"package BYTES")
+    installer.write_bytes(data)
+    with pytest.raises(SystemExit, match="SHA-256 mismatch of packages0"):
+        main(["--verify", str(installer)])
+    with pytest.raises(SystemExit, match="MD5 mismatch"):
+        main(["--extract", "a-1.0-0.conda", "--output-dir", str(tmp_path / "out2"), str(installer)])
+    assert not (tmp_path / "out2" / "a-1.0-0.conda").exists()
@@ -1,4 +1,6 @@
-from constructor.preconda import write_condarc
+import json
+
+from constructor.preconda import copy_extra_files, system_info, write_condarc, write_files
 
 
 def test_write_condarc_with_condarc_dict(tmp_path):
@@ -56,3 +58,41 @@ def test_write_condarc_write_condarc_without_channels(tmp_path):
 
     condarc_file = tmp_path / ".condarc"
     assert not condarc_file.exists()
+
+
+def test_write_files_from_shared_workspace(tmp_path):
+    """Test that write_files reuses a prepared workspace and only renders .installer.info."""
+    shared = tmp_path / "shared"
+    (shared / "pkgs").mkdir(parents=True)
+    (shared / "pkgs" / "urls.txt").write_text("https://example.com/pkg.conda\n")
+    info = {
+        "name": "test",
+        "version": "1.0",
+        "_platform": "linux-64",
+        "_preconda_dir": str(shared),
+    }
+    for installer_type in ("sh", "pkg"):
+        workspace = tmp_path / installer_type
+        info["installer_type"] = installer_type
+        write_files(info, str(workspace))
+        urls = workspace / "pkgs" / "urls.txt"
+        assert urls.read_text() == "https://example.com/pkg.conda\n"
+        assert urls.stat().st_ino == (shared / "pkgs" / "urls.txt").stat().st_ino
+        installer_info = json.loads((workspace / ".installer.info").read_text())
+        assert installer_info["type"] == installer_type
+
+    # Extra files replace shared files instead of writing through the hardlink
+    extra = tmp_path / "urls.txt"
+    extra.write_text("overwritten")
+    copy_extra_files([{str(extra): "pkgs/urls.txt"}], tmp_path / "sh")
+    assert (tmp_path / "sh" / "pkgs" / "urls.txt").read_text() == "overwritten"
+    assert (shared / "pkgs" / "urls.txt").read_text() == "https://example.com/pkg.conda\n"
+
+
+def test_system_info_reproducible(mocker):
+    """Test that reproducible builds do not record details of the build machine."""
+    mocker.patch("platform.version", return_value="#1 SMP build-host")
+    assert system_info()["platform_full"] == "#1 SMP build-host"
+    info = system_info(reproducible=True)
+    assert set(info) <= {"constructor", "conda", "python_version", "nsis"}
+    assert info["constructor"] == system_info()["constructor"]
@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import re
+import subprocess
+import sys
+import tarfile
+from shutil import which
+
+import pytest
+
+from constructor.shar import (
+    PAYLOAD_EXTENSIONS,
+    HashingWriter,
+    _write_stream,
+    compress_bootstrapper,
+    compress_payload,
+    fill_header,
+    get_header,
+    header_placeholder,
+    payload_compression,
+    read_header_template,
+    read_payload_offsets,
+    split_segments,
+)
+
+CODEC_TOOLS = {"none": "none", "bz2": "bzip2", "gzip": "gzip", "xz": "xz", "zstd": "zstd"}
+
+
+def _make_tarball(path):
+    with tarfile.open(path, "w") as t:
+        data = b"payload" * 1000
+        tarinfo = tarfile.TarInfo("extra/data.txt")
+        tarinfo.size = len(data)
+        t.addfile(tarinfo, io.BytesIO(data))
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, ("bz2", None, None)),
+        ("xz", ("xz", None, None)),
+        ({"codec": "zstd", "level": 10, "threads": 0}, ("zstd", 10, 0)),
+    ],
+)
+def test_payload_compression(value, expected):
+    assert payload_compression({"payload_compression": value}) == expected
+
+
+def test_payload_compression_unknown_codec():
+    with pytest.raises(SystemExit):
+        payload_compression({"payload_compression": "lz4"})
+
+
+@pytest.mark.parametrize("codec", ["none", "bz2", "gzip", "xz"])
+@pytest.mark.parametrize("threads", [None, 2])
+def test_compress_payload(tmp_path, codec, threads):
+    tarball = str(tmp_path / "postconda.tar")
+    _make_tarball(tarball)
+    compressed = compress_payload(tarball, codec, level=1, threads=threads, mtime=0)
+    assert compressed.endswith(PAYLOAD_EXTENSIONS[codec])
+    with tarfile.open(compressed, "r|*") as t:
+        assert [member.name for member in t] == ["extra/data.txt"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Unix only")
+@pytest.mark.parametrize("codec", ["none", "bz2", "gzip", "xz", "zstd"])
+def test_header_archive_codec(tmp_path, codec):
+    if codec == "zstd" and not which("zstd"):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            pytest.skip("requires zstandard or zstd")
+    tarball = str(tmp_path / "preconda.tar")
+    _make_tarball(tarball)
+    compressed = compress_payload(tarball, codec)
+    function = re.search(r"^archive_codec \(\) \{.*?^\}$", read_header_template(), re.M | re.S)
+    script = f'{function.group()}\narchive_codec "$1"\n'
+    out = subprocess.check_output(["sh", "-c", script, "sh", compressed], text=True)
+    assert out.strip() == CODEC_TOOLS[codec]
+
+
+def test_fill_header():
+    sha256_placeholder = header_placeholder("sha256_packages0")
+    size_placeholder = header_placeholder("boundary3")
+    header = f"sha256={sha256_placeholder}\nsize=$(( 1 + {size_placeholder} ))\n".encode()
+    out = io.BytesIO()
+    writer = HashingWriter(out, hashlib.sha256())
+    writer.write(b"payload")
+    filled = fill_header(header, sha256_packages0=writer.hasher.hexdigest(), boundary3=7)
+    assert len(filled) == len(header)
+    assert hashlib.sha256(b"payload").hexdigest().encode() in filled
+    assert b"$(( 1 +                    7 ))" in filled
+    assert out.getvalue() == b"payload"
+
+
+def test_read_payload_offsets(tmp_path):
+    header = "".join(f"boundary{i}=$(( {header_placeholder(f'boundary{i}')} ))\n" for i in range(4))
+    header = ("#!/bin/sh\n" + header + "@@END_HEADER@@\n").encode()
+    offsets = (len(header), len(header) + 5, len(header) + 5, len(header) + 8)
+    installer = tmp_path / "installer.sh"
+    installer.write_bytes(
+        fill_header(header, **{f"boundary{i}": offset for i, offset in enumerate(offsets)})
+        + b"condatar"
+    )
+    assert read_payload_offsets(installer) == offsets
+
+    installer.write_bytes(b"MZ" + header)
+    with pytest.raises(ValueError, match="not a SH installer"):
+        read_payload_offsets(installer)
+
+
+@pytest.mark.parametrize("codec", ["gzip", "xz"])
+def test_compress_bootstrapper(tmp_path, codec):
+    conda_exec = tmp_path / "conda.exe"
+    conda_exec.write_bytes(b"conda" * 10000)
+    compressed, used_codec = compress_bootstrapper(str(conda_exec), codec, str(tmp_path))
+    assert used_codec == codec
+    decompress = gzip.decompress if codec == "gzip" else lzma.decompress
+    with open(compressed, "rb") as f:
+        assert decompress(f.read()) == conda_exec.read_bytes()
+
+
+def test_compress_bootstrapper_fallback(tmp_path):
+    conda_exec = tmp_path / "conda.exe"
+    conda_exec.write_bytes(os.urandom(1000))
+    assert compress_bootstrapper(str(conda_exec), "xz", str(tmp_path)) == (str(conda_exec), "")
+
+
+def test_split_segments():
+    sizes = {"a": 10, "b": 50, "c": 20, "d": 30, "e": 5}
+    segments = split_segments(list(sizes), sizes, 2)
+    assert segments == [["a", "b"], ["c", "d", "e"]]
+    assert sorted(split_segments(list(sizes), sizes, 10)) == [[fn] for fn in sorted(sizes)]
+    assert split_segments([], {}, 4) == [[]]
+
+
+def test_write_stream(tmp_path):
+    download_dir = tmp_path / "pkgs"
+    download_dir.mkdir()
+    (download_dir / "a-1.0-0.conda").write_bytes(b"a" * 1000)
+    (download_dir / "b-1.0-0.tar.bz2").write_bytes(b"b" * 10)
+    conda_exec = tmp_path / "conda.exe"
+    conda_exec.write_bytes(b"conda")
+    fo = io.BytesIO()
+    fo.write(b"header")
+    values, segments, packages = _write_stream(
+        fo,
+        {"_download_dir": str(download_dir)},
+        [(str(conda_exec), "_conda")],
+        ["a-1.0-0.conda", "b-1.0-0.tar.bz2"],
+        None,
+        hashlib.sha256(),
+    )
+    data = fo.getvalue()
+    assert values == {"boundary0": 6}
+    assert segments == [
+        {
+            "name": "stream",
+            "offset": 6,
+            "size": len(data) - 6,
+            "sha256": hashlib.sha256(data[6:]).hexdigest(),
+        }
+    ]
+    with tarfile.open(fileobj=io.BytesIO(data[6:])) as t:
+        assert t.getnames() == ["_conda", "pkgs/a-1.0-0.conda", "pkgs/b-1.0-0.tar.bz2"]
+    for package in packages:
+        expected = (download_dir / package["filename"]).read_bytes()
+        assert data[package["offset"] : package["offset"] + package["size"]] == expected
+
+
+def test_get_header_default_prefix():
+    info = {
+        "name": "Example",
+        "version": "1.0",
+        "_platform": "linux-64",
+        "_has_conda": False,
+        "_enable_shortcuts": False,
+        "_conda_exe": "conda.exe",
+        "channels": [],
+    }
+    assert 'PREFIX="${HOME:-/opt}/example"\n' in get_header(info, package_segments=2)
+    info["default_prefix"] = "/opt/custom"
+    assert 'PREFIX="/opt/custom"\n' in get_header(info)
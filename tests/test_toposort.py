@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+from conda.models.prefix_graph import PrefixGraph
+from conda.models.records import PackageRecord
+
+from constructor.toposort import toposort_records
+
+
+def _record(name, depends=(), version="1.0"):
+    return PackageRecord(
+        name=name,
+        version=version,
+        build="0",
+        build_number=0,
+        subdir="linux-64",
+        fn=f"{name}-{version}-0.conda",
+        depends=list(depends),
+        channel="https://example.com/channel",
+    )
+
+
+RECORDS = (
+    _record("python", ["openssl", "pip"]),
+    _record("pip", ["python"]),
+    _record("openssl", ["ca-certificates"]),
+    _record("ca-certificates"),
+    _record("menuinst", ["python"]),
+    _record("numpy", ["python >=3", "libblas"]),
+    _record("libblas", ["libcblas"]),
+    _record("libcblas", ["libblas"]),  # cycle
+    _record("tzdata"),  # disconnected
+    _record("zlib"),
+    _record("libzip", ["zlib"]),
+    _record("old-libzip", ["zlib <1"]),  # unmatched dependency
+)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_toposort_matches_prefix_graph(seed):
+    records = list(RECORDS)
+    random.Random(seed).shuffle(records)
+    expected = list(dict.fromkeys(PrefixGraph(records).graph))
+    assert toposort_records(records) == expected
+
+
+def test_toposort_is_memoized():
+    assert toposort_records(RECORDS) == toposort_records(iter(RECORDS))
+
+
+def test_toposort_returns_own_records():
+    toposort_records(RECORDS)
+    mirrored = [
+        PackageRecord.from_objects(record, url=f"https://mirror.test/{record.fn}", md5="0" * 32)
+        for record in RECORDS
+    ]
+    result = toposort_records(mirrored)
+    assert result == toposort_records(RECORDS)
+    assert {id(record) for record in result} == {id(record) for record in mirrored}
+    assert all(record.url.startswith("https://mirror.test/") for record in result)
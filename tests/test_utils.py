@@ -1,11 +1,31 @@
+import errno
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import threading
+import time
 from os import sep
 
+import pytest
+
 from constructor.utils import (
+    ChannelRemap,
+    artifact_digests,
+    atomic_output,
     bat_echo_esc,
     bat_env_var_esc,
+    dumps_json,
+    file_lock,
     get_condarc_content,
+    get_final_channels,
+    get_final_url,
     make_VIProductVersion,
     normalize_path,
+    reproducible_tar_filter,
+    source_date_epoch,
 )
 
 
@@ -107,3 +127,193 @@ def test_get_condarc_content_returns_none():
     # write_condarc without channels should also return None
     info = {"write_condarc": True}
     assert get_condarc_content(info) is None
+
+
+def test_atomic_output(tmp_path):
+    target = tmp_path / "installer.sh"
+    target.write_text("old")
+    with atomic_output(str(target)) as tmp:
+        assert tmp.endswith(".sh")
+        with open(tmp, "w") as f:
+            f.write("new")
+        assert target.read_text() == "old"
+    assert target.read_text() == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["installer.sh"]
+
+    with pytest.raises(RuntimeError):
+        with atomic_output(str(target)) as tmp:
+            with open(tmp, "w") as f:
+                f.write("partial")
+            raise RuntimeError
+    assert target.read_text() == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["installer.sh"]
+
+
+def test_file_lock(tmp_path):
+    lock = str(tmp_path / "pkg.lock")
+    events = []
+
+    def worker():
+        with file_lock(lock):
+            events.append("worker")
+
+    with file_lock(lock):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join(timeout=0.5)
+        # flock locks are per open file description, so the thread has to wait too
+        assert thread.is_alive()
+        events.append("main")
+    thread.join()
+    assert events == ["main", "worker"]
+    # The lock file does not outlive the lock
+    assert not (tmp_path / "pkg.lock").exists()
+
+
+def test_file_lock_removed_while_waiting(tmp_path):
+    lock = str(tmp_path / "pkg.lock")
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with file_lock(lock):
+            acquired.set()
+            release.wait()
+            # Give the main thread time to open the file and wait on it
+            time.sleep(0.2)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    acquired.wait()
+    with open(lock, "rb") as waiting:
+        # A waiter that opened the file the holder removes must not lock it
+        release.set()
+        with file_lock(lock):
+            assert (tmp_path / "pkg.lock").exists()
+            assert (tmp_path / "pkg.lock").stat().st_ino != os.fstat(waiting.fileno()).st_ino
+    thread.join()
+
+
+@pytest.mark.parametrize("error", [errno.EDEADLK, errno.EBADF])
+def test_file_lock_windows(tmp_path, monkeypatch, mocker, error):
+    msvcrt = mocker.MagicMock(LK_LOCK=1, LK_UNLCK=0)
+    attempts = []
+
+    def locking(fd, mode, nbytes):
+        if mode == msvcrt.LK_LOCK:
+            attempts.append(mode)
+            if len(attempts) < 3:
+                raise OSError(error, "locking failed")
+
+    msvcrt.locking.side_effect = locking
+    monkeypatch.setitem(sys.modules, "msvcrt", msvcrt)
+    monkeypatch.setattr(sys, "platform", "win32")
+    lock = str(tmp_path / "pkg.lock")
+    if error == errno.EDEADLK:
+        # Lock contention: keep waiting until the lock is free
+        with file_lock(lock):
+            pass
+        assert len(attempts) == 3
+        # ... but not forever
+        attempts.clear()
+        with pytest.raises(TimeoutError):
+            with file_lock(lock, timeout=-1):
+                pass
+    else:
+        with pytest.raises(OSError) as exc_info:
+            with file_lock(lock):
+                pass
+        assert exc_info.value.errno == errno.EBADF
+        assert len(attempts) == 1
+
+
+def test_artifact_digests(tmp_path, mocker):
+    pkg = tmp_path / "pkg-1.0-0.conda"
+    pkg.write_bytes(b"payload")
+    expected = {
+        "size": 7,
+        "md5": hashlib.md5(b"payload").hexdigest(),
+        "sha256": hashlib.sha256(b"payload").hexdigest(),
+    }
+    assert artifact_digests(str(pkg)) == expected
+    assert (tmp_path / "pkg-1.0-0.conda.digests.json").is_file()
+
+    # Recorded digests are reused as long as the file does not change
+    md5 = mocker.spy(hashlib, "md5")
+    assert artifact_digests(str(pkg)) == expected
+    assert md5.call_count == 0
+
+    pkg.write_bytes(b"new payload")
+    assert artifact_digests(str(pkg))["md5"] == hashlib.md5(b"new payload").hexdigest()
+
+
+@pytest.mark.parametrize("sort_keys", (True, False))
+def test_dumps_json(sort_keys):
+    data = {"b": [1, 2], "a": {"é": "ü"}}
+    compact = dumps_json(data, compact=True, sort_keys=sort_keys)
+    assert json.loads(compact) == data
+    assert " " not in compact and "\n" not in compact
+    assert compact.startswith('{"a"' if sort_keys else '{"b"')
+    assert dumps_json(data, sort_keys=sort_keys) == json.dumps(data, indent=2, sort_keys=sort_keys)
+
+
+def test_channel_remap(caplog):
+    info = {
+        "channels": ["https://private.test/main", "file:///local/channel"],
+        "channels_remap": [
+            {"src": "https://private.test/main", "dest": "https://public.test/main"},
+            {"src": "file:///local", "dest": "https://public.test/local"},
+        ],
+    }
+    pkg = "linux-64/pkg-1.0-0.tar.bz2"
+    assert (
+        get_final_url(info, f"http://private.test/main/{pkg}") == f"https://public.test/main/{pkg}"
+    )
+    assert get_final_url(info, "https://private.test/main") == "https://public.test/main"
+    assert get_final_url(info, "https://other.test/main") == "https://other.test/main/"
+    assert get_final_channels(info) == [
+        "https://public.test/main",
+        "https://public.test/local/channel",
+    ]
+    assert isinstance(info["_channel_remap"], ChannelRemap)
+
+    # Each URL is rewritten and warned about once
+    caplog.clear()
+    remap = ChannelRemap(info["channels_remap"])
+    assert (
+        remap.final_urls([f"https://private.test/main/{pkg}"] * 3)
+        == [f"https://public.test/main/{pkg}"] * 3
+    )
+    assert len(caplog.records) == 1
+
+    remap = ChannelRemap()
+    assert remap.final_channels(["file:///local/channel"] * 2) == []
+    assert len(caplog.records) == 2
+
+
+def test_source_date_epoch(monkeypatch):
+    monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+    assert source_date_epoch() is None
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    assert source_date_epoch() == 1700000000
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "yesterday")
+    with pytest.raises(SystemExit):
+        source_date_epoch()
+
+
+def test_reproducible_tar_filter(tmp_path):
+    def make_archive(path):
+        fileobj = io.BytesIO()
+        with tarfile.open(fileobj=fileobj, mode="w") as tar:
+            tar.add(path, "hello.txt", filter=reproducible_tar_filter(1700000000))
+        return fileobj.getvalue()
+
+    assert reproducible_tar_filter(None) is None
+    path = tmp_path / "hello.txt"
+    path.write_text("hello")
+    first = make_archive(path)
+    path.write_text("hello")  # new mtime, same contents
+    assert make_archive(path) == first
+    with tarfile.open(fileobj=io.BytesIO(first)) as tar:
+        member = tar.getmember("hello.txt")
+    assert (member.mtime, member.uid, member.uname) == (1700000000, 0, "")